@@ -10,14 +10,16 @@ class Lexer:
         self.current_line = 1
         self.current_column = 0
         self.tokens = []
+        self.token_positions = []  # (offset, line, column) of each token
         self.symbol_table = {}
+        self.hooks = []
         self.advance()
 
         # Define the sets of language components
         self.keywords = [
             'LET', 'IF', 'THEN', 'ELSE', 'ENDIF', 'WHILE', 'DO', 'ENDWHILE',
             'FOR', 'TO', 'STEP', 'ENDFOR', 'FUNC', 'BEGIN', 'RETURN', 'END',
-            'CALL', 'IN', 'RANGE', 'REPEAT', 'UNTIL'
+            'CALL', 'IN', 'RANGE', 'REPEAT', 'UNTIL', 'PARALLEL'
         ]
 
         self.logical_operators = ['AND', 'OR', 'NOT']
@@ -59,41 +61,60 @@ class Lexer:
                 self.advance()
         self.error("Unclosed comment")
 
+    def add_hook(self, hook):
+        """Register hook(event, phase, **counts), called at the start and end of each phase"""
+        self.hooks.append(hook)
+
+    def notify(self, event, phase, **counts):
+        for hook in self.hooks:
+            hook(event, phase, **counts)
+
     def error(self, message):
         raise Exception(f'Lexing error at line {self.current_line}, column {
                         self.current_column}: {message}')
 
     def tokenize(self):
+        if self.hooks:
+            self.notify('start', 'lex')
+        for token, position in self.stream_tokens():
+            self.add_token(token, position)
+        if self.hooks:
+            self.notify('end', 'lex', tokens=len(self.tokens),
+                        lines=self.current_line)
+        return self.tokens
+
+    def stream_tokens(self):
+        """Yield (token, (offset, line, column)) pairs as the source is scanned, without keeping them"""
         while self.current_char is not None:
+            start = (self.position, self.current_line, self.current_column)
             if self.current_char.isspace():
                 self.skip_whitespace()
             elif self.current_char == '{':
                 self.skip_comment()
             elif self.current_char.isalpha() or self.current_char == '_':
-                token = self.identify_keyword_or_identifier()
-                self.tokens.append(token)
+                yield self.identify_keyword_or_identifier(), start
             elif self.current_char.isdigit():
-                token = self.number()
-                self.tokens.append(token)
+                yield self.number(), start
             elif self.current_char in self.arithmetic_operators:
-                token = self.arithmetic_operator()
-                self.tokens.append(token)
+                yield self.arithmetic_operator(), start
             elif self.current_char in ['!', '=', '>', '<']:
-                token = self.relational_operator()
-                self.tokens.append(token)
+                yield self.relational_operator(), start
             elif self.current_char == ',':
-                self.tokens.append(('comma', ','))
                 self.advance()
+                yield ('comma', ','), start
             elif self.current_char == ':':
-                self.tokens.append(('colon', ':'))
                 self.advance()
+                yield ('colon', ':'), start
             elif self.current_char in self.delimiters:
                 token = self.delimiter()
-                self.tokens.append(token)
                 self.advance()
+                yield token, start
             else:
                 self.error(f"Unexpected character '{self.current_char}'")
-        return self.tokens
+
+    def add_token(self, token, position):
+        self.tokens.append(token)
+        self.token_positions.append(position)
 
     def identify_keyword_or_identifier(self):
         result = ''
@@ -181,10 +202,12 @@ class Lexer:
                 'name': identifier, 'type': 'unknown'}
 
     def update_symbol_table_types(self):
+        if self.hooks:
+            self.notify('start', 'symbols')
         index = 0
         while index < len(self.tokens):
             token, lexeme = self.tokens[index]
-            if token == 'let':
+            if token == 'let' or token == 'for':
                 next_token, next_lexeme = self.tokens[index + 1]
                 if next_token == 'identifier':
                     self.symbol_table[next_lexeme]['type'] = 'integer'
@@ -220,6 +243,8 @@ class Lexer:
                             arg_index += 1
                         self.symbol_table[function_name]['parameters'] = args
             index += 1
+        if self.hooks:
+            self.notify('end', 'symbols', symbols=len(self.symbol_table))
 
     def print_tokens(self):
         print("Tokens:")
@@ -1,82 +1,148 @@
-from typing import List, Optional
+import argparse
+import os
+from contextlib import nullcontext
+from typing import Iterator, List, Optional
 import Compiler_Project_phase1 as lexer
 from ast_nodes import (
-    Node, Program, LetStatement, BinaryOperation,
-    Number, Identifier, IfStatement, CallStatement
+    Node, Program, LetStatement, IfStatement, CallStatement,
+    WhileStatement, FunctionDefinition, ReturnStatement, ForStatement,
+    ListLiteral, IndexExpression, IndexAssignment, NodeFactory, literal_value
 )
+from instrumentation import CompileStats, count_nodes
+from hashcons import HashConsFactory
+from semantics import analyze
+from optimize import DEFAULT_INLINE_BUDGET, eliminate_dead_functions, fold_constants, inline_functions
+from interpreter import DEFAULT_CACHE_SIZE, ExecutionBudget, Interpreter, compile_for_execution
+from cost import admission_error, estimate_cost
+from profiler import ExecutionProfiler
+from parse_tree import concrete_tree
+from xref import DEFAULT_INDEX_FILE, CrossReferenceIndex, source_digest
 
 
 class Parser:
-    def __init__(self, tokens):
+    def __init__(self, tokens, positions=None, factory=None):
         self.tokens = tokens
+        self.positions = positions  # Lexer.token_positions, for statement line numbers
+        self.factory = factory or NodeFactory()  # builds expression nodes, e.g. HashConsFactory
         self.current = 0
+        self.hooks = []
+
+    def add_hook(self, hook):
+        """Register hook(event, phase, **counts), called at the start and end of parsing"""
+        self.hooks.append(hook)
+
+    def notify(self, event, phase, **counts):
+        for hook in self.hooks:
+            hook(event, phase, **counts)
 
     def parse(self) -> Program:
         """Parse the program and return AST"""
-        statements = []
-
+        if self.hooks:
+            self.notify('start', 'parse')
+        program = self.parse_program()
+        if self.hooks:
+            self.notify('end', 'parse', nodes=count_nodes(program))
+        return program
+
+    def parse_program(self) -> Program:
+        """Parse BEGIN statements END"""
+        return Program(list(self.iter_program()))
+
+    def iter_program(self) -> Iterator[Node]:
+        """Parse BEGIN statements END, yielding each top-level statement as soon as it is complete"""
         # Skip any initial whitespace tokens
-        while self.current < len(self.tokens) and self.tokens[self.current][0] == 'whitespace':
+        while self.has_token(self.current) and self.tokens[self.current][0] == 'whitespace':
             self.current += 1
 
         # Expect BEGIN
         if not self.match('begin'):
             self.error("Expected 'BEGIN' at start of program")
 
+        while not self.is_at_end() and not self.check('end'):
+            yield self.parse_statement()
+
+        # Expect END
+        if not self.match('end'):
+            self.error("Expected 'END' at end of program")
+
+    def parse_statement_list(self) -> List[Node]:
+        """Parse statements up to END or the end of the tokens"""
+        statements = []
         while not self.is_at_end() and not self.check('end'):
             # Skip whitespace between statements
-            while self.current < len(self.tokens) and self.tokens[self.current][0] == 'whitespace':
+            while self.has_token(self.current) and self.tokens[self.current][0] == 'whitespace':
                 self.current += 1
 
             stmt = self.parse_statement()
             if stmt:
                 statements.append(stmt)
-
-        # Expect END
-        if not self.match('end'):
-            self.error("Expected 'END' at end of program")
-
-        return Program(statements)
+        return statements
 
     def parse_statement(self) -> Optional[Node]:
         """Parse a single statement"""
         # Skip whitespace before statement
-        while self.current < len(self.tokens) and self.tokens[self.current][0] == 'whitespace':
+        while self.has_token(self.current) and self.tokens[self.current][0] == 'whitespace':
             self.current += 1
 
+        start = self.current
         if self.match('let'):
-            return self.parse_let_statement()
+            stmt = self.parse_let_statement()
         elif self.match('if'):
-            return self.parse_if_statement()
+            stmt = self.parse_if_statement()
         elif self.match('call'):
-            return self.parse_call_statement()
-        # Add other statement types as needed
-        return None
-
-    def parse_let_statement(self) -> LetStatement:
-        """Parse a let statement"""
+            stmt = self.parse_call_statement()
+        elif self.match('while'):
+            stmt = self.parse_while_statement()
+        elif self.match('for'):
+            stmt = self.parse_for_statement()
+        elif self.match('parallel'):
+            if not self.match('for'):
+                self.error("Expected 'FOR' after 'PARALLEL'")
+            stmt = self.parse_for_statement(parallel=True)
+        elif self.check('identifier') and self.check_next('compound_operator'):
+            stmt = self.parse_compound_assignment()
+        elif self.match('func'):
+            stmt = self.parse_function_definition()
+        elif self.match('return'):
+            stmt = self.parse_return_statement()
+        else:
+            # Add other statement types as needed
+            self.error("Expected a statement")
+        stmt.line = self.line_at(start)
+        stmt.token = start
+        return stmt
+
+    def parse_let_statement(self) -> Node:
+        """Parse a let statement or an element assignment (LET a[i] = ...)"""
         if not self.check('identifier'):
             self.error("Expected identifier after 'LET'")
         identifier = self.advance()[1]  # Get the lexeme
 
+        indices = []
+        while self.match('left_bracket'):
+            indices.append(self.parse_expression())
+            if not self.match('right_bracket'):
+                self.error("Expected ']' after index")
+
         if not self.match('equal'):
             self.error("Expected '=' after identifier in LET statement")
 
         expr = self.parse_expression()
-        return LetStatement(identifier, expr)
+        if not indices:
+            return LetStatement(identifier, expr)
+        target = self.factory.identifier(identifier)
+        for index in indices[:-1]:
+            target = IndexExpression(target, index)
+        return IndexAssignment(target, indices[-1], expr)
 
     def parse_if_statement(self) -> IfStatement:
         """Parse an if statement"""
         condition = self.parse_condition()
 
         # Skip whitespace before THEN
-        while self.current < len(self.tokens) and self.tokens[self.current][0] == 'whitespace':
+        while self.has_token(self.current) and self.tokens[self.current][0] == 'whitespace':
             self.current += 1
 
-        # Debug print
-        print(f"Current token after condition: {
-              self.tokens[self.current] if not self.is_at_end() else 'END'}")
-
         if not self.match('then'):
             self.error("Expected 'THEN' after condition in IF statement")
 
@@ -98,6 +164,120 @@ class Parser:
 
         return IfStatement(condition, then_statements, else_statements if else_statements else None)
 
+    def parse_while_statement(self) -> WhileStatement:
+        """Parse a while loop"""
+        condition = self.parse_condition()
+
+        if not self.match('do'):
+            self.error("Expected 'DO' after condition in WHILE statement")
+
+        body = []
+        while not self.check('endwhile') and not self.is_at_end():
+            stmt = self.parse_statement()
+            if stmt:
+                body.append(stmt)
+
+        if not self.match('endwhile'):
+            self.error("Expected 'ENDWHILE' at end of WHILE statement")
+
+        return WhileStatement(condition, body)
+
+    def parse_compound_assignment(self) -> LetStatement:
+        """Parse v += e, v -= e, v *= e, v /= e, v++ or v-- as LET v = v op e"""
+        name = self.advance()[1]
+        operator = self.advance()[1]
+        if operator in ('++', '--'):
+            expr = self.factory.number(1)
+        else:
+            expr = self.parse_expression()
+        target = self.factory.identifier(name)
+        return LetStatement(name, self.factory.binary(target, operator[0], expr))
+
+    def parse_for_statement(self, parallel: bool = False) -> ForStatement:
+        """Parse FOR v = a TO b [STEP c] DO ... ENDFOR or FOR v IN RANGE(...) DO ... ENDFOR"""
+        if not self.check('identifier'):
+            self.error("Expected loop variable after 'FOR'")
+        variable = self.advance()[1]
+
+        if self.match('equal'):
+            inclusive = True
+            start = self.parse_expression()
+            if not self.match('to'):
+                self.error("Expected 'TO' in FOR statement")
+            end = self.parse_expression()
+            step = self.parse_expression() if self.match('step') else None
+        elif self.match('in'):
+            inclusive = False
+            if not self.match('range') or not self.match('left_paren'):
+                self.error("Expected 'RANGE(' after 'IN' in FOR statement")
+            bounds = [self.parse_expression()]
+            while self.match('comma'):
+                bounds.append(self.parse_expression())
+            if not self.match('right_paren'):
+                self.error("Expected ')' after RANGE arguments")
+            if len(bounds) > 3:
+                self.error("RANGE takes at most 3 arguments")
+            if len(bounds) == 1:
+                bounds.insert(0, self.factory.number(0))
+            start, end = bounds[0], bounds[1]
+            step = bounds[2] if len(bounds) == 3 else None
+        else:
+            self.error("Expected '=' or 'IN' after loop variable in FOR statement")
+
+        if not self.match('do'):
+            self.error("Expected 'DO' in FOR statement")
+
+        body = []
+        while not self.check('endfor') and not self.is_at_end():
+            stmt = self.parse_statement()
+            if stmt:
+                body.append(stmt)
+
+        if not self.match('endfor'):
+            self.error("Expected 'ENDFOR' at end of FOR statement")
+
+        return ForStatement(variable, start, end, step, body, inclusive, parallel)
+
+    def parse_function_definition(self) -> FunctionDefinition:
+        """Parse a function definition"""
+        if not self.check('identifier'):
+            self.error("Expected function name after 'FUNC'")
+        name = self.advance()[1]  # Get the lexeme
+
+        if not self.match('left_paren'):
+            self.error("Expected '(' after function name in FUNC definition")
+
+        parameters = []
+        if not self.check('right_paren'):
+            while True:
+                if not self.check('identifier'):
+                    self.error("Expected parameter name")
+                parameters.append(self.advance()[1])
+                if not self.match('comma'):
+                    break
+
+        if not self.match('right_paren'):
+            self.error("Expected ')' after parameters in FUNC definition")
+        if not self.match('begin'):
+            self.error("Expected 'BEGIN' to start function body")
+
+        body = []
+        while not self.check('end') and not self.is_at_end():
+            stmt = self.parse_statement()
+            if stmt:
+                body.append(stmt)
+
+        if not self.match('end'):
+            self.error("Expected 'END' at end of function body")
+
+        return FunctionDefinition(name, parameters, body)
+
+    def parse_return_statement(self) -> ReturnStatement:
+        """Parse a return statement"""
+        if self.check('end') or self.is_at_end():
+            return ReturnStatement()
+        return ReturnStatement(self.parse_expression())
+
     def parse_call_statement(self) -> CallStatement:
         """Parse a function call"""
         if not self.check('identifier'):
@@ -129,7 +309,7 @@ class Parser:
                 self.current -= 1  # Put back the operator token
                 break
             right = self.parse_term()
-            left = BinaryOperation(left, operator, right)
+            left = self.factory.binary(left, operator, right)
 
         return left
 
@@ -143,22 +323,47 @@ class Parser:
                 self.current -= 1  # Put back the operator token
                 break
             right = self.parse_factor()
-            left = BinaryOperation(left, operator, right)
+            left = self.factory.binary(left, operator, right)
 
         return left
 
     def parse_factor(self) -> Node:
-        """Parse a factor"""
+        """Parse a factor, with any [index] suffixes"""
+        expr = self.parse_primary()
+        while self.match('left_bracket'):
+            index = self.parse_expression()
+            if not self.match('right_bracket'):
+                self.error("Expected ']' after index")
+            expr = IndexExpression(expr, index)
+        return expr
+
+    def parse_primary(self) -> Node:
+        """Parse a number, identifier, CALL, list literal or parenthesized expression"""
         if self.match('number'):
-            return Number(self.previous()[1])
+            return self.factory.number(literal_value(self.previous()[1]))
         elif self.match('identifier'):
-            return Identifier(self.previous()[1])
+            return self.factory.identifier(self.previous()[1])
+        elif self.match('call'):
+            start = self.current - 1
+            call = self.parse_call_statement()
+            call.line = self.line_at(start)
+            return call
         elif self.match('left_paren'):
             expr = self.parse_expression()
             if not self.match('right_paren'):
                 self.error("Expected ')' after expression")
             return expr
-        self.error("Expected number, identifier, or '('")
+        elif self.match('left_bracket'):
+            elements = []
+            if not self.check('right_bracket'):
+                while True:
+                    elements.append(self.parse_expression())
+                    if not self.match('comma'):
+                        break
+            if not self.match('right_bracket'):
+                self.error("Expected ']' after list elements")
+            return ListLiteral(elements)
+        self.error("Expected number, identifier, CALL, '[' or '('")
 
     def parse_condition(self) -> Node:
         """Parse a condition"""
@@ -167,11 +372,17 @@ class Parser:
         if self.match_any(['operator', 'equal', 'not_equal']):
             operator = self.previous()[1]
             right = self.parse_expression()
-            return BinaryOperation(left, operator, right)
+            return self.factory.binary(left, operator, right)
 
         return left
 
     # Helper methods
+    def line_at(self, index: int) -> int:
+        """Source line of the token at index, or 0 when positions are unknown"""
+        if self.positions is None or index >= len(self.positions):
+            return 0
+        return self.positions[index][1]
+
     def match(self, expected_type: str) -> bool:
         """Check if current token matches expected type"""
         if self.check(expected_type):
@@ -196,6 +407,12 @@ class Parser:
             return False
         return self.tokens[self.current][0] == expected_type
 
+    def check_next(self, expected_type: str) -> bool:
+        """Check the token after the current one without consuming"""
+        if not self.has_token(self.current + 1):
+            return False
+        return self.tokens[self.current + 1][0] == expected_type
+
     def advance(self) -> tuple:
         """Consume current token and return it"""
         if not self.is_at_end():
@@ -206,9 +423,13 @@ class Parser:
         """Get the previously consumed token"""
         return self.tokens[self.current - 1]
 
+    def has_token(self, index: int) -> bool:
+        """Whether there is a token at index"""
+        return index < len(self.tokens)
+
     def is_at_end(self) -> bool:
         """Check if we've reached end of tokens"""
-        return self.current >= len(self.tokens)
+        return not self.has_token(self.current)
 
     def error(self, message: str):
         """Handle parsing errors"""
@@ -218,9 +439,7 @@ class Parser:
                         self.tokens[self.current]}: {message}")
 
 
-def main():
-    # Test the parser with the same example from phase 1
-    source_code = """
+DEMO_SOURCE = """
     BEGIN
     LET a = 5
     LET b = 10
@@ -235,23 +454,201 @@ def main():
     END
     """
 
-    # First tokenize using the lexer from phase 1
-    lex = lexer.Lexer(source_code)
-    tokens = lex.tokenize()
 
+def print_tokens(tokens):
     # Debug print tokens
     print("Tokens:")
     for token in tokens:
         print(token)
 
-    # Then parse the tokens
-    parser = Parser(tokens)
-    try:
-        ast = parser.parse()
-        print("\nParse Tree:")
-        print(ast)
-    except Exception as e:
-        print(f"Error: {e}")
+
+def print_symbol_table(symbol_table):
+    print("\nSymbol Table:")
+    for name, entry in symbol_table.items():
+        if 'returns' in entry:
+            params = ', '.join(f"{param}: {type_}"
+                               for param, type_ in zip(entry['parameters'], entry['parameter_types']))
+            print(f"{name}: function({params}) -> {entry['returns']}")
+        else:
+            print(f"{name}: {entry.get('type')}")
+
+
+def print_xref(index, name):
+    print(f"\nCross Reference: {name}")
+    for site in index.function_definitions(name):
+        print(f"  function defined at {site}")
+    for site in index.call_sites(name):
+        print(f"  called at {site}")
+    if index.callers(name):
+        print(f"  callers: {', '.join(sorted(index.callers(name)))}")
+    if index.callees(name):
+        print(f"  calls: {', '.join(sorted(index.callees(name)))}")
+    for scope in sorted(index.scopes(name), key=lambda s: s or ''):
+        for site in index.definitions(name, scope):
+            print(f"  assigned at {site}")
+        for site in index.uses(name, scope):
+            print(f"  used at {site}")
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Tokenize and parse a script, then print its parse tree")
+    arg_parser.add_argument('source', nargs='?',
+                            help="script file to compile (defaults to the built-in example)")
+    arg_parser.add_argument('--stats', action='store_true',
+                            help="report per-phase timings, counts, peak memory and throughput")
+    arg_parser.add_argument('--hash-cons', action='store_true',
+                            help="share identical subexpressions between statements")
+    arg_parser.add_argument('--jobs', type=int, default=1, metavar='N',
+                            help="lex and parse in N worker processes (large scripts only); "
+                                 "with --run, run PARALLEL FOR loops on N processes (default: one per core)")
+    arg_parser.add_argument('--inline', type=int, nargs='?', const=DEFAULT_INLINE_BUDGET, metavar='BUDGET',
+                            help="inline CALLs to FUNCs of at most BUDGET nodes, then fold constants")
+    arg_parser.add_argument('--tree-shake', action='store_true',
+                            help="drop FUNCs no CALL reachable from the program can reach")
+    arg_parser.add_argument('--check', action='store_true',
+                            help="run semantic analysis: undeclared identifiers, call arity and type inference")
+    arg_parser.add_argument('--xref', metavar='NAME',
+                            help="list definitions, uses, call sites and callers of NAME")
+    arg_parser.add_argument('--xref-index', default=DEFAULT_INDEX_FILE, metavar='FILE',
+                            help="with --xref, keep the index of every file compiled so far in FILE "
+                                 f"(default: {DEFAULT_INDEX_FILE})")
+    arg_parser.add_argument('--run', action='store_true',
+                            help="execute the program and print its variables")
+    arg_parser.add_argument('--memo-size', type=int, default=DEFAULT_CACHE_SIZE, metavar='N',
+                            help="cache up to N results per pure FUNC when running (0 disables)")
+    arg_parser.add_argument('--profile', action='store_true',
+                            help="execute with the statement profiler and print its report")
+    arg_parser.add_argument('--collapsed', metavar='FILE',
+                            help="with --profile, write collapsed stacks for flame graphs to FILE")
+    arg_parser.add_argument('--tree-depth', type=int, metavar='N',
+                            help="print the parse tree only N levels deep, with source positions, "
+                                 "building just those levels")
+    arg_parser.add_argument('--cost', action='store_true',
+                            help="estimate how many instructions the program executes, before running it")
+    arg_parser.add_argument('--max-cost', type=int, metavar='N',
+                            help="refuse to run a program estimated to execute more than N instructions")
+    arg_parser.add_argument('--max-instructions', type=int, metavar='N',
+                            help="stop the program after it executes N instructions")
+    arg_parser.add_argument('--timeout', type=float, metavar='SECONDS',
+                            help="stop the program after it runs for SECONDS")
+    args = arg_parser.parse_args(argv)
+    if args.jobs > 1 and args.hash_cons:
+        arg_parser.error("--hash-cons cannot be combined with --jobs")
+
+    if args.source:
+        with open(args.source) as f:
+            source_code = f.read()
+    else:
+        source_code = DEMO_SOURCE
+
+    stats = CompileStats() if args.stats else None
+
+    with stats or nullcontext():
+        try:
+            if args.jobs > 1:
+                # Lex and parse chunks of the file in parallel
+                from parallel_compile import parallel_compile
+                if stats:
+                    stats('start', 'parse')
+                result = parallel_compile(source_code, workers=args.jobs)
+                tokens, positions, symbol_table = result.tokens, result.positions, result.symbol_table
+                ast = result.program
+                if stats:
+                    stats('end', 'parse', tokens=len(tokens), lines=source_code.count('\n') + 1,
+                          nodes=count_nodes(ast), symbols=len(result.symbol_table))
+                print_tokens(tokens)
+            else:
+                # First tokenize using the lexer from phase 1
+                lex = lexer.Lexer(source_code)
+                if stats:
+                    lex.add_hook(stats)
+                tokens = lex.tokenize()
+                lex.update_symbol_table_types()
+                positions, symbol_table = lex.token_positions, lex.symbol_table
+                print_tokens(tokens)
+
+                # Then parse the tokens
+                factory = HashConsFactory() if args.hash_cons else None
+                parser = Parser(tokens, positions, factory)
+                if stats:
+                    parser.add_hook(stats)
+                ast = parser.parse()
+
+            if args.inline is not None:
+                with stats.phase('optimize') if stats else nullcontext():
+                    ast, inline_report = inline_functions(ast, args.inline)
+                    ast = fold_constants(ast)
+                print(inline_report)
+
+            if args.tree_shake:
+                with stats.phase('optimize') if stats else nullcontext():
+                    ast, report = eliminate_dead_functions(ast, symbol_table)
+                print(report)
+
+            if args.check:
+                with stats.phase('validate') if stats else nullcontext():
+                    semantic = analyze(ast)
+                    semantic.apply_to_symbol_table(symbol_table)
+                for diagnostic in semantic.diagnostics:
+                    print(f"Warning: {diagnostic}")
+                print_symbol_table(symbol_table)
+
+            if args.xref:
+                if os.path.exists(args.xref_index):
+                    index = CrossReferenceIndex.load(args.xref_index)
+                else:
+                    index = CrossReferenceIndex()
+                if index.update(args.source or '<demo>', tokens, positions, source_digest(source_code)):
+                    index.save(args.xref_index)
+                print_xref(index, args.xref)
+
+            with stats.phase('print') if stats else nullcontext():
+                if args.tree_depth is None:
+                    tree = str(ast)
+                else:
+                    tree = concrete_tree(ast, positions).render(args.tree_depth)
+            print("\nParse Tree:")
+            print(tree)
+
+            estimate = None
+            if args.cost or args.max_cost is not None:
+                with stats.phase('validate') if stats else nullcontext():
+                    estimate = estimate_cost(ast)
+                if args.cost:
+                    print()
+                    print(estimate.report())
+
+            rejection = estimate and admission_error(estimate, args.max_cost)
+            if rejection and (args.run or args.profile):
+                print(f"Rejected: {rejection}")
+            elif args.run or args.profile:
+                profiler = ExecutionProfiler() if args.profile else None
+                budget = None
+                if args.max_instructions is not None or args.timeout is not None:
+                    budget = ExecutionBudget(args.max_instructions, args.timeout)
+                interpreter = Interpreter(compile_for_execution(ast), profiler=profiler, cache_size=args.memo_size,
+                                          workers=args.jobs if args.jobs > 1 else None, budget=budget)
+                variables = interpreter.run()
+                print("Variables:")
+                for name, value in variables.items():
+                    if '.' not in name:  # skip temporaries introduced by --inline
+                        print(f"{name} = {value}")
+                if any(cache.hits + cache.misses for cache in interpreter.caches.values()):
+                    print()
+                    print(interpreter.cache_report())
+                if profiler:
+                    print()
+                    print(profiler.report())
+                    if args.collapsed:
+                        with open(args.collapsed, 'w') as f:
+                            f.write(profiler.collapsed())
+        except Exception as e:
+            print(f"Error: {e}")
+
+    if stats:
+        print()
+        print(stats.report())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,285 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set
+
+from ast_nodes import (
+    Node, Program, LetStatement, Identifier, CallStatement, FunctionDefinition,
+    ForStatement, ListLiteral, IndexAssignment, IfStatement, WhileStatement, ReturnStatement
+)
+from bytecode import MAIN
+from interpreter import DEFAULT_BUILTINS
+from visitor import Pass, PassManager, WalkContext, children, run_passes
+
+
+@dataclass
+class Diagnostic:
+    line: int
+    message: str
+
+    def __str__(self):
+        return f"line {self.line}: {self.message}"
+
+
+@dataclass
+class SymbolInfo:
+    functions: Dict[str, FunctionDefinition] = field(default_factory=dict)
+    globals: Set[str] = field(default_factory=set)
+    locals: Dict[str, Set[str]] = field(default_factory=dict)  # function name -> params and LET targets
+
+    def visible(self, name: str, function: Optional[str]) -> bool:
+        if function is not None and name in self.locals.get(function, ()):
+            return True
+        return name in self.globals
+
+
+class _ScopedPass(Pass):
+    """Tracks the FUNC being walked; None at the top level"""
+
+    def begin(self, root):
+        self.function = None
+        self._enclosing = []
+
+    def enter_FunctionDefinition(self, node: FunctionDefinition, ctx: WalkContext):
+        self._enclosing.append(self.function)
+        self.function = node.name
+
+    def leave_FunctionDefinition(self, node: FunctionDefinition, ctx: WalkContext):
+        self.function = self._enclosing.pop()
+
+
+class SymbolCollector(_ScopedPass):
+    """Collect FUNC definitions, global variables and each function's locals"""
+
+    name = 'symbols'
+
+    def begin(self, root):
+        super().begin(root)
+        self.info = SymbolInfo()
+        self.diagnostics: List[Diagnostic] = []
+
+    def enter_FunctionDefinition(self, node: FunctionDefinition, ctx: WalkContext):
+        if node.name in self.info.functions:
+            self.diagnostics.append(Diagnostic(node.line, f"Function '{node.name}' is already defined"))
+        self.info.functions[node.name] = node
+        self.info.locals[node.name] = set(node.parameters)
+        super().enter_FunctionDefinition(node, ctx)
+
+    def enter_LetStatement(self, node: LetStatement, ctx: WalkContext):
+        self.define(node.identifier)
+
+    def enter_ForStatement(self, node: ForStatement, ctx: WalkContext):
+        self.define(node.variable)
+
+    def define(self, name: str):
+        if self.function is None:
+            self.info.globals.add(name)
+        else:
+            self.info.locals[self.function].add(name)
+
+    def result(self) -> SymbolInfo:
+        return self.info
+
+
+class UndeclaredIdentifierCheck(_ScopedPass):
+    """Report variables that are never assigned in scope and calls to unknown functions"""
+
+    name = 'undeclared'
+    requires = ('symbols',)
+
+    def __init__(self, builtins=DEFAULT_BUILTINS):
+        super().__init__()
+        self.builtins = builtins
+
+    def begin(self, root):
+        super().begin(root)
+        self.diagnostics: List[Diagnostic] = []
+
+    def enter_Identifier(self, node: Identifier, ctx: WalkContext):
+        if not self.results['symbols'].visible(node.name, self.function):
+            self.diagnostics.append(Diagnostic(ctx.line, f"Undeclared identifier '{node.name}'"))
+
+    def enter_CallStatement(self, node: CallStatement, ctx: WalkContext):
+        name = node.function_name
+        if name not in self.results['symbols'].functions and name not in self.builtins:
+            self.diagnostics.append(Diagnostic(ctx.line, f"Undefined function '{name}'"))
+
+    def result(self) -> List[Diagnostic]:
+        return self.diagnostics
+
+
+class ArityCheck(Pass):
+    """Report CALLs whose argument count differs from the FUNC's parameter list.
+    imported maps FUNCs defined in other files to their parameter lists."""
+
+    name = 'arity'
+    requires = ('symbols',)
+
+    def __init__(self, imported: Optional[Dict[str, List[str]]] = None):
+        super().__init__()
+        self.imported = imported or {}
+
+    def begin(self, root):
+        self.diagnostics: List[Diagnostic] = []
+
+    def enter_CallStatement(self, node: CallStatement, ctx: WalkContext):
+        function = self.results['symbols'].functions.get(node.function_name)
+        parameters = function.parameters if function is not None else self.imported.get(node.function_name)
+        if parameters is not None and len(node.arguments) != len(parameters):
+            self.diagnostics.append(Diagnostic(
+                ctx.line,
+                f"Function '{node.function_name}' expects {len(parameters)} "
+                f"arguments, got {len(node.arguments)}"))
+
+    def result(self) -> List[Diagnostic]:
+        return self.diagnostics
+
+
+def check_program(program: Program, builtins=DEFAULT_BUILTINS) -> List[Diagnostic]:
+    """Run the standard checks in two walks and return their diagnostics by line"""
+    collector = SymbolCollector()
+    passes = [collector, UndeclaredIdentifierCheck(builtins), ArityCheck()]
+    results = PassManager(passes).run(program)
+    diagnostics = collector.diagnostics + results['undeclared'] + results['arity']
+    return sorted(diagnostics, key=lambda d: d.line)
+
+
+class CallGraphBuilder(_ScopedPass):
+    """Map each FUNC (and '<main>' for the top level) to the functions it CALLs"""
+
+    name = 'call_graph'
+
+    def begin(self, root):
+        super().begin(root)
+        self.graph: Dict[str, Set[str]] = {MAIN: set()}
+
+    def enter_FunctionDefinition(self, node: FunctionDefinition, ctx: WalkContext):
+        super().enter_FunctionDefinition(node, ctx)
+        self.graph.setdefault(node.name, set())
+
+    def enter_CallStatement(self, node: CallStatement, ctx: WalkContext):
+        self.graph[self.function or MAIN].add(node.function_name)
+
+    def result(self) -> Dict[str, Set[str]]:
+        return self.graph
+
+
+def reachable_functions(graph: Dict[str, Set[str]], entry: str = MAIN) -> Set[str]:
+    """Names reachable from entry over call edges, entry included"""
+    seen = {entry}
+    stack = [entry]
+    while stack:
+        for callee in graph.get(stack.pop(), ()):
+            if callee not in seen:
+                seen.add(callee)
+                stack.append(callee)
+    return seen
+
+
+def _read_names(expr: Node) -> Set[str]:
+    if isinstance(expr, Identifier):
+        return {expr.name}
+    return set().union(*(_read_names(child) for child in children(expr)))
+
+
+def _early_reads(statements: List[Node], assigned: Set[str], reads: Set[str]) -> Set[str]:
+    """Add to reads the names statements may read before assigning them, and
+    return the names assigned on every path through statements"""
+    for stmt in statements:
+        if isinstance(stmt, FunctionDefinition):
+            continue  # a scope of its own
+        if isinstance(stmt, LetStatement):
+            reads |= _read_names(stmt.expression) - assigned
+            assigned = assigned | {stmt.identifier}
+        elif isinstance(stmt, IfStatement):
+            reads |= _read_names(stmt.condition) - assigned
+            then_assigned = _early_reads(stmt.then_branch, assigned, reads)
+            else_assigned = _early_reads(stmt.else_branch or [], assigned, reads)
+            assigned = then_assigned & else_assigned
+        elif isinstance(stmt, WhileStatement):
+            reads |= _read_names(stmt.condition) - assigned
+            _early_reads(stmt.body, assigned, reads)  # may run no times
+        elif isinstance(stmt, ForStatement):
+            for expr in (stmt.start, stmt.end, stmt.step):
+                if expr is not None:
+                    reads |= _read_names(expr) - assigned
+            assigned = assigned | {stmt.variable}
+            _early_reads(stmt.body, assigned, reads)
+        elif isinstance(stmt, ReturnStatement):
+            if stmt.expression is not None:
+                reads |= _read_names(stmt.expression) - assigned
+        else:  # CALL statements and element assignments
+            reads |= _read_names(stmt) - assigned
+    return assigned
+
+
+def early_reads(func: FunctionDefinition) -> Set[str]:
+    """Names func may read before assigning them itself. LOAD_NAME finds the
+    global of that name then, even when func later makes it a local."""
+    reads: Set[str] = set()
+    _early_reads(func.body, set(func.parameters), reads)
+    return reads
+
+
+class PurityAnalysis(_ScopedPass):
+    """Find FUNCs whose result depends only on their arguments.
+
+    A FUNC is impure if it reads a variable that is not one of its own
+    parameters or LET targets (a global), reads a LET target before the LET
+    may have run (also the global), or CALLs a builtin, an unknown
+    function or an impure FUNC. LET inside a FUNC always binds a local, so a
+    FUNC cannot write globals. Element assignments and list literals also
+    make a FUNC impure: the first mutates a list the caller can see, and a
+    cached list result would be shared between callers. imported names the
+    pure FUNCs of other files.
+    """
+
+    name = 'purity'
+    requires = ('symbols',)
+
+    def __init__(self, imported: Iterable[str] = ()):
+        super().__init__()
+        self.imported = set(imported)
+
+    def begin(self, root):
+        super().begin(root)
+        self.impure: Set[str] = set()
+        self.callers: Dict[str, Set[str]] = {}  # FUNC -> FUNCs that CALL it
+
+    def enter_FunctionDefinition(self, node: FunctionDefinition, ctx: WalkContext):
+        super().enter_FunctionDefinition(node, ctx)
+        if early_reads(node):
+            self.impure.add(node.name)
+
+    def enter_Identifier(self, node: Identifier, ctx: WalkContext):
+        if self.function is not None and node.name not in self.results['symbols'].locals[self.function]:
+            self.impure.add(self.function)
+
+    def enter_IndexAssignment(self, node: IndexAssignment, ctx: WalkContext):
+        if self.function is not None:
+            self.impure.add(self.function)
+
+    def enter_ListLiteral(self, node: ListLiteral, ctx: WalkContext):
+        if self.function is not None:
+            self.impure.add(self.function)
+
+    def enter_CallStatement(self, node: CallStatement, ctx: WalkContext):
+        if self.function is None:
+            return
+        if node.function_name in self.results['symbols'].functions:
+            self.callers.setdefault(node.function_name, set()).add(self.function)
+        elif node.function_name not in self.imported:
+            self.impure.add(self.function)
+
+    def result(self) -> Set[str]:
+        """Names of the pure FUNCs"""
+        impure = set(self.impure)
+        stack = list(impure)
+        while stack:
+            for caller in self.callers.get(stack.pop(), ()):
+                if caller not in impure:
+                    impure.add(caller)
+                    stack.append(caller)
+        return set(self.results['symbols'].functions) - impure
+
+
+def pure_functions(program: Program, imported: Iterable[str] = ()) -> Set[str]:
+    return run_passes(program, SymbolCollector(), PurityAnalysis(imported))['purity']
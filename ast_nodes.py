@@ -1,8 +1,7 @@
-from dataclasses import dataclass
-from typing import List, Optional
+from dataclasses import dataclass, field
+from typing import List, Optional, Union
 
 
-@dataclass
 class Node:
     def __str__(self, level=0):
         return "|-- " + f"{self.__class__.__name__}\n"
@@ -16,18 +15,27 @@ class Program(Node):
         result = "Program\n"
         result += "|-- statements_block\n"
         for stmt in self.statements:
-            lines = stmt.__str__(0).split('\n')
-            for line in lines:
-                if line:  # Skip empty lines
-                    result += "|   |-- " + line.lstrip("|-- ") + "\n"
+            result += statement_entry(stmt)
         result += "|-- End\n"
         return result
 
 
+def statement_entry(stmt: Node) -> str:
+    """The lines stmt contributes to its Program's statements_block"""
+    result = ""
+    lines = stmt.__str__(0).split('\n')
+    for line in lines:
+        if line:  # Skip empty lines
+            result += "|   |-- " + line.lstrip("|-- ") + "\n"
+    return result
+
+
 @dataclass
 class LetStatement(Node):
     identifier: str
     expression: Node
+    line: int = 0
+    token: int = field(default=-1, compare=False, repr=False)  # index of the first token; -1 if unknown
 
     def __str__(self, level=0):
         result = "declare_statement\n"
@@ -44,7 +52,7 @@ class LetStatement(Node):
         return result
 
 
-@dataclass
+@dataclass(frozen=True)
 class BinaryOperation(Node):
     left: Node
     operator: str
@@ -58,15 +66,15 @@ class BinaryOperation(Node):
         return result
 
 
-@dataclass
+@dataclass(frozen=True)
 class Number(Node):
-    value: str
+    value: Union[int, float]  # converted from the lexeme by the parser
 
     def __str__(self, level=0):
         return f"number: {self.value}\n"
 
 
-@dataclass
+@dataclass(frozen=True)
 class Identifier(Node):
     name: str
 
@@ -79,6 +87,8 @@ class IfStatement(Node):
     condition: Node
     then_branch: List[Node]
     else_branch: Optional[List[Node]] = None
+    line: int = 0
+    token: int = field(default=-1, compare=False, repr=False)  # index of the first token; -1 if unknown
 
     def __str__(self, level=0):
         result = "if_statement\n"
@@ -116,6 +126,8 @@ class IfStatement(Node):
 class CallStatement(Node):
     function_name: str
     arguments: List[Node]
+    line: int = 0
+    token: int = field(default=-1, compare=False, repr=False)  # index of the first token; -1 if unknown
 
     def __str__(self, level=0):
         result = "call_statement\n"
@@ -129,3 +141,214 @@ class CallStatement(Node):
                 result += "|   |-- comma: ,\n"
         result += "|-- right_paren: )\n"
         return result
+
+
+@dataclass
+class WhileStatement(Node):
+    condition: Node
+    body: List[Node]
+    line: int = 0
+    token: int = field(default=-1, compare=False, repr=False)  # index of the first token; -1 if unknown
+
+    def __str__(self, level=0):
+        result = "while_statement\n"
+        result += "|-- while: WHILE\n"
+        result += "|-- condition\n"
+        if isinstance(self.condition, BinaryOperation):
+            result += "|   |-- expression\n"
+            result += "|   |   |-- " + self.condition.left.__str__(0)
+            result += "|   |   |-- operation: " + self.condition.operator + "\n"
+            result += "|   |   |-- " + self.condition.right.__str__(0)
+        else:
+            result += "|   |-- " + self.condition.__str__(0)
+        result += "|-- do: DO\n"
+        result += "|-- statements\n"
+        for stmt in self.body:
+            stmt_lines = stmt.__str__(0).split('\n')
+            for line in stmt_lines:
+                if line:  # Skip empty lines
+                    result += "|   |-- " + line.lstrip("|-- ") + "\n"
+        result += "|-- endwhile: ENDWHILE\n"
+        return result
+
+
+@dataclass
+class FunctionDefinition(Node):
+    name: str
+    parameters: List[str]
+    body: List[Node]
+    line: int = 0
+    token: int = field(default=-1, compare=False, repr=False)  # index of the first token; -1 if unknown
+
+    def __str__(self, level=0):
+        result = "function_definition\n"
+        result += "|-- func: FUNC\n"
+        result += f"|-- id: {self.name}\n"
+        result += "|-- left_paren: (\n"
+        result += "|-- params\n"
+        for i, param in enumerate(self.parameters):
+            result += f"|   |-- id: {param}\n"
+            if i < len(self.parameters) - 1:
+                result += "|   |-- comma: ,\n"
+        result += "|-- right_paren: )\n"
+        result += "|-- begin: BEGIN\n"
+        result += "|-- statements\n"
+        for stmt in self.body:
+            stmt_lines = stmt.__str__(0).split('\n')
+            for line in stmt_lines:
+                if line:  # Skip empty lines
+                    result += "|   |-- " + line.lstrip("|-- ") + "\n"
+        result += "|-- end: END\n"
+        return result
+
+
+@dataclass
+class ReturnStatement(Node):
+    expression: Optional[Node] = None
+    line: int = 0
+    token: int = field(default=-1, compare=False, repr=False)  # index of the first token; -1 if unknown
+
+    def __str__(self, level=0):
+        result = "return_statement\n"
+        result += "|-- return: RETURN\n"
+        if self.expression is not None:
+            result += "|-- " + self.expression.__str__(0)
+        return result
+
+
+def _expression_str(expr: Node, indent: str) -> str:
+    """expr as a subtree, indented like a WHILE condition"""
+    if isinstance(expr, BinaryOperation):
+        result = indent + "|-- expression\n"
+        result += indent + "|   |-- " + expr.left.__str__(0)
+        result += indent + "|   |-- operation: " + expr.operator + "\n"
+        result += indent + "|   |-- " + expr.right.__str__(0)
+        return result
+    return indent + "|-- " + expr.__str__(0)
+
+
+@dataclass
+class ForStatement(Node):
+    """FOR v = start TO end [STEP step] DO ... ENDFOR (end included) or
+    FOR v IN RANGE(start, end [, step]) DO ... ENDFOR (end excluded);
+    parallel for PARALLEL FOR, whose chunks may run in other processes"""
+    variable: str
+    start: Node
+    end: Node
+    step: Optional[Node]
+    body: List[Node]
+    inclusive: bool = True
+    parallel: bool = False
+    line: int = 0
+    token: int = field(default=-1, compare=False, repr=False)  # index of the first token; -1 if unknown
+
+    def __str__(self, level=0):
+        result = "for_statement\n"
+        if self.parallel:
+            result += "|-- parallel: PARALLEL\n"
+        result += "|-- for: FOR\n"
+        result += f"|-- id: {self.variable}\n"
+        if self.inclusive:
+            result += "|-- equal: =\n"
+            result += _expression_str(self.start, "|   ")
+            result += "|-- to: TO\n"
+            result += _expression_str(self.end, "|   ")
+            if self.step is not None:
+                result += "|-- step: STEP\n"
+                result += _expression_str(self.step, "|   ")
+        else:
+            result += "|-- in: IN\n"
+            result += "|-- range: RANGE\n"
+            result += "|-- left_paren: (\n"
+            result += _expression_str(self.start, "|   ")
+            result += "|-- comma: ,\n"
+            result += _expression_str(self.end, "|   ")
+            if self.step is not None:
+                result += "|-- comma: ,\n"
+                result += _expression_str(self.step, "|   ")
+            result += "|-- right_paren: )\n"
+        result += "|-- do: DO\n"
+        result += "|-- statements\n"
+        for stmt in self.body:
+            stmt_lines = stmt.__str__(0).split('\n')
+            for line in stmt_lines:
+                if line:  # Skip empty lines
+                    result += "|   |-- " + line.lstrip("|-- ") + "\n"
+        result += "|-- endfor: ENDFOR\n"
+        return result
+
+
+@dataclass
+class ListLiteral(Node):
+    elements: List[Node]
+
+    def __str__(self, level=0):
+        result = "list\n"
+        result += "|-- left_bracket: [\n"
+        for i, element in enumerate(self.elements):
+            result += "|   |-- " + element.__str__(0)
+            if i < len(self.elements) - 1:
+                result += "|   |-- comma: ,\n"
+        result += "|-- right_bracket: ]\n"
+        return result
+
+
+@dataclass(frozen=True)
+class IndexExpression(Node):
+    """target[index]; a[i][j] is IndexExpression(IndexExpression(a, i), j)"""
+    target: Node
+    index: Node
+
+    def __str__(self, level=0):
+        result = "index\n"
+        result += "|-- " + self.target.__str__(0)
+        result += "|-- left_bracket: [\n"
+        result += _expression_str(self.index, "|   ")
+        result += "|-- right_bracket: ]\n"
+        return result
+
+
+@dataclass
+class IndexAssignment(Node):
+    """LET target[index] = expression"""
+    target: Node
+    index: Node
+    expression: Node
+    line: int = 0
+    token: int = field(default=-1, compare=False, repr=False)  # index of the first token; -1 if unknown
+
+    def __str__(self, level=0):
+        result = "element_assignment\n"
+        result += "|-- let: LET\n"
+        result += "|-- " + self.target.__str__(0)
+        result += "|-- left_bracket: [\n"
+        result += _expression_str(self.index, "|   ")
+        result += "|-- right_bracket: ]\n"
+        result += "|-- equal: =\n"
+        result += _expression_str(self.expression, "")
+        return result
+
+
+def literal_value(lexeme: str) -> Union[int, float]:
+    """Convert a number lexeme, or the repr of an int or float, to int or float"""
+    try:
+        return int(lexeme)
+    except ValueError:
+        return float(lexeme)
+
+
+class NodeFactory:
+    """Builds the expression nodes for the parser.
+
+    Number, Identifier and BinaryOperation are immutable, so a factory may
+    hand out the same instance for equal subexpressions (see hashcons.py).
+    """
+
+    def number(self, value: Union[int, float]) -> Number:
+        return Number(value)
+
+    def identifier(self, name: str) -> Identifier:
+        return Identifier(name)
+
+    def binary(self, left: Node, operator: str, right: Node) -> BinaryOperation:
+        return BinaryOperation(left, operator, right)
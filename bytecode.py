@@ -0,0 +1,254 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Tuple
+
+from ast_nodes import (
+    Node, Program, LetStatement, BinaryOperation,
+    Number, Identifier, IfStatement, CallStatement,
+    WhileStatement, FunctionDefinition, ReturnStatement, ForStatement,
+    ListLiteral, IndexExpression, IndexAssignment
+)
+from parallel_loops import plan_parallel
+from vectorize import plan_loop
+
+# Opcodes of the stack machine run by interpreter.Interpreter
+LOAD_CONST = 0      # arg: constant value
+LOAD_NAME = 1       # arg: variable name
+STORE_NAME = 2      # arg: variable name
+BINARY_OP = 3       # arg: operator lexeme
+JUMP = 4            # arg: target pc
+JUMP_IF_FALSE = 5   # arg: target pc
+CALL = 6            # arg: (function name, argument count)
+RETURN = 7          # arg: None
+POP = 8             # arg: None
+STATEMENT = 9       # arg: index into CodeObject.statements
+TAIL_CALL = 10      # arg: (function name, argument count); always followed by RETURN
+BUILD_LIST = 11     # arg: element count
+LOAD_INDEX = 12     # arg: None; pops index and list
+STORE_INDEX = 13    # arg: None; pops value, index and list
+FOR_TEST = 14       # arg: (loop variable, end included, exit pc); end and step stay on the stack
+FOR_STEP = 15       # arg: loop variable
+VECTOR_FOR = 16     # arg: (vectorize.LoopKernel, exit pc); falls through when the loop must run scalar
+PARALLEL_FOR = 17   # arg: (parallel_loops.ParallelLoop, exit pc); falls through when the loop must run serially
+BINARY_CONST = 18   # arg: (operator lexeme, nonzero number literal); BINARY_OP with the right operand built in
+
+OPNAMES = [
+    'LOAD_CONST', 'LOAD_NAME', 'STORE_NAME', 'BINARY_OP', 'JUMP',
+    'JUMP_IF_FALSE', 'CALL', 'RETURN', 'POP', 'STATEMENT', 'TAIL_CALL',
+    'BUILD_LIST', 'LOAD_INDEX', 'STORE_INDEX', 'FOR_TEST', 'FOR_STEP', 'VECTOR_FOR',
+    'PARALLEL_FOR', 'BINARY_CONST'
+]
+
+MAIN = '<main>'
+
+
+@dataclass
+class CodeObject:
+    name: str
+    parameters: List[str]
+    line: int = 0
+    instructions: List[Tuple[int, object]] = field(default_factory=list)
+    lines: List[int] = field(default_factory=list)  # source line of each instruction
+    statements: List[Tuple[int, str, int]] = field(default_factory=list)  # (line, kind, nesting depth)
+    pure: bool = False  # result depends only on the arguments, so calls may be cached
+
+    def emit(self, op: int, arg=None, line: int = 0) -> int:
+        self.instructions.append((op, arg))
+        self.lines.append(line)
+        return len(self.instructions) - 1
+
+    def patch(self, index: int, target: int):
+        op, _ = self.instructions[index]
+        self.instructions[index] = (op, target)
+
+    def disassemble(self) -> str:
+        result = f"{self.name}({', '.join(self.parameters)})\n"
+        for pc, (op, arg) in enumerate(self.instructions):
+            result += disassemble_instruction(pc, op, arg, self.lines[pc])
+        return result
+
+
+def disassemble_instruction(pc: int, op: int, arg, line: int) -> str:
+    arg_text = '' if arg is None else repr(arg)
+    return f"{line:>5} {pc:>5} {OPNAMES[op]:<14} {arg_text}\n"
+
+
+def relocate(op: int, arg, offset: int, statements: int):
+    """arg of an instruction moved offset pcs later into code that already has statements STATEMENT entries"""
+    if op == JUMP or op == JUMP_IF_FALSE:
+        return arg + offset
+    if op == FOR_TEST:
+        variable, inclusive, exit_pc = arg
+        return variable, inclusive, exit_pc + offset
+    if op == VECTOR_FOR or op == PARALLEL_FOR:
+        kernel, exit_pc = arg
+        return kernel, exit_pc + offset
+    if op == STATEMENT:
+        return arg + statements
+    return arg
+
+
+@dataclass
+class CompiledProgram:
+    main: CodeObject
+    functions: Dict[str, CodeObject]
+
+    def disassemble(self) -> str:
+        parts = [self.main.disassemble()]
+        parts += [code.disassemble() for code in self.functions.values()]
+        return "\n".join(parts)
+
+
+class CodeGenerator:
+    """Compile an AST into stack-machine code, one CodeObject per FUNC.
+    pure names the FUNCs a PARALLEL FOR body may call."""
+
+    def __init__(self, pure: Iterable[str] = ()):
+        self.functions = {}
+        self.pure = set(pure)
+
+    def compile(self, program: Program) -> CompiledProgram:
+        main = CodeObject(MAIN, [])
+        self.compile_block(main, program.statements)
+        main.emit(LOAD_CONST, None)
+        main.emit(RETURN)
+        return CompiledProgram(main, self.functions)
+
+    def compile_function(self, node: FunctionDefinition):
+        if node.name in self.functions:
+            raise Exception(f"Compile error at line {node.line}: function '{node.name}' is already defined")
+        code = CodeObject(node.name, list(node.parameters), node.line)
+        self.functions[node.name] = code
+        self.compile_block(code, node.body)
+        code.emit(LOAD_CONST, None, node.line)
+        code.emit(RETURN, None, node.line)
+
+    def compile_block(self, code: CodeObject, statements: List[Node], depth: int = 0):
+        for stmt in statements:
+            self.compile_statement(code, stmt, depth)
+
+    def compile_statement(self, code: CodeObject, stmt: Node, depth: int = 0):
+        if isinstance(stmt, FunctionDefinition):
+            # Functions are hoisted: they are callable from anywhere in the program
+            self.compile_function(stmt)
+            return
+
+        line = stmt.line
+        code.statements.append((line, stmt_kind(stmt), depth))
+        code.emit(STATEMENT, len(code.statements) - 1, line)
+
+        if isinstance(stmt, LetStatement):
+            self.compile_expression(code, stmt.expression, line)
+            code.emit(STORE_NAME, stmt.identifier, line)
+        elif isinstance(stmt, IfStatement):
+            self.compile_expression(code, stmt.condition, line)
+            jump_else = code.emit(JUMP_IF_FALSE, None, line)
+            self.compile_block(code, stmt.then_branch, depth + 1)
+            if stmt.else_branch:
+                jump_end = code.emit(JUMP, None, line)
+                code.patch(jump_else, len(code.instructions))
+                self.compile_block(code, stmt.else_branch, depth + 1)
+                code.patch(jump_end, len(code.instructions))
+            else:
+                code.patch(jump_else, len(code.instructions))
+        elif isinstance(stmt, WhileStatement):
+            top = len(code.instructions) - 1  # Re-enter at STATEMENT so every test counts as a hit
+            self.compile_expression(code, stmt.condition, line)
+            jump_end = code.emit(JUMP_IF_FALSE, None, line)
+            self.compile_block(code, stmt.body, depth + 1)
+            code.emit(JUMP, top, line)
+            code.patch(jump_end, len(code.instructions))
+        elif isinstance(stmt, ForStatement):
+            self.compile_expression(code, stmt.start, line)
+            code.emit(STORE_NAME, stmt.variable, line)
+            self.compile_expression(code, stmt.end, line)
+            if stmt.step is None:
+                code.emit(LOAD_CONST, 1, line)
+            else:
+                self.compile_expression(code, stmt.step, line)
+            kernel = plan_loop(stmt)
+            vector = code.emit(VECTOR_FOR, None, line) if kernel is not None else None
+            workers = plan_parallel(stmt, self.pure) if stmt.parallel else None
+            parallel = code.emit(PARALLEL_FOR, None, line) if workers is not None else None
+            top = code.emit(FOR_TEST, None, line)
+            self.compile_block(code, stmt.body, depth + 1)
+            code.emit(FOR_STEP, stmt.variable, line)
+            code.emit(JUMP, top, line)
+            end = len(code.instructions)
+            code.instructions[top] = (FOR_TEST, (stmt.variable, bool(stmt.inclusive), end))
+            if vector is not None:
+                code.instructions[vector] = (VECTOR_FOR, (kernel, end))
+            if parallel is not None:
+                code.instructions[parallel] = (PARALLEL_FOR, (workers, end))
+        elif isinstance(stmt, IndexAssignment):
+            self.compile_expression(code, stmt.target, line)
+            self.compile_expression(code, stmt.index, line)
+            self.compile_expression(code, stmt.expression, line)
+            code.emit(STORE_INDEX, None, line)
+        elif isinstance(stmt, CallStatement):
+            self.compile_expression(code, stmt, line)
+            code.emit(POP, None, line)
+        elif isinstance(stmt, ReturnStatement):
+            if stmt.expression is None:
+                code.emit(LOAD_CONST, None, line)
+            elif isinstance(stmt.expression, CallStatement) and code.name != MAIN:
+                # RETURN CALL f(...) reuses the caller's frame, so tail recursion runs in constant space
+                call = stmt.expression
+                for arg in call.arguments:
+                    self.compile_expression(code, arg, line)
+                code.emit(TAIL_CALL, (call.function_name, len(call.arguments)), line)
+            else:
+                self.compile_expression(code, stmt.expression, line)
+            code.emit(RETURN, None, line)
+        else:
+            raise Exception(f"Compile error at line {line}: unsupported statement {stmt.__class__.__name__}")
+
+    def compile_expression(self, code: CodeObject, expr: Node, line: int):
+        if isinstance(expr, Number):
+            code.emit(LOAD_CONST, expr.value, line)
+        elif isinstance(expr, Identifier):
+            code.emit(LOAD_NAME, expr.name, line)
+        elif isinstance(expr, BinaryOperation):
+            self.compile_expression(code, expr.left, line)
+            if isinstance(expr.right, Number) and expr.right.value != 0:
+                code.emit(BINARY_CONST, (expr.operator, expr.right.value), line)
+                return
+            self.compile_expression(code, expr.right, line)
+            code.emit(BINARY_OP, expr.operator, line)
+        elif isinstance(expr, CallStatement):
+            for arg in expr.arguments:
+                self.compile_expression(code, arg, line)
+            code.emit(CALL, (expr.function_name, len(expr.arguments)), line)
+        elif isinstance(expr, ListLiteral):
+            for element in expr.elements:
+                self.compile_expression(code, element, line)
+            code.emit(BUILD_LIST, len(expr.elements), line)
+        elif isinstance(expr, IndexExpression):
+            self.compile_expression(code, expr.target, line)
+            self.compile_expression(code, expr.index, line)
+            code.emit(LOAD_INDEX, None, line)
+        else:
+            raise Exception(f"Compile error at line {line}: unsupported expression {expr.__class__.__name__}")
+
+
+def stmt_kind(stmt: Node) -> str:
+    """Keyword naming a statement, e.g. 'LET' for a LetStatement"""
+    return {
+        LetStatement: 'LET',
+        IfStatement: 'IF',
+        WhileStatement: 'WHILE',
+        ForStatement: 'FOR',
+        IndexAssignment: 'LET',
+        CallStatement: 'CALL',
+        ReturnStatement: 'RETURN',
+        FunctionDefinition: 'FUNC',
+    }.get(type(stmt), stmt.__class__.__name__)
+
+
+def compile_program(program: Program, pure: Iterable[str] = ()) -> CompiledProgram:
+    """Compile program; FUNCs named in pure (see analysis.pure_functions) are marked cacheable
+    and may be called from PARALLEL FOR loops"""
+    compiled = CodeGenerator(pure).compile(program)
+    for name in pure:
+        if name in compiled.functions:
+            compiled.functions[name].pure = True
+    return compiled
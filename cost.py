@@ -0,0 +1,326 @@
+"""Static cost estimation, for deciding whether to run a script at all.
+
+The estimate is a bound on the instructions the VM will execute, counted
+the way CodeGenerator compiles each statement. An IF is charged for its more
+expensive branch, and a FOR with constant bounds for its exact trip count;
+a name bound only once, by a LET of a constant, counts as that constant,
+and so does a parameter whose argument is constant at the CALL.
+A CALL is charged the whole cost of the FUNC it calls. The bound is exact for
+straight-line code and loops, and otherwise an upper bound: a cached call
+or an early RETURN only make the run cheaper. Vectorized and PARALLEL FOR
+loops are charged at run time as if they ran serially, so they count the same.
+
+A WHILE loop, a FOR whose bounds are not constants (or whose body assigns
+the loop variable) and recursion have no static bound. They are listed in
+unbounded. Such scripts can still be run under an interpreter.ExecutionBudget.
+"""
+import math
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+from analysis import CallGraphBuilder, Diagnostic, SymbolCollector, reachable_functions
+from ast_nodes import (
+    Node, Program, LetStatement, BinaryOperation,
+    Number, Identifier, IfStatement, CallStatement,
+    WhileStatement, FunctionDefinition, ReturnStatement, ForStatement,
+    ListLiteral, IndexExpression, IndexAssignment
+)
+from optimize import ConstantFolder
+from vectorize import plan_loop
+from visitor import Pass, PassManager, Transformer, WalkContext
+
+
+@dataclass
+class CostEstimate:
+    instructions: Optional[int]  # bound on the VM instructions executed; None when there is none
+    loop_depth: int  # deepest nesting of FOR and WHILE loops, following CALLs
+    functions: int  # FUNCs the top level can reach through CALLs
+    unbounded: List[Diagnostic] = field(default_factory=list)  # why there is no bound
+
+    @property
+    def bounded(self) -> bool:
+        return self.instructions is not None
+
+    def report(self) -> str:
+        lines = ["Cost Estimate:"]
+        if self.bounded:
+            lines.append(f"Instructions: at most {self.instructions:,}")
+        else:
+            lines.append("Instructions: unbounded")
+        lines.append(f"Loop depth: {self.loop_depth}")
+        lines.append(f"Reachable functions: {self.functions}")
+        for diagnostic in self.unbounded:
+            lines.append(f"  {diagnostic}")
+        return "\n".join(lines)
+
+
+def admission_error(estimate: CostEstimate, max_instructions: Optional[int] = None,
+                    max_loop_depth: Optional[int] = None) -> Optional[str]:
+    """Why a script should be rejected before it runs, or None to admit it.
+    Scripts without a bound are admitted: limit them with an ExecutionBudget."""
+    if max_instructions is not None and estimate.bounded and estimate.instructions > max_instructions:
+        return f"estimated {estimate.instructions:,} instructions, the limit is {max_instructions:,}"
+    if max_loop_depth is not None and estimate.loop_depth > max_loop_depth:
+        return f"loops nest {estimate.loop_depth} deep, the limit is {max_loop_depth}"
+    return None
+
+
+class _Constants(Transformer):
+    """Replace names known to be constant by their values"""
+
+    def __init__(self, constants: Dict[str, object]):
+        self.constants = constants
+
+    def transform_Identifier(self, node: Identifier) -> Node:
+        return Number(self.constants[node.name]) if node.name in self.constants else node
+
+
+def _constant(expr: Node, constants: Dict[str, object]):
+    """The value of a constant numeric expression, or None"""
+    folded = ConstantFolder().transform(_Constants(constants).transform(expr))
+    return folded.value if isinstance(folded, Number) else None
+
+
+class ConstantNames(Pass):
+    """Names bound exactly once in the program, by a LET of a constant expression,
+    mapped to their values. Reading one before its LET runs is an error, so
+    wherever a read succeeds it sees that value."""
+
+    name = 'constants'
+
+    def begin(self, root):
+        self.bindings: Dict[str, int] = {}
+        self.lets: Dict[str, Node] = {}
+
+    def bind(self, name: str):
+        self.bindings[name] = self.bindings.get(name, 0) + 1
+
+    def enter_FunctionDefinition(self, node: FunctionDefinition, ctx: WalkContext):
+        for parameter in node.parameters:
+            self.bind(parameter)
+
+    def enter_LetStatement(self, node: LetStatement, ctx: WalkContext):
+        self.bind(node.identifier)
+        self.lets[node.identifier] = node.expression
+
+    def enter_ForStatement(self, node: ForStatement, ctx: WalkContext):
+        self.bind(node.variable)
+
+    def result(self) -> Dict[str, object]:
+        pending = {name: expr for name, expr in self.lets.items() if self.bindings[name] == 1}
+        constants: Dict[str, object] = {}
+        while True:  # a constant may be defined in terms of others
+            found = {name: value for name, value in ((name, _constant(expr, constants))
+                                                     for name, expr in pending.items()) if value is not None}
+            if not found:
+                return constants
+            constants.update(found)
+            for name in found:
+                del pending[name]
+
+
+def trip_count(start, end, step, inclusive: bool) -> int:
+    """Iterations of a FOR loop with these bounds, as the VM runs it"""
+    if step == 0:
+        return 0  # the first test raises
+    if all(type(value) is int for value in (start, end, step)):
+        stop = (end + (1 if step > 0 else -1)) if inclusive else end
+        return len(range(start, stop, step))
+    span = (end - start) / step
+    if span < 0:
+        return 0
+    return math.floor(span) + 1 if inclusive else math.ceil(span)
+
+
+def _assigns(statements: List[Node], name: str) -> bool:
+    """Whether a LET in statements, outside nested FUNCs, may assign name"""
+    for stmt in statements:
+        if isinstance(stmt, LetStatement) and stmt.identifier == name:
+            return True
+        if isinstance(stmt, ForStatement) and (stmt.variable == name or _assigns(stmt.body, name)):
+            return True
+        if isinstance(stmt, WhileStatement) and _assigns(stmt.body, name):
+            return True
+        if isinstance(stmt, IfStatement) and (_assigns(stmt.then_branch, name)
+                                              or _assigns(stmt.else_branch or [], name)):
+            return True
+    return False
+
+
+class CostEstimator:
+    """Estimate one program; costs are ints, or math.inf without a bound"""
+
+    def __init__(self, program: Program):
+        self.program = program
+        results = PassManager([SymbolCollector(), CallGraphBuilder(), ConstantNames()]).run(program)
+        self.functions: Dict[str, FunctionDefinition] = results['symbols'].functions
+        self.call_graph = results['call_graph']
+        self.constants: Dict[str, object] = results['constants']
+        self.scope = self.constants  # constant names where the walk is
+        self.costs: Dict[tuple, float] = {}  # (FUNC, constant arguments) -> cost
+        self.depths: Dict[str, int] = {}
+        self.active: Set[str] = set()  # FUNCs being estimated; calling one again is recursion
+        self.unbounded: List[Diagnostic] = []
+
+    def estimate(self) -> CostEstimate:
+        instructions = self.block(self.program.statements, None) + 2  # LOAD_CONST None, RETURN
+        depth = self.block_depth(self.program.statements)
+        functions = len(reachable_functions(self.call_graph) & set(self.functions))
+        self.unbounded.sort(key=lambda d: d.line)
+        return CostEstimate(None if instructions == math.inf else int(instructions), depth, functions,
+                            self.unbounded)
+
+    def no_bound(self, line: int, message: str) -> float:
+        diagnostic = Diagnostic(line, message)
+        if diagnostic not in self.unbounded:  # e.g. a FUNC estimated for several calls
+            self.unbounded.append(diagnostic)
+        return math.inf
+
+    # Instructions
+
+    def block(self, statements: List[Node], function: Optional[str]) -> float:
+        return sum(self.statement(stmt, function) for stmt in statements)
+
+    def statement(self, stmt: Node, function: Optional[str]) -> float:
+        if isinstance(stmt, FunctionDefinition):
+            return 0  # hoisted; charged at each CALL
+        cost = 1  # STATEMENT
+        if isinstance(stmt, LetStatement):
+            return cost + self.expression(stmt.expression) + 1
+        if isinstance(stmt, IndexAssignment):
+            return (cost + self.expression(stmt.target) + self.expression(stmt.index)
+                    + self.expression(stmt.expression) + 1)
+        if isinstance(stmt, CallStatement):
+            return cost + self.expression(stmt) + 1  # POP
+        if isinstance(stmt, ReturnStatement):
+            if stmt.expression is None:
+                return cost + 2
+            if isinstance(stmt.expression, CallStatement) and function is not None:
+                # TAIL_CALL: the callee's RETURN returns for the caller
+                call = stmt.expression
+                cost += sum(self.expression(arg) for arg in call.arguments) + 1
+                return cost + (self.call(call) if call.function_name in self.functions else 1)
+            return cost + self.expression(stmt.expression) + 1
+        if isinstance(stmt, IfStatement):
+            cost += self.expression(stmt.condition) + 1
+            then_cost = self.block(stmt.then_branch, function)
+            if stmt.else_branch:
+                return cost + max(then_cost + 1, self.block(stmt.else_branch, function))
+            return cost + then_cost
+        if isinstance(stmt, WhileStatement):
+            test = cost + self.expression(stmt.condition) + 1
+            body = self.block(stmt.body, function)
+            return self.no_bound(stmt.line, "WHILE loop has no static bound") + test + body
+        if isinstance(stmt, ForStatement):
+            return cost + self.for_loop(stmt, function)
+        raise Exception(f"Cost error at line {stmt.line}: unsupported statement {stmt.__class__.__name__}")
+
+    def for_loop(self, stmt: ForStatement, function: Optional[str]) -> float:
+        step = stmt.step or Number(1)
+        cost = self.expression(stmt.start) + 1 + self.expression(stmt.end) + self.expression(step)
+        if plan_loop(stmt) is not None:
+            cost += 1  # VECTOR_FOR, charged as if the loop then ran scalar
+        if stmt.parallel:
+            cost += 1
+        per_trip = 1 + self.block(stmt.body, function) + 2  # FOR_TEST, body, FOR_STEP, JUMP
+        bounds = [_constant(expr, self.scope) for expr in (stmt.start, stmt.end, step)]
+        if any(value is None for value in bounds):
+            return self.no_bound(stmt.line, "FOR bounds are not constant") + cost + per_trip
+        if _assigns(stmt.body, stmt.variable):
+            return self.no_bound(stmt.line, f"FOR body assigns the loop variable '{stmt.variable}'") + cost + per_trip
+        trips = trip_count(*bounds, bool(stmt.inclusive))
+        return cost + (trips * per_trip if trips else 0) + 1  # the final FOR_TEST
+
+    def expression(self, expr: Node) -> float:
+        if isinstance(expr, (Number, Identifier)):
+            return 1
+        if isinstance(expr, BinaryOperation):
+            if isinstance(expr.right, Number) and expr.right.value != 0:
+                return self.expression(expr.left) + 1  # BINARY_CONST
+            return self.expression(expr.left) + self.expression(expr.right) + 1
+        if isinstance(expr, CallStatement):
+            cost = sum(self.expression(arg) for arg in expr.arguments) + 1
+            return cost + self.call(expr) if expr.function_name in self.functions else cost
+        if isinstance(expr, ListLiteral):
+            return sum(self.expression(element) for element in expr.elements) + 1
+        if isinstance(expr, IndexExpression):
+            return self.expression(expr.target) + self.expression(expr.index) + 1
+        raise Exception(f"Cost error: unsupported expression {expr.__class__.__name__}")
+
+    def call(self, call: CallStatement) -> float:
+        """Cost of running the FUNC call invokes, once. Parameters the FUNC does not
+        reassign are constant when their arguments are."""
+        name = call.function_name
+        func = self.functions[name]
+        if name in self.active:
+            return self.no_bound(func.line, f"'{name}' is recursive")
+        arguments = [_constant(arg, self.scope) for arg in call.arguments]
+        bound = {parameter: value for parameter, value in zip(func.parameters, arguments)
+                 if value is not None and not _assigns(func.body, parameter)}
+        key = (name, tuple(sorted(bound.items())))
+        if key in self.costs:
+            return self.costs[key]
+        caller_scope = self.scope
+        self.scope = {**self.constants, **bound}
+        self.active.add(name)
+        cost = self.block(func.body, name)
+        if not (func.body and isinstance(func.body[-1], ReturnStatement)):
+            cost += 2  # LOAD_CONST None, RETURN
+        self.active.discard(name)
+        self.scope = caller_scope
+        self.costs[key] = cost
+        return cost
+
+    # Loop nesting
+
+    def block_depth(self, statements: List[Node]) -> int:
+        return max((self.statement_depth(stmt) for stmt in statements), default=0)
+
+    def statement_depth(self, stmt: Node) -> int:
+        if isinstance(stmt, FunctionDefinition):
+            return 0
+        depth = max((self.function_depth(name) for name in _called(stmt)), default=0)
+        if isinstance(stmt, (WhileStatement, ForStatement)):
+            return max(depth, 1 + self.block_depth(stmt.body))
+        if isinstance(stmt, IfStatement):
+            return max(depth, self.block_depth(stmt.then_branch), self.block_depth(stmt.else_branch or []))
+        return depth
+
+    def function_depth(self, name: str) -> int:
+        if name not in self.functions or name in self.active:
+            return 0
+        if name not in self.depths:
+            self.active.add(name)
+            self.depths[name] = self.block_depth(self.functions[name].body)
+            self.active.discard(name)
+        return self.depths[name]
+
+
+def _called(stmt: Node) -> List[str]:
+    """FUNCs CALLed by the expressions of stmt itself, not of the statements it contains"""
+    expressions = {
+        LetStatement: lambda s: [s.expression],
+        IndexAssignment: lambda s: [s.target, s.index, s.expression],
+        CallStatement: lambda s: [s],
+        ReturnStatement: lambda s: [s.expression] if s.expression is not None else [],
+        IfStatement: lambda s: [s.condition],
+        WhileStatement: lambda s: [s.condition],
+        ForStatement: lambda s: [s.start, s.end] + ([s.step] if s.step is not None else []),
+    }[type(stmt)](stmt)
+    names = []
+    while expressions:
+        expr = expressions.pop()
+        if isinstance(expr, CallStatement):
+            names.append(expr.function_name)
+            expressions.extend(expr.arguments)
+        elif isinstance(expr, BinaryOperation):
+            expressions.extend((expr.left, expr.right))
+        elif isinstance(expr, ListLiteral):
+            expressions.extend(expr.elements)
+        elif isinstance(expr, IndexExpression):
+            expressions.extend((expr.target, expr.index))
+    return names
+
+
+def estimate_cost(program: Program) -> CostEstimate:
+    return CostEstimator(program).estimate()
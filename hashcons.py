@@ -0,0 +1,48 @@
+from typing import Dict, Tuple, Union
+
+from ast_nodes import Node, Number, Identifier, BinaryOperation, NodeFactory
+
+
+class HashConsFactory(NodeFactory):
+    """Node factory that returns one shared instance per distinct expression.
+
+    Children are themselves unique, so a BinaryOperation is keyed by the
+    identity of its operands rather than by hashing whole subtrees; every
+    lookup is O(1). The parsed expressions form a DAG: passes that memoize
+    per subexpression can key their caches on id(node).
+    """
+
+    def __init__(self):
+        self.table: Dict[Tuple, Node] = {}
+        self.requests = 0
+
+    def number(self, value: Union[int, float]) -> Number:
+        # 1 == 1.0 == True, so the type is part of the key
+        return self._intern(('number', type(value), value), Number, value)
+
+    def identifier(self, name: str) -> Identifier:
+        return self._intern(('identifier', name), Identifier, name)
+
+    def binary(self, left: Node, operator: str, right: Node) -> BinaryOperation:
+        return self._intern((id(left), operator, id(right)), BinaryOperation, left, operator, right)
+
+    def _intern(self, key, cls, *args):
+        self.requests += 1
+        node = self.table.get(key)
+        if node is None:
+            node = self.table[key] = cls(*args)
+        return node
+
+    @property
+    def unique(self) -> int:
+        """Number of distinct expression nodes created"""
+        return len(self.table)
+
+    @property
+    def shared(self) -> int:
+        """Number of requests answered with an existing node"""
+        return self.requests - len(self.table)
+
+    def clear(self):
+        self.table.clear()
+        self.requests = 0
@@ -0,0 +1,113 @@
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import fields, is_dataclass
+
+from ast_nodes import Node
+
+# Phases in the order the compiler runs them
+PHASES = ['lex', 'symbols', 'parse', 'optimize', 'validate', 'print', 'emit']
+
+
+def count_nodes(node) -> int:
+    """Count the distinct AST nodes reachable from node (shared subexpressions count once)"""
+    count = 0
+    seen = set()
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, Node):
+            if id(item) in seen:
+                continue
+            seen.add(id(item))
+            count += 1
+            if is_dataclass(item):
+                for f in fields(item):
+                    stack.append(getattr(item, f.name))
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return count
+
+
+class CompileStats:
+    """Collects per-phase timings, counters and peak memory for one compile.
+
+    An instance is a hook: register it with Lexer.add_hook / Parser.add_hook
+    and it times every phase they report. Phases run outside the lexer and
+    parser (validate, print) are timed with the phase() context manager.
+    """
+
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self.wall = {}
+        self.cpu = {}
+        self.counters = {'tokens': 0, 'lines': 0, 'nodes': 0, 'symbols': 0}
+        self.peak_memory = 0
+        self._open = {}
+        self._started_tracing = False
+
+    def __call__(self, event: str, phase: str, **counts):
+        if event == 'start':
+            self._open[phase] = (time.perf_counter(), time.process_time())
+        elif event == 'end':
+            wall_start, cpu_start = self._open.pop(phase)
+            self.wall[phase] = self.wall.get(phase, 0.0) + time.perf_counter() - wall_start
+            self.cpu[phase] = self.cpu.get(phase, 0.0) + time.process_time() - cpu_start
+            for name, value in counts.items():
+                self.counters[name] = value
+
+    def __enter__(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.trace_memory and tracemalloc.is_tracing():
+            self.peak_memory = max(self.peak_memory, tracemalloc.get_traced_memory()[1])
+            if self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+        return False
+
+    @contextmanager
+    def phase(self, name: str, **counts):
+        """Time a block of code as the given phase"""
+        self('start', name)
+        try:
+            yield self
+        finally:
+            self('end', name, **counts)
+
+    @property
+    def total_wall(self) -> float:
+        return sum(self.wall.values())
+
+    @property
+    def total_cpu(self) -> float:
+        return sum(self.cpu.values())
+
+    def throughput(self):
+        """Return (tokens/sec, lines/sec) over the total wall time"""
+        total = self.total_wall
+        if total <= 0:
+            return 0.0, 0.0
+        return self.counters['tokens'] / total, self.counters['lines'] / total
+
+    def report(self) -> str:
+        ordered = [p for p in PHASES if p in self.wall]
+        ordered += [p for p in self.wall if p not in PHASES]
+
+        lines = ["Compile Statistics:"]
+        lines.append(f"{'Phase':<10} {'Wall (ms)':>12} {'CPU (ms)':>12}")
+        for name in ordered:
+            lines.append(f"{name:<10} {self.wall[name] * 1000:>12.3f} {self.cpu[name] * 1000:>12.3f}")
+        lines.append(f"{'total':<10} {self.total_wall * 1000:>12.3f} {self.total_cpu * 1000:>12.3f}")
+        lines.append("")
+        lines.append(f"Tokens: {self.counters['tokens']}, Lines: {self.counters['lines']}, "
+                     f"Nodes: {self.counters['nodes']}, Symbols: {self.counters['symbols']}")
+        if self.trace_memory:
+            lines.append(f"Peak memory: {self.peak_memory / 1024:.1f} KiB")
+        tokens_per_sec, lines_per_sec = self.throughput()
+        lines.append(f"Throughput: {tokens_per_sec:,.0f} tokens/sec, {lines_per_sec:,.0f} lines/sec")
+        return "\n".join(lines)
@@ -0,0 +1,485 @@
+import operator
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from ast_nodes import Program
+from bytecode import (
+    LOAD_CONST, LOAD_NAME, STORE_NAME, BINARY_OP, JUMP, JUMP_IF_FALSE,
+    CALL, RETURN, POP, STATEMENT, TAIL_CALL, BUILD_LIST, LOAD_INDEX, STORE_INDEX,
+    FOR_TEST, FOR_STEP, VECTOR_FOR, PARALLEL_FOR, BINARY_CONST, CompiledProgram, compile_program
+)
+from typed_list import NumericList, make_list
+
+
+class ExecutionError(Exception):
+    def __init__(self, message: str, line: int):
+        super().__init__(f"Execution error at line {line}: {message}")
+        self.message = message
+        self.line = line
+
+    def __reduce__(self):  # so that PARALLEL FOR workers can raise it
+        return type(self), (self.message, self.line)
+
+
+class BudgetExceeded(ExecutionError):
+    """Raised when a run uses up its ExecutionBudget"""
+
+    def __init__(self, message: str, line: int, executed: int, elapsed: float):
+        super().__init__(message, line)
+        self.executed = executed
+        self.elapsed = elapsed
+
+    def __reduce__(self):
+        return type(self), (self.message, self.line, self.executed, self.elapsed)
+
+
+def _divide(left, right):
+    if right == 0:
+        raise ZeroDivisionError("division by zero")
+    return left / right
+
+
+BINARY_OPERATORS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': _divide,
+    '<': operator.lt,
+    '>': operator.gt,
+    '=': operator.eq,
+    '!=': operator.ne,
+    'and': lambda left, right: bool(left and right),
+    'or': lambda left, right: bool(left or right),
+}
+
+# BINARY_CONST only has a nonzero literal on the right, so '/' needs no zero check
+CONST_OPERATORS = dict(BINARY_OPERATORS, **{'/': operator.truediv})
+
+DEFAULT_BUILTINS = {
+    'print': print,
+}
+
+
+DEFAULT_CACHE_SIZE = 256  # results kept per pure FUNC
+DEFAULT_CHECK_INTERVAL = 10000  # instructions between clock reads under a time budget
+
+_MISSING = object()
+
+
+class Frame:
+    __slots__ = ('code', 'pc', 'locals', 'stack', 'memo')
+
+    def __init__(self, code, variables):
+        self.code = code
+        self.pc = 0
+        self.locals = variables
+        self.stack = []
+        self.memo = None  # (FunctionCache, key) to store the return value under
+
+
+def cache_key(args) -> tuple:
+    """The arguments with their types: 1, 1.0 and True are equal but may give different results"""
+    return tuple([(type(arg), arg) for arg in args])
+
+
+class FunctionCache:
+    """LRU cache of one pure FUNC's results, keyed by cache_key(arguments)"""
+
+    __slots__ = ('size', 'entries', 'hits', 'misses', 'evictions')
+
+    def __init__(self, size: int):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key: tuple):
+        """Cached result for key, or _MISSING; raises TypeError for unhashable arguments"""
+        value = self.entries.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def store(self, key: tuple, value):
+        self.entries[key] = value
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+
+@dataclass
+class ExecutionBudget:
+    """Limits for one run of a program; None means unlimited.
+
+    The budget is checked at jumps and calls, the points every loop and
+    recursion passes through, so a run stops at most one straight stretch of
+    code after crossing a limit. A loop run as array operations (VECTOR_FOR)
+    is charged the instructions its scalar loop would have run, once it has
+    finished. PARALLEL FOR chunks run with what is left of the budget and
+    are charged what they ran. A builtin call counts as one instruction and
+    is not interrupted.
+    """
+    instructions: Optional[int] = None
+    seconds: Optional[float] = None
+    check_interval: int = DEFAULT_CHECK_INTERVAL
+
+    def remaining(self, executed: int, elapsed: float) -> 'ExecutionBudget':
+        """What is left after executed instructions and elapsed seconds"""
+        return ExecutionBudget(None if self.instructions is None else self.instructions - executed,
+                               None if self.seconds is None else self.seconds - elapsed,
+                               self.check_interval)
+
+
+class Interpreter:
+    """Run a CompiledProgram.
+
+    Script calls push a Frame onto a list instead of recursing in Python, so
+    recursion depth is limited only by memory. Tail calls (RETURN CALL f(...))
+    reuse the caller's Frame and do not grow the list at all.
+    Variables are looked up in the current frame, then in the globals.
+    List literals of only ints or only floats are stored unboxed (see typed_list).
+    Calls to FUNCs marked pure are answered from a per-function LRU cache of
+    cache_size entries (0 disables caching).
+    PARALLEL FOR loops run on a pool of `workers` processes (default: one per
+    core), started on first use and shut down when run returns; with one
+    worker their chunks run in this process, so results are the same.
+    Pass an ExecutionProfiler to collect per-statement hit counts and timings.
+    With a budget, each execute() stops with BudgetExceeded once it has run
+    too many instructions or for too long. executed counts the instructions
+    of the last execute().
+    """
+
+    def __init__(self, compiled: CompiledProgram,
+                 builtins: Optional[Dict[str, Callable]] = None, profiler=None,
+                 cache_size: int = DEFAULT_CACHE_SIZE, workers: Optional[int] = None,
+                 budget: Optional[ExecutionBudget] = None):
+        self.compiled = compiled
+        self.builtins = DEFAULT_BUILTINS if builtins is None else builtins
+        self.profiler = profiler
+        self.budget = budget
+        self.executed = 0
+        self.globals = {}
+        self.workers = workers or os.cpu_count() or 1
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.caches: Dict[str, FunctionCache] = {}
+        if cache_size > 0:
+            self.caches = {name: FunctionCache(cache_size)
+                           for name, code in compiled.functions.items() if code.pure}
+
+    def run(self, variables: Optional[Dict[str, object]] = None) -> Dict[str, object]:
+        """Execute the main program and return its global variables"""
+        self.globals = {} if variables is None else variables
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
+        try:
+            self.execute(Frame(self.compiled.main, self.globals))
+        finally:
+            if profiler is not None:
+                profiler.stop()
+            self.close()
+        return self.globals
+
+    def close(self):
+        """Shut down the PARALLEL FOR process pool, if one was started"""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def executor(self) -> Optional[ProcessPoolExecutor]:
+        """The process pool for PARALLEL FOR, or None with a single worker"""
+        if self.workers <= 1:
+            return None
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self.pool
+
+    def next_check(self, executed: int) -> int:
+        """Instruction count at which the budget is checked next"""
+        budget = self.budget
+        if budget is None:
+            return sys.maxsize
+        check_at = executed + budget.check_interval if budget.seconds is not None else sys.maxsize
+        if budget.instructions is not None:
+            check_at = min(check_at, budget.instructions + 1)
+        return check_at
+
+    def check_budget(self, executed: int, started: float, line: int) -> int:
+        """Raise BudgetExceeded if the run is over budget, else return next_check"""
+        budget = self.budget
+        elapsed = time.perf_counter() - started
+        if budget.instructions is not None and executed > budget.instructions:
+            raise BudgetExceeded(f"instruction budget of {budget.instructions:,} exceeded",
+                                 line, executed, elapsed)
+        if budget.seconds is not None and elapsed > budget.seconds:
+            raise BudgetExceeded(f"time budget of {budget.seconds:g}s exceeded after {executed:,} instructions",
+                                 line, executed, elapsed)
+        return self.next_check(executed)
+
+    def execute(self, frame: Frame):
+        functions = self.compiled.functions
+        builtins = self.builtins
+        profiler = self.profiler
+        global_vars = self.globals
+        caches = self.caches
+        frames = []
+
+        code = frame.code
+        instructions = code.instructions
+        variables = frame.locals
+        stack = frame.stack
+        pc = 0
+        # Instructions are counted a straight run at a time: executed holds the
+        # finished runs, the current one started at mark
+        executed = 0
+        mark = 0
+        started = time.perf_counter()
+        check_at = self.next_check(0)
+
+        try:
+            while True:
+                op, arg = instructions[pc]
+                pc += 1
+
+                if op == LOAD_NAME:
+                    if arg in variables:
+                        stack.append(variables[arg])
+                    elif arg in global_vars:
+                        stack.append(global_vars[arg])
+                    else:
+                        raise ExecutionError(f"Undefined variable '{arg}'", code.lines[pc - 1])
+                elif op == LOAD_CONST:
+                    stack.append(arg)
+                elif op == STORE_NAME:
+                    variables[arg] = stack.pop()
+                elif op == BINARY_CONST:
+                    symbol, right = arg
+                    stack[-1] = CONST_OPERATORS[symbol](stack[-1], right)
+                elif op == BINARY_OP:
+                    right = stack.pop()
+                    left = stack.pop()
+                    stack.append(BINARY_OPERATORS[arg](left, right))
+                elif op == STATEMENT:
+                    if profiler is not None:
+                        profiler.statement(code, arg)
+                elif op == JUMP_IF_FALSE:
+                    if not stack.pop():
+                        executed += pc - mark
+                        pc = mark = arg
+                elif op == JUMP:
+                    executed += pc - mark
+                    if executed >= check_at:
+                        mark = pc  # counted, should the check raise
+                        check_at = self.check_budget(executed, started, code.lines[pc - 1])
+                    pc = mark = arg
+                elif op == POP:
+                    stack.pop()
+                elif op == FOR_TEST:
+                    variable, inclusive, exit_pc = arg
+                    value = variables[variable]
+                    end, step = stack[-2], stack[-1]
+                    if step > 0:
+                        more = value <= end if inclusive else value < end
+                    elif step < 0:
+                        more = value >= end if inclusive else value > end
+                    else:
+                        raise ExecutionError("FOR step must not be zero", code.lines[pc - 1])
+                    if not more:
+                        del stack[-2:]
+                        executed += pc - mark
+                        pc = mark = exit_pc
+                elif op == FOR_STEP:
+                    variables[arg] = variables[arg] + stack[-1]
+                elif op == LOAD_INDEX:
+                    index = stack.pop()
+                    target = stack.pop()
+                    if type(target) is NumericList and type(index) is int:
+                        try:
+                            stack.append(target.store[index])
+                            continue
+                        except IndexError:
+                            pass  # NumericList.__getitem__ raises it with the list message
+                    stack.append(target[index])
+                elif op == STORE_INDEX:
+                    value = stack.pop()
+                    index = stack.pop()
+                    target = stack.pop()
+                    if type(target) is NumericList and type(value) is target.kind and type(index) is int:
+                        try:
+                            target.store[index] = value
+                            continue
+                        except (IndexError, ValueError):
+                            pass  # out of range or too wide for int64: the slow path handles both
+                    target[index] = value
+                elif op == BUILD_LIST:
+                    items = stack[len(stack) - arg:]
+                    del stack[len(stack) - arg:]
+                    stack.append(make_list(items))
+                elif op == VECTOR_FOR:
+                    kernel, exit_pc = arg
+                    trips = kernel.run(variables, global_vars, stack[-2], stack[-1])
+                    if trips:
+                        del stack[-2:]
+                        # As many as the scalar loop: trips passes from FOR_TEST to its JUMP, then the exit test
+                        top = pc if instructions[pc][0] == FOR_TEST else pc + 1
+                        executed += top - mark + trips * (exit_pc - top) + 1
+                        mark = pc
+                        if executed >= check_at:
+                            check_at = self.check_budget(executed, started, code.lines[pc - 1])
+                        pc = mark = exit_pc
+                elif op == PARALLEL_FOR:
+                    kernel, exit_pc = arg
+                    executed += pc - mark
+                    mark = pc
+                    budget = None
+                    if self.budget is not None:
+                        budget = self.budget.remaining(executed, time.perf_counter() - started)
+                    try:
+                        ran = kernel.run(self, variables, global_vars, stack[-2], stack[-1], budget)
+                    except BudgetExceeded as e:
+                        executed += e.executed
+                        self.check_budget(executed, started, e.line)
+                        raise
+                    if ran:
+                        del stack[-2:]
+                        executed += ran
+                        if executed >= check_at:
+                            check_at = self.check_budget(executed, started, code.lines[pc - 1])
+                        pc = mark = exit_pc
+                elif op == CALL:
+                    name, argc = arg
+                    args = stack[len(stack) - argc:]
+                    del stack[len(stack) - argc:]
+                    callee = functions.get(name)
+                    if callee is None:
+                        if name not in builtins:
+                            raise ExecutionError(f"Undefined function '{name}'", code.lines[pc - 1])
+                        stack.append(builtins[name](*args))
+                        continue
+                    if argc != len(callee.parameters):
+                        raise ExecutionError(
+                            f"Function '{name}' expects {len(callee.parameters)} arguments, got {argc}",
+                            code.lines[pc - 1])
+                    memo = None
+                    cache = caches.get(name)
+                    if cache is not None:
+                        key = cache_key(args)
+                        try:
+                            value = cache.lookup(key)
+                        except TypeError:
+                            value = _MISSING  # unhashable arguments are never cached
+                        else:
+                            memo = (cache, key)
+                        if value is not _MISSING:
+                            stack.append(value)
+                            continue
+                    executed += pc - mark
+                    if executed >= check_at:
+                        mark = pc  # counted, should the check raise
+                        check_at = self.check_budget(executed, started, code.lines[pc - 1])
+                    frame.pc = pc
+                    frames.append(frame)
+                    frame = Frame(callee, dict(zip(callee.parameters, args)))
+                    frame.memo = memo
+                    code, instructions, variables, stack, pc, mark = (
+                        callee, callee.instructions, frame.locals, frame.stack, 0, 0)
+                    if profiler is not None:
+                        profiler.enter_function(callee)
+                elif op == TAIL_CALL:
+                    name, argc = arg
+                    args = stack[len(stack) - argc:]
+                    del stack[len(stack) - argc:]
+                    callee = functions.get(name)
+                    if callee is None:
+                        # Builtins run as a plain CALL; the RETURN that follows returns the result
+                        if name not in builtins:
+                            raise ExecutionError(f"Undefined function '{name}'", code.lines[pc - 1])
+                        stack.append(builtins[name](*args))
+                        continue
+                    if argc != len(callee.parameters):
+                        raise ExecutionError(
+                            f"Function '{name}' expects {len(callee.parameters)} arguments, got {argc}",
+                            code.lines[pc - 1])
+                    cache = caches.get(name)
+                    if cache is not None:
+                        key = cache_key(args)
+                        try:
+                            value = cache.lookup(key)
+                        except TypeError:
+                            value = _MISSING
+                        else:
+                            if frame.memo is None:
+                                frame.memo = (cache, key)
+                        if value is not _MISSING:
+                            stack.append(value)  # the RETURN that follows returns it
+                            continue
+                    executed += pc - mark
+                    if executed >= check_at:
+                        mark = pc  # counted, should the check raise
+                        check_at = self.check_budget(executed, started, code.lines[pc - 1])
+                    del stack[:]  # e.g. the bounds of an enclosing FOR
+                    if profiler is not None:
+                        profiler.leave_function()
+                        profiler.enter_function(callee)
+                    frame.code = code = callee
+                    frame.locals = variables = dict(zip(callee.parameters, args))
+                    instructions, pc, mark = callee.instructions, 0, 0
+                elif op == RETURN:
+                    value = stack.pop()
+                    if frame.memo is not None:
+                        cache, key = frame.memo
+                        cache.store(key, value)
+                    executed += pc - mark
+                    if not frames:
+                        mark = pc
+                        return value
+                    if profiler is not None:
+                        profiler.leave_function()
+                    frame = frames.pop()
+                    code, instructions, variables, stack, pc = frame.code, frame.code.instructions, frame.locals, frame.stack, frame.pc
+                    mark = pc
+                    stack.append(value)
+                else:
+                    raise ExecutionError(f"Unknown opcode {op}", code.lines[pc - 1])
+        except ExecutionError:
+            raise
+        except (ArithmeticError, TypeError, IndexError) as e:
+            raise ExecutionError(str(e), code.lines[pc - 1]) from e
+        finally:
+            self.executed = executed + pc - mark
+
+
+    def cache_report(self) -> str:
+        """Hit/miss counts of the pure-function caches that were used"""
+        lines = ["Memoization:"]
+        lines.append(f"{'Function':<16} {'Hits':>10} {'Misses':>10} {'Evictions':>10} {'Hit rate':>9}")
+        for name, cache in sorted(self.caches.items()):
+            calls = cache.hits + cache.misses
+            if calls:
+                lines.append(f"{name:<16} {cache.hits:>10} {cache.misses:>10} {cache.evictions:>10} "
+                             f"{cache.hits / calls * 100:>8.1f}%")
+        return "\n".join(lines)
+
+
+def compile_for_execution(program: Program) -> CompiledProgram:
+    """compile_program with pure FUNCs marked for caching"""
+    from analysis import pure_functions  # analysis imports this module
+    return compile_program(program, pure_functions(program))
+
+
+def run_program(program: Program, builtins=None, profiler=None,
+                variables: Optional[Dict[str, object]] = None,
+                cache_size: int = DEFAULT_CACHE_SIZE, workers: Optional[int] = None,
+                budget: Optional[ExecutionBudget] = None) -> Dict[str, object]:
+    """Compile and execute a parsed program, returning its global variables"""
+    interpreter = Interpreter(compile_for_execution(program), builtins, profiler, cache_size, workers, budget)
+    return interpreter.run(variables)
@@ -0,0 +1,366 @@
+"""Whole-program AST optimizations, run after parsing and before later phases."""
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional, Set, Tuple
+
+from ast_nodes import (
+    Node, Program, LetStatement, BinaryOperation,
+    Number, Identifier, IfStatement, CallStatement,
+    WhileStatement, FunctionDefinition, ReturnStatement, ForStatement,
+    IndexAssignment
+)
+from analysis import CallGraphBuilder, SymbolCollector, early_reads, reachable_functions
+from instrumentation import count_nodes
+from visitor import Pass, Transformer, WalkContext, children, run_passes, transform
+
+
+@dataclass
+class DeadCodeReport:
+    removed_functions: List[str] = field(default_factory=list)
+    removed_nodes: int = 0
+    removed_statements: int = 0
+    removed_lines: int = 0
+    removed_symbols: List[str] = field(default_factory=list)
+    total_nodes: int = 0
+
+    def __str__(self):
+        if not self.removed_functions:
+            return "Tree shaking: no unreachable functions"
+        share = self.removed_nodes / self.total_nodes * 100 if self.total_nodes else 0.0
+        return (f"Tree shaking: removed {len(self.removed_functions)} unreachable functions "
+                f"({', '.join(self.removed_functions)}), {self.removed_statements} statements, "
+                f"~{self.removed_lines} lines, {self.removed_nodes} of {self.total_nodes} nodes "
+                f"({share:.1f}%), {len(self.removed_symbols)} symbol table entries")
+
+
+class _NameCollector(Pass):
+    """Every name a program still mentions: variables, parameters and functions"""
+
+    name = 'names'
+
+    def begin(self, root):
+        self.names: Set[str] = set()
+
+    def enter_FunctionDefinition(self, node: FunctionDefinition, ctx: WalkContext):
+        self.names.add(node.name)
+        self.names.update(node.parameters)
+
+    def enter_LetStatement(self, node: LetStatement, ctx: WalkContext):
+        self.names.add(node.identifier)
+
+    def enter_Identifier(self, node: Identifier, ctx: WalkContext):
+        self.names.add(node.name)
+
+    def enter_CallStatement(self, node: CallStatement, ctx: WalkContext):
+        self.names.add(node.function_name)
+
+    def result(self) -> Set[str]:
+        return self.names
+
+
+class _DropFunctions(Transformer):
+    def __init__(self, live: Set[str]):
+        self.live = live
+        self.removed: List[FunctionDefinition] = []
+
+    def transform_FunctionDefinition(self, node: FunctionDefinition) -> Optional[FunctionDefinition]:
+        if node.name in self.live:
+            return node
+        # Nested FUNCs are hoisted, so a dead FUNC that still encloses a live one stays
+        if any(isinstance(stmt, FunctionDefinition) for stmt in _nested_statements(node.body)):
+            return node
+        self.removed.append(node)
+        return None
+
+
+def _nested_statements(statements) -> list:
+    """statements and every statement inside their blocks"""
+    result = []
+    stack = list(statements)
+    while stack:
+        stmt = stack.pop()
+        result.append(stmt)
+        for name in ('then_branch', 'else_branch', 'body'):
+            stack.extend(getattr(stmt, name, None) or ())
+    return result
+
+
+def eliminate_dead_functions(program: Program,
+                             symbol_table: Optional[Dict[str, dict]] = None) -> Tuple[Program, DeadCodeReport]:
+    """Drop FUNCs no CALL reachable from the top-level statements can reach.
+
+    Returns the shaken program and a report of what was removed; entries of
+    symbol_table that only the removed functions mentioned are deleted.
+    """
+    graph = run_passes(program, CallGraphBuilder())['call_graph']
+    live = reachable_functions(graph)
+    report = DeadCodeReport(total_nodes=count_nodes(program))
+    dropper = _DropFunctions(live)
+    shaken = dropper.transform(program)
+
+    # Removal is bottom-up: a dead FUNC nested in another dead FUNC is no
+    # longer in its parent's body when the parent is counted
+    for func in dropper.removed:
+        statements = _nested_statements(func.body)
+        report.removed_functions.append(func.name)
+        report.removed_nodes += count_nodes(func)
+        report.removed_statements += len(statements) + 1
+        last_line = max((stmt.line for stmt in statements), default=func.line)
+        if func.line:
+            report.removed_lines += last_line - func.line + 2  # FUNC header to END
+
+    if symbol_table is not None:
+        remaining = run_passes(shaken, _NameCollector())['names']
+        mentioned = run_passes(Program(list(dropper.removed)), _NameCollector())['names']
+        for name in sorted(mentioned - remaining):
+            if symbol_table.pop(name, None) is not None:
+                report.removed_symbols.append(name)
+    return shaken, report
+
+
+DEFAULT_INLINE_BUDGET = 24  # AST nodes in a FUNC body
+
+
+@dataclass
+class InlineReport:
+    inlined_calls: int = 0
+    functions: Set[str] = field(default_factory=set)
+
+    def __str__(self):
+        if not self.inlined_calls:
+            return "Inlining: no calls inlined"
+        return f"Inlining: inlined {self.inlined_calls} calls to {', '.join(sorted(self.functions))}"
+
+
+class _Substitute(Transformer):
+    """Replace identifiers, all at once, by the expressions they map to"""
+
+    def __init__(self, mapping: Dict[str, Node]):
+        self.mapping = mapping
+
+    def transform_Identifier(self, node: Identifier) -> Node:
+        return self.mapping.get(node.name, node)
+
+
+class _Rename(_Substitute):
+    """Rename a FUNC's locals in an inlined body and move it to the call site's line.
+    Its statements no longer start at their own tokens, so they lose their token index."""
+
+    def __init__(self, names: Dict[str, str], line: int):
+        super().__init__({old: Identifier(new) for old, new in names.items()})
+        self.names = names
+        self.line = line
+
+    def transform_LetStatement(self, node: LetStatement) -> LetStatement:
+        return replace(node, identifier=self.names.get(node.identifier, node.identifier), line=self.line, token=-1)
+
+    def _move(self, node: Node) -> Node:
+        return replace(node, line=self.line, token=-1)
+
+    transform_IfStatement = transform_WhileStatement = _move
+    transform_ReturnStatement = transform_CallStatement = transform_IndexAssignment = _move
+
+    def transform_ForStatement(self, node: ForStatement) -> ForStatement:
+        return replace(node, variable=self.names.get(node.variable, node.variable), line=self.line, token=-1)
+
+
+class _FreeNames(Pass):
+    name = 'free_names'
+
+    def begin(self, root):
+        self.names: Set[str] = set()
+
+    def enter_Identifier(self, node: Identifier, ctx: WalkContext):
+        self.names.add(node.name)
+
+    def result(self) -> Set[str]:
+        return self.names
+
+
+def _contains_call(node: Node) -> bool:
+    return any(isinstance(n, CallStatement) for n in _walk_nodes(node))
+
+
+def _walk_nodes(node: Node):
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        yield item
+        stack.extend(children(item))
+
+
+class _Inliner:
+    def __init__(self, program: Program, budget: int):
+        results = run_passes(program, SymbolCollector(), CallGraphBuilder())
+        self.symbols = results['symbols']
+        graph = results['call_graph']
+        self.report = InlineReport()
+        self.counter = 0
+        self.candidates: Dict[str, FunctionDefinition] = {}
+        self.free: Dict[str, Set[str]] = {}  # names a candidate reads that are not its own locals
+        for name, func in self.symbols.functions.items():
+            if self._inlinable(func, graph, budget) and not early_reads(func) & self.symbols.locals[name]:
+                # A LET target read before its LET is the global there; renaming would break that
+                self.candidates[name] = func
+                reads = run_passes(Program(func.body), _FreeNames())['free_names']
+                self.free[name] = reads - self.symbols.locals[name]
+
+    @staticmethod
+    def _inlinable(func: FunctionDefinition, graph, budget: int) -> bool:
+        if count_nodes(Program(func.body)) - 1 > budget:
+            return False
+        if any(func.name in reachable_functions(graph, callee) for callee in graph.get(func.name, ())):
+            return False  # recursive, directly or through other functions
+        nested = _nested_statements(func.body)
+        returns = [s for s in nested if isinstance(s, ReturnStatement)]
+        if any(isinstance(s, FunctionDefinition) for s in nested):
+            return False
+        # RETURN may only end the body, so the inlined code can fall through
+        return all(s is func.body[-1] for s in returns)
+
+    def _safe(self, callee: str, call: CallStatement, scope: Optional[str]) -> bool:
+        """The call can be inlined without a caller local capturing a global the callee reads"""
+        func = self.candidates.get(callee)
+        if func is None or len(call.arguments) != len(func.parameters):
+            return False
+        return scope is None or not (self.free[callee] & self.symbols.locals.get(scope, set()))
+
+    # Expressions: FUNCs whose body is a single RETURN are substituted in place
+    def expression(self, expr: Node, scope: Optional[str]) -> Node:
+        inliner = self
+
+        class _ExpressionInliner(Transformer):
+            def transform_CallStatement(self, node: CallStatement) -> Node:
+                func = inliner.candidates.get(node.function_name)
+                if func is None or not inliner._safe(node.function_name, node, scope):
+                    return node
+                body = func.body
+                if len(body) != 1 or not isinstance(body[0], ReturnStatement) or body[0].expression is None:
+                    return node
+                if any(_contains_call(arg) for arg in node.arguments):
+                    return node  # arguments may be duplicated or dropped, so they must be pure
+                inliner.report.inlined_calls += 1
+                inliner.report.functions.add(func.name)
+                return transform(body[0].expression, _Substitute(dict(zip(func.parameters, node.arguments))))
+
+        return transform(expr, _ExpressionInliner())
+
+    # Statements: CALL statements and LET/RETURN of a call take the whole body
+    def block(self, statements: List[Node], scope: Optional[str]) -> List[Node]:
+        result = []
+        for stmt in statements:
+            result.extend(self.statement(stmt, scope))
+        return result
+
+    def statement(self, stmt: Node, scope: Optional[str]) -> List[Node]:
+        if isinstance(stmt, FunctionDefinition):
+            return [replace(stmt, body=self.block(stmt.body, stmt.name))]
+        if isinstance(stmt, LetStatement):
+            if isinstance(stmt.expression, CallStatement):
+                inlined = self.body(stmt.expression, scope, lambda value: replace(stmt, expression=value))
+                if inlined is not None:
+                    return inlined
+            return [replace(stmt, expression=self.expression(stmt.expression, scope))]
+        if isinstance(stmt, ReturnStatement):
+            if isinstance(stmt.expression, CallStatement):
+                inlined = self.body(stmt.expression, scope, lambda value: replace(stmt, expression=value))
+                if inlined is not None:
+                    return inlined
+            if stmt.expression is None:
+                return [stmt]
+            return [replace(stmt, expression=self.expression(stmt.expression, scope))]
+        if isinstance(stmt, CallStatement):
+            inlined = self.body(stmt, scope, None)
+            if inlined is not None:
+                return inlined
+            return [replace(stmt, arguments=[self.expression(arg, scope) for arg in stmt.arguments])]
+        if isinstance(stmt, IfStatement):
+            return [replace(stmt, condition=self.expression(stmt.condition, scope),
+                            then_branch=self.block(stmt.then_branch, scope),
+                            else_branch=self.block(stmt.else_branch, scope) if stmt.else_branch else None)]
+        if isinstance(stmt, WhileStatement):
+            return [replace(stmt, condition=self.expression(stmt.condition, scope),
+                            body=self.block(stmt.body, scope))]
+        if isinstance(stmt, ForStatement):
+            step = None if stmt.step is None else self.expression(stmt.step, scope)
+            return [replace(stmt, start=self.expression(stmt.start, scope),
+                            end=self.expression(stmt.end, scope), step=step,
+                            body=self.block(stmt.body, scope))]
+        if isinstance(stmt, IndexAssignment):
+            return [replace(stmt, target=self.expression(stmt.target, scope),
+                            index=self.expression(stmt.index, scope),
+                            expression=self.expression(stmt.expression, scope))]
+        return [stmt]
+
+    def body(self, call: CallStatement, scope: Optional[str], use_result) -> Optional[List[Node]]:
+        """Statements replacing call; use_result(expr) builds the statement consuming
+        the returned value, or is None when the value is discarded"""
+        if not self._safe(call.function_name, call, scope):
+            return None
+        func = self.candidates[call.function_name]
+        last = func.body[-1] if func.body else None
+        returns_value = isinstance(last, ReturnStatement) and last.expression is not None
+        if use_result is not None and not returns_value:
+            return None  # the caller needs a value the body does not produce
+
+        self.counter += 1
+        names = {local: f"{func.name}.{self.counter}.{local}" for local in self.symbols.locals[func.name]}
+        rename = _Rename(names, call.line)
+        statements = [
+            LetStatement(names[param], self.expression(arg, scope), call.line)
+            for param, arg in zip(func.parameters, call.arguments)
+        ]
+        body = func.body[:-1] if isinstance(last, ReturnStatement) else func.body
+        statements += [transform(stmt, rename) for stmt in body]
+        if returns_value:
+            value = transform(last.expression, rename)
+            if use_result is not None:
+                statements.append(replace(use_result(value), line=call.line))
+            elif _contains_call(value):
+                statements.append(LetStatement(f"{func.name}.{self.counter}.result", value, call.line))
+        self.report.inlined_calls += 1
+        self.report.functions.add(func.name)
+        return statements
+
+
+def inline_functions(program: Program, budget: int = DEFAULT_INLINE_BUDGET) -> Tuple[Program, InlineReport]:
+    """Inline CALLs to small, non-recursive FUNCs.
+
+    A FUNC qualifies when its body has at most `budget` nodes, it is not
+    recursive and RETURN appears only as its last statement. CALL statements
+    and LET/RETURN whose whole expression is the call are replaced by the
+    body, with parameters bound to fresh variables and the FUNC's locals
+    renamed so they cannot collide with the caller's. Calls elsewhere in an
+    expression are substituted when the FUNC is a single RETURN and the
+    arguments contain no calls. Run before fold_constants so the inlined
+    arguments can be folded.
+    """
+    inliner = _Inliner(program, budget)
+    if not inliner.candidates:
+        return program, inliner.report
+    return Program(inliner.block(program.statements, None)), inliner.report
+
+
+class ConstantFolder(Transformer):
+    """Evaluate arithmetic on number literals at compile time"""
+
+    def transform_BinaryOperation(self, node: BinaryOperation) -> Node:
+        if not (isinstance(node.left, Number) and isinstance(node.right, Number)):
+            return node
+        operation = FOLDABLE.get(node.operator)
+        if operation is None:
+            return node
+        left, right = node.left.value, node.right.value
+        if node.operator == '/' and right == 0:
+            return node  # leave the error to run time
+        return Number(operation(left, right))
+
+FOLDABLE = {
+    '+': lambda a, b: a + b,
+    '-': lambda a, b: a - b,
+    '*': lambda a, b: a * b,
+    '/': lambda a, b: a / b,
+}
+
+
+def fold_constants(program: Program) -> Program:
+    return ConstantFolder().transform(program)
@@ -0,0 +1,203 @@
+"""Lex and parse one large script on several cores.
+
+The source is pre-scanned for safe split points: top-level statement
+keywords that are outside comments and outside any open IF/WHILE/FOR/FUNC
+block. Each chunk is lexed and parsed in a worker process. The token
+streams, positions, symbol tables and statements are then stitched back in
+order, with positions rebased onto the whole file and each statement's
+first-token index onto the whole token stream. The result is the same as
+a sequential Lexer.tokenize + Parser.parse. If any chunk fails, the whole
+file is compiled sequentially so errors are reported exactly as usual.
+"""
+import os
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import Compiler_Project_phase1 as lexer
+from Compiler_Project_phase2 import Parser
+from ast_nodes import Node, Program
+from visitor import children
+
+# Words and comments, as the lexer sees them; unclosed comments run to the end
+_SCAN = re.compile(r'\{[^}]*\}?|[A-Za-z_][A-Za-z0-9_]*')
+
+_OPENERS = {'IF', 'WHILE', 'FOR', 'FUNC', 'REPEAT'}
+_CLOSERS = {'ENDIF', 'ENDWHILE', 'ENDFOR', 'END', 'UNTIL'}
+# Statement keywords that cannot occur inside an expression (CALL can)
+_SPLIT_KEYWORDS = {'LET', 'IF', 'WHILE', 'FOR', 'FUNC', 'PARALLEL'}
+
+MIN_CHUNK_SIZE = 1 << 16
+
+
+@dataclass
+class CompileResult:
+    tokens: List[tuple]
+    positions: List[tuple]
+    symbol_table: Dict[str, dict]
+    program: Program
+
+
+def find_split_points(source: str) -> List[int]:
+    """Offsets at which a top-level statement starts and the source can be cut"""
+    points = []
+    depth = 0
+    started = False
+    previous = None
+    for match in _SCAN.finditer(source):
+        text = match.group()
+        if text[0] == '{':
+            continue
+        word = text.upper()
+        if not started:
+            if word != 'BEGIN':
+                return []
+            started = True
+        elif depth == 0 and word in _SPLIT_KEYWORDS and previous not in ('RETURN', 'PARALLEL'):
+            points.append(match.start())
+
+        if word in _OPENERS:
+            depth += 1
+        elif word in _CLOSERS:
+            if depth == 0:
+                if word == 'END':
+                    break  # end of the program
+                return points  # unbalanced; the parser will report it
+            depth -= 1
+        previous = word
+    return points
+
+
+def plan_chunks(source: str, chunks: int, min_size: int = MIN_CHUNK_SIZE) -> List[Tuple[int, int]]:
+    """Cut source into at most `chunks` (start, end) ranges of similar size at safe split points"""
+    count = min(chunks, max(1, len(source) // max(min_size, 1)))
+    if count <= 1:
+        return [(0, len(source))]
+    points = find_split_points(source)
+    cuts = []
+    index = 0
+    for target in (len(source) * i // count for i in range(1, count)):
+        while index < len(points) and points[index] < target:
+            index += 1
+        if index == len(points):
+            break
+        if not cuts or points[index] > cuts[-1]:
+            cuts.append(points[index])
+    bounds = [0] + cuts + [len(source)]
+    return list(zip(bounds, bounds[1:]))
+
+
+def compile_chunk(text: str, base: Tuple[int, int, int], first: bool, last: bool):
+    """Lex and parse one chunk; base is the (offset, line, column) of its first character"""
+    lex = lexer.Lexer(text)
+    tokens = lex.tokenize()
+    base_offset, base_line, base_column = base
+    positions = [
+        (offset + base_offset, line + base_line - 1, column + base_column - 1 if line == 1 else column)
+        for offset, line, column in lex.token_positions
+    ]
+    parser = Parser(tokens, positions)
+    if first and not parser.match('begin'):
+        parser.error("Expected 'BEGIN' at start of program")
+    statements = parser.parse_statement_list()
+    if last:
+        if not parser.match('end'):
+            parser.error("Expected 'END' at end of program")
+    elif not parser.is_at_end():
+        parser.error("Unexpected token in chunk")
+    return tokens, positions, lex.symbol_table, statements
+
+
+def _rebase_tokens(statements: List[Node], offset: int):
+    """Shift the first-token index of statements, and of those nested in them, by offset"""
+    stack = list(statements)
+    while stack:
+        node = stack.pop()
+        if getattr(node, 'token', -1) >= 0:
+            node.token += offset
+        stack.extend(children(node))
+
+
+def _position_of(source: str, offset: int) -> Tuple[int, int, int]:
+    line = source.count('\n', 0, offset) + 1
+    column = offset - (source.rfind('\n', 0, offset) + 1) + 1
+    return offset, line, column
+
+
+def sequential_compile(source: str) -> CompileResult:
+    lex = lexer.Lexer(source)
+    tokens = lex.tokenize()
+    lex.update_symbol_table_types()
+    program = Parser(tokens, lex.token_positions).parse()
+    return CompileResult(tokens, lex.token_positions, lex.symbol_table, program)
+
+
+def parallel_compile(source: str, workers: Optional[int] = None,
+                     executor: Optional[Executor] = None,
+                     min_chunk_size: int = MIN_CHUNK_SIZE) -> CompileResult:
+    """Compile source in parallel chunks; identical to sequential_compile"""
+    workers = workers or os.cpu_count() or 1
+    ranges = plan_chunks(source, workers, min_chunk_size)
+    if len(ranges) == 1:
+        return sequential_compile(source)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(ranges)))
+    try:
+        futures = [
+            executor.submit(compile_chunk, source[start:end], _position_of(source, start),
+                            index == 0, index == len(ranges) - 1)
+            for index, (start, end) in enumerate(ranges)
+        ]
+        parts = [future.result() for future in futures]
+    except Exception:
+        return sequential_compile(source)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    tokens, positions, statements = [], [], []
+    symbol_table = {}
+    for chunk_tokens, chunk_positions, chunk_symbols, chunk_statements in parts:
+        _rebase_tokens(chunk_statements, len(tokens))
+        tokens.extend(chunk_tokens)
+        positions.extend(chunk_positions)
+        statements.extend(chunk_statements)
+        for name, entry in chunk_symbols.items():
+            if name not in symbol_table:
+                symbol_table[name] = entry
+
+    # Symbol typing looks across statements (CALL arguments, FUNC parameters), so it runs on the stitched stream
+    lex = lexer.Lexer('')
+    lex.tokens, lex.token_positions, lex.symbol_table = tokens, positions, symbol_table
+    lex.update_symbol_table_types()
+    return CompileResult(tokens, positions, symbol_table, Program(statements))
+
+
+def main():
+    import time
+
+    body = []
+    for i in range(60000):
+        body.append(f"LET v{i % 100} = (a + b) * {i % 7} - c / 2  {{ statement {i} }}")
+        if i % 1000 == 0:
+            body.append(f"FUNC f{i}(x, y) BEGIN\n  WHILE x < y DO\n    LET x = x + 1\n  ENDWHILE\n  RETURN x\nEND")
+    source = "BEGIN\n" + "\n".join(body) + "\nEND\n"
+
+    start = time.perf_counter()
+    expected = sequential_compile(source)
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = parallel_compile(source)
+    parallel = time.perf_counter() - start
+
+    assert result == expected, "parallel result differs from sequential"
+    print(f"{len(source):,} bytes, {len(expected.tokens):,} tokens")
+    print(f"sequential: {sequential:.2f}s  parallel ({os.cpu_count()} workers): {parallel:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
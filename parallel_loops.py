@@ -0,0 +1,355 @@
+"""Run PARALLEL FOR loops on several cores.
+
+plan_parallel checks at compile time that no iteration of a PARALLEL FOR
+can see another's effects:
+- lists are written only as LET a[i] = ... at the loop variable and read
+  only as a[i];
+- every other variable the body assigns is assigned before it is read, on
+  every path through the iteration, so each iteration starts afresh;
+- except reductions: variables updated only as LET s = s + e, s - e
+  (s += e, s -= e) or s * e (s *= e) and read nowhere else;
+- CALLs go to pure FUNCs only (see analysis.PurityAnalysis), and the body
+  does not RETURN.
+A PARALLEL FOR that fails a check is a compile error.
+
+At run time ParallelLoop.run cuts the iterations into CHUNKS contiguous
+chunks and runs them on the interpreter's process pool, or one after
+another in this process when it has a single worker. Every chunk starts
+its reductions at 0 or 1 and the partial results are combined with the
+initial value in chunk order; list elements are copied back chunk by chunk
+and other variables keep the value from the last iteration that assigned
+them. The chunking does not depend on the number of workers, so results are
+the same on every machine: integer results equal the serial ones, float
+reductions may round differently, as with any reordering of a sum. If
+anything fails (an error in a chunk, bounds that are not integers, an index
+out of range, two names for one list) nothing has been changed yet and the
+loop runs serially instead, reporting errors exactly as usual. Under an
+ExecutionBudget each group of chunks runs with what is left of it; a group
+that runs out raises BudgetExceeded and the groups not yet started are
+cancelled.
+"""
+import pickle
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from ast_nodes import (
+    Node, Program, LetStatement, BinaryOperation, Identifier,
+    IfStatement, CallStatement, WhileStatement, FunctionDefinition,
+    ReturnStatement, ForStatement, ListLiteral, IndexExpression, IndexAssignment
+)
+from typed_list import NumericList
+
+CHUNKS = 32  # fixed, so that results do not depend on the number of workers
+REDUCTIONS = {'+': '+', '-': '+', '*': '*'}  # update operator -> how partial results combine
+IDENTITY = {'+': 0, '*': 1}
+
+# Bounds of one chunk; the '.' keeps them apart from script variables
+START, STOP, STEP = 'parallel.start', 'parallel.stop', 'parallel.step'
+
+_MISSING = object()
+
+
+def _is_name(expr: Node, name: str) -> bool:
+    return isinstance(expr, Identifier) and expr.name == name
+
+
+def _names(expr: Node) -> Set[str]:
+    result = set()
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Identifier):
+            result.add(node.name)
+        elif isinstance(node, BinaryOperation):
+            stack += [node.left, node.right]
+        elif isinstance(node, IndexExpression):
+            stack += [node.target, node.index]
+        elif isinstance(node, CallStatement):
+            stack += node.arguments
+        elif isinstance(node, ListLiteral):
+            stack += node.elements
+    return result
+
+
+def _reduction(stmt: LetStatement) -> Optional[Tuple[str, Node]]:
+    """(combining operator, e) when stmt is LET s = s op e, or e op s for + and *"""
+    expr = stmt.expression
+    if not isinstance(expr, BinaryOperation) or expr.operator not in REDUCTIONS:
+        return None
+    if _is_name(expr.left, stmt.identifier):
+        other = expr.right
+    elif expr.operator != '-' and _is_name(expr.right, stmt.identifier):
+        other = expr.left
+    else:
+        return None
+    if stmt.identifier in _names(other):
+        return None
+    return REDUCTIONS[expr.operator], other
+
+
+def _positions(start: int, stop: int, step: int) -> slice:
+    """The elements of RANGE(start, stop, step) as an ascending slice"""
+    indexes = range(start, stop, step)
+    if step > 0:
+        return slice(indexes[0], indexes[-1] + 1, step)
+    return slice(indexes[-1], indexes[0] + 1, -step)
+
+
+class _Planner:
+    def __init__(self, loop: ForStatement, pure: Set[str]):
+        self.loop = loop
+        self.variable = loop.variable
+        self.pure = pure
+        self.forms: Dict[str, List[Optional[str]]] = {}  # variable -> reduction operator of each assignment
+        self.written: Set[str] = set()
+        self.reductions: Dict[str, str] = {}
+        self.temps: Set[str] = set()
+        self.reads: Set[str] = set()
+
+    def fail(self, reason: str):
+        raise Exception(f"Compile error at line {self.loop.line}: PARALLEL FOR {self.variable}: {reason}")
+
+    def plan(self) -> 'ParallelLoop':
+        self.collect(self.loop.body)
+        if self.variable in self.forms:
+            self.fail(f"the body assigns the loop variable '{self.variable}'")
+        for name, forms in self.forms.items():
+            if None not in forms and len(set(forms)) == 1:
+                self.reductions[name] = forms[0]
+            else:
+                self.temps.add(name)
+        for name in self.written & set(self.forms):
+            self.fail(f"'{name}' is both a list written at [{self.variable}] and a variable")
+        self.block(self.loop.body, frozenset())
+        return ParallelLoop(self.loop, self.reads, self.written, self.reductions, self.temps)
+
+    def collect(self, statements: List[Node]):
+        """Record every assignment in statements, including nested blocks"""
+        for stmt in statements:
+            if isinstance(stmt, LetStatement):
+                reduction = _reduction(stmt)
+                self.forms.setdefault(stmt.identifier, []).append(reduction and reduction[0])
+            elif isinstance(stmt, IndexAssignment):
+                if not isinstance(stmt.target, Identifier) or not _is_name(stmt.index, self.variable):
+                    self.fail(f"list elements may only be assigned as LET a[{self.variable}] = ...")
+                self.written.add(stmt.target.name)
+            elif isinstance(stmt, IfStatement):
+                self.collect(stmt.then_branch)
+                self.collect(stmt.else_branch or [])
+            elif isinstance(stmt, WhileStatement):
+                self.collect(stmt.body)
+            elif isinstance(stmt, ForStatement):
+                self.forms.setdefault(stmt.variable, []).append(None)
+                self.collect(stmt.body)
+            elif isinstance(stmt, ReturnStatement):
+                self.fail("RETURN inside the loop")
+            elif isinstance(stmt, FunctionDefinition):
+                self.fail("FUNC inside the loop")
+
+    def block(self, statements: List[Node], defined: frozenset) -> frozenset:
+        """Check statements given the variables assigned on every path so far; returns the new set"""
+        for stmt in statements:
+            if isinstance(stmt, LetStatement):
+                if stmt.identifier in self.reductions:
+                    self.expression(_reduction(stmt)[1], defined)
+                else:
+                    self.expression(stmt.expression, defined)
+                    defined = defined | {stmt.identifier}
+            elif isinstance(stmt, IndexAssignment):
+                self.expression(stmt.expression, defined)
+            elif isinstance(stmt, IfStatement):
+                self.expression(stmt.condition, defined)
+                then_defined = self.block(stmt.then_branch, defined)
+                else_defined = self.block(stmt.else_branch or [], defined)
+                defined = then_defined & else_defined
+            elif isinstance(stmt, WhileStatement):
+                self.expression(stmt.condition, defined)
+                self.block(stmt.body, defined)
+            elif isinstance(stmt, ForStatement):
+                for bound in (stmt.start, stmt.end, stmt.step):
+                    if bound is not None:
+                        self.expression(bound, defined)
+                defined = defined | {stmt.variable}
+                self.block(stmt.body, defined)
+            elif isinstance(stmt, CallStatement):
+                self.expression(stmt, defined)
+        return defined
+
+    def expression(self, expr: Node, defined: frozenset):
+        stack = [expr]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Identifier):
+                self.read(node.name, defined)
+            elif isinstance(node, IndexExpression):
+                if isinstance(node.target, Identifier) and node.target.name in self.written:
+                    if not _is_name(node.index, self.variable):
+                        self.fail(f"reads {node.target.name}[...] at an index other than {self.variable}")
+                else:
+                    stack += [node.target, node.index]
+            elif isinstance(node, CallStatement):
+                if node.function_name not in self.pure:
+                    self.fail(f"calls '{node.function_name}', which is not a pure FUNC")
+                stack += node.arguments
+            elif isinstance(node, BinaryOperation):
+                stack += [node.left, node.right]
+            elif isinstance(node, ListLiteral):
+                stack += node.elements
+
+    def read(self, name: str, defined: frozenset):
+        if name == self.variable:
+            return
+        if name in self.reductions:
+            self.fail(f"reads the reduction variable '{name}' outside its update")
+        if name in self.written:
+            self.fail(f"uses the list '{name}' other than as {name}[{self.variable}]")
+        if name in self.temps:
+            if name not in defined:
+                self.fail(f"may read '{name}' before assigning it, i.e. from an earlier iteration")
+            return
+        self.reads.add(name)
+
+
+def plan_parallel(loop: ForStatement, pure: Set[str]) -> 'ParallelLoop':
+    """A ParallelLoop for a PARALLEL FOR; raises if its iterations may depend on each other"""
+    return _Planner(loop, set(pure)).plan()
+
+
+class ParallelLoop:
+    def __init__(self, loop: ForStatement, reads: Set[str], written: Set[str],
+                 reductions: Dict[str, str], temps: Set[str]):
+        self.variable = loop.variable
+        self.inclusive = loop.inclusive
+        # One chunk: the same body over RANGE(start, stop, step)
+        self.chunk = ForStatement(loop.variable, Identifier(START), Identifier(STOP), Identifier(STEP),
+                                  loop.body, inclusive=False, line=loop.line)
+        self.reads = reads
+        self.written = written
+        self.reductions = reductions
+        self.temps = temps
+
+    def __repr__(self):
+        return f"ParallelLoop({self.variable!r})"
+
+    def run(self, interpreter, variables: dict, global_vars: dict, end, step, budget=None) -> int:
+        """Execute the whole loop in chunks, on interpreter's process pool if it has one, and
+        return the instructions the serial loop would have run from its first FOR_TEST;
+        0 (with nothing changed) to run it serially"""
+        from interpreter import BudgetExceeded  # interpreter imports this module through bytecode
+        start = variables[self.variable]
+        if type(start) is not int or type(end) is not int or type(step) is not int or step == 0:
+            return 0
+        stop = end + (1 if step > 0 else -1) if self.inclusive else end
+        trips = len(range(start, stop, step))
+        if trips < 2:
+            return 0
+
+        env = {}
+        for name in self.reads | self.written | set(self.reductions):
+            value = variables.get(name, _MISSING)
+            if value is _MISSING:
+                value = global_vars.get(name, _MISSING)
+            if value is not _MISSING:
+                env[name] = value
+        if any(name not in env for name in self.written | set(self.reductions)):
+            return 0  # the serial loop reports the undefined variable
+        low, high = min(start, start + (trips - 1) * step), max(start, start + (trips - 1) * step)
+        owners = {}
+        for name, value in env.items():
+            owner = value.store.obj if isinstance(value, NumericList) and value.kind is not None else value
+            if owners.setdefault(id(owner), name) != name and (name in self.written or owners[id(owner)] in self.written):
+                return 0  # one list under two names: chunks would see each other's writes
+        for name in self.written:
+            items = env[name]
+            if not isinstance(items, (list, NumericList)) or low < 0 or high >= len(items):
+                return 0
+            if any(type(value) is list and any(element is items for element in value)
+                   for value in env.values()):
+                return 0  # also reachable as an element of another list
+
+        count = min(CHUNKS, trips)
+        cuts = [start + trips * k // count * step for k in range(count + 1)]
+        chunks = list(zip(cuts, cuts[1:]))
+        executor = interpreter.executor()
+        workers = 1 if executor is None else min(interpreter.workers, count)
+        groups = [list(range(w, count, workers)) for w in range(workers)]  # interleaved, for balance
+        results = [None] * count
+        futures = []
+        try:
+            if executor is None:
+                # The same chunks, combined the same way; env is copied as if sent to a worker
+                parts = [_run_chunks(self.chunk, interpreter.compiled.functions,
+                                     pickle.loads(pickle.dumps(env, pickle.HIGHEST_PROTOCOL)),
+                                     self.reductions, self.temps, self.written, step, chunks, budget)]
+            else:
+                for group in groups:
+                    futures.append(executor.submit(_run_chunks, self.chunk, interpreter.compiled.functions, env,
+                                                   self.reductions, self.temps, self.written, step,
+                                                   [chunks[k] for k in group], budget))
+                parts = [future.result() for future in futures]
+            executed = 0
+            for group, part in zip(groups, parts):
+                if part is None:
+                    return 0
+                for k, result in zip(group, part[0]):
+                    results[k] = result
+                executed += part[1]
+            totals = {}
+            for name, combine in self.reductions.items():
+                value = env[name]
+                for partials, _, _ in results:
+                    value = value + partials[name] if combine == '+' else value * partials[name]
+                totals[name] = value
+        except BudgetExceeded:
+            for future in futures:
+                future.cancel()  # those already running stop at their own budget
+            raise
+        except Exception:
+            for future in futures:
+                future.cancel()
+            return 0
+
+        for (lo, hi), (_, assigned, slices) in zip(chunks, results):
+            for name in self.written:
+                env[name][_positions(lo, hi, step)] = slices[name]
+            variables.update(assigned)
+        variables.update(totals)
+        variables[self.variable] = start + trips * step
+        return executed + 1  # as the serial loop, which ends with a failing FOR_TEST
+
+
+def _run_chunks(loop: ForStatement, functions, env: dict, reductions: Dict[str, str],
+                temps: Set[str], written: Set[str], step: int, chunks: List[Tuple[int, int]], budget=None):
+    """Run chunks of a PARALLEL FOR, in a worker process or in-line, and return their results
+    with the instructions their trips ran; None if any of them fails. The chunks share budget."""
+    from bytecode import FOR_TEST, CodeGenerator, CompiledProgram  # bytecode imports this module
+    from interpreter import BudgetExceeded, Interpreter
+    started = time.perf_counter()
+    executed = 0
+    try:
+        pure = {name for name, code in functions.items() if code.pure}
+        main = CodeGenerator(pure).compile(Program([loop])).main
+        # Instructions a chunk runs besides its trips: up to the loop, the exit test, LOAD_CONST None, RETURN
+        setup = [op for op, _ in main.instructions].index(FOR_TEST) + 3
+        interpreter = Interpreter(CompiledProgram(main, functions), workers=1)
+        results = []
+        for lo, hi in chunks:
+            variables = dict(env)
+            variables.update((name, IDENTITY[combine]) for name, combine in reductions.items())
+            variables.update({START: lo, STOP: hi, STEP: step})
+            if budget is not None:
+                interpreter.budget = budget.remaining(executed, time.perf_counter() - started)
+            try:
+                interpreter.run(variables)
+            finally:
+                executed += interpreter.executed
+            executed -= setup  # charged as trips of one serial loop
+            partials = {name: variables[name] for name in reductions}
+            assigned = {name: variables[name] for name in temps if name in variables}
+            slices = {name: variables[name][_positions(lo, hi, step)] for name in written}
+            results.append((partials, assigned, slices))
+        return results, executed
+    except BudgetExceeded as e:
+        raise BudgetExceeded(e.message, e.line, executed, time.perf_counter() - started) from None
+    except Exception:
+        return None
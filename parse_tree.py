@@ -0,0 +1,231 @@
+"""Concrete parse trees, built only as far as they are read.
+
+A ParseTreeNode is a label, e.g. 'declare_statement' or 'id: x', and its
+children. concrete_tree() derives one from a parsed Program. Each node wraps
+part of the AST and creates its children the first time they are read, so
+walking or printing a few levels builds only those levels. Given the
+lexer's token positions, statements carry the (offset, line, column) of
+their first token, found from the token index the Parser stored on them.
+"""
+from typing import Iterator, List, Optional, Tuple
+
+from ast_nodes import (
+    Node, Program, LetStatement, BinaryOperation,
+    Number, Identifier, IfStatement, CallStatement,
+    WhileStatement, FunctionDefinition, ReturnStatement, ForStatement,
+    ListLiteral, IndexExpression, IndexAssignment
+)
+
+Position = Tuple[int, int, int]  # (offset, line, column), as in Lexer.token_positions
+
+
+class ParseTreeNode:
+    __slots__ = ('label', 'position', '_children')
+
+    def __init__(self, label: str, position: Optional[Position] = None,
+                 children: Optional[List['ParseTreeNode']] = None):
+        self.label = label
+        self.position = position
+        self._children = children
+
+    @property
+    def children(self) -> List['ParseTreeNode']:
+        if self._children is None:
+            self._children = self.expand()
+        return self._children
+
+    @property
+    def expanded(self) -> bool:
+        """Whether the children exist yet"""
+        return self._children is not None
+
+    def expand(self) -> List['ParseTreeNode']:
+        """Create the children; called on first access"""
+        return []
+
+    def add_child(self, child: 'ParseTreeNode'):
+        self.children.append(child)
+
+    def walk(self, max_depth: Optional[int] = None) -> Iterator[Tuple[int, 'ParseTreeNode']]:
+        """(depth, node) for this node and its descendants in preorder, at most max_depth levels down"""
+        stack = [(0, self)]
+        while stack:
+            depth, node = stack.pop()
+            yield depth, node
+            if max_depth is None or depth < max_depth:
+                stack.extend((depth + 1, child) for child in reversed(node.children))
+
+    def render(self, max_depth: Optional[int] = None) -> str:
+        lines = []
+        for depth, node in self.walk(max_depth):
+            prefix = "|   " * (depth - 1) + "|-- " if depth else ""
+            where = f"  (line {node.position[1]}, column {node.position[2]})" if node.position else ""
+            lines.append(prefix + node.label + where)
+        return "\n".join(lines) + "\n"
+
+    def __str__(self):
+        return self.render()
+
+
+def _leaf(label: str) -> ParseTreeNode:
+    return ParseTreeNode(label, None, [])
+
+
+class _Context:
+    """What the nodes of one concrete tree share"""
+
+    def __init__(self, positions: Optional[List[Position]]):
+        self.positions = positions
+
+    def position(self, node: Node) -> Optional[Position]:
+        """Where node's first token is; None for nodes the parser did not create, e.g. inlined code"""
+        token = getattr(node, 'token', -1)
+        if self.positions is None or token < 0:
+            return None
+        return self.positions[token]
+
+
+_LABELS = {
+    Program: "Program",
+    LetStatement: "declare_statement",
+    IndexAssignment: "element_assignment",
+    IfStatement: "if_statement",
+    WhileStatement: "while_statement",
+    ForStatement: "for_statement",
+    FunctionDefinition: "function_definition",
+    ReturnStatement: "return_statement",
+    CallStatement: "call_statement",
+    BinaryOperation: "expression",
+    ListLiteral: "list",
+    IndexExpression: "index",
+}
+
+
+def _label(node: Node) -> str:
+    if isinstance(node, Number):
+        return f"number: {node.value}"
+    if isinstance(node, Identifier):
+        return f"id: {node.name}"
+    return _LABELS.get(type(node), node.__class__.__name__)
+
+
+class ASTParseTreeNode(ParseTreeNode):
+    """The concrete subtree for one AST node, expanded on demand"""
+    __slots__ = ('node', 'context')
+
+    def __init__(self, node: Node, context: _Context):
+        super().__init__(_label(node), context.position(node),
+                         [] if isinstance(node, (Number, Identifier)) else None)
+        self.node = node
+        self.context = context
+
+    def expand(self) -> List[ParseTreeNode]:
+        return getattr(self, 'expand_' + self.node.__class__.__name__)(self.node)
+
+    def child(self, node: Node) -> ParseTreeNode:
+        return ASTParseTreeNode(node, self.context)
+
+    def statements(self, label: str, statements: List[Node]) -> ParseTreeNode:
+        return _StatementsNode(label, statements, self.context)
+
+    def condition(self, node: Node) -> ParseTreeNode:
+        return ParseTreeNode("condition", None, [self.child(node)])
+
+    def expand_Program(self, node: Program):
+        return [self.statements("statements_block", node.statements), _leaf("End")]
+
+    def expand_LetStatement(self, node: LetStatement):
+        return [_leaf("let: LET"), _leaf(f"id: {node.identifier}"), _leaf("equal: ="), self.child(node.expression)]
+
+    def expand_IndexAssignment(self, node: IndexAssignment):
+        return [_leaf("let: LET"), self.child(node.target), _leaf("left_bracket: ["), self.child(node.index),
+                _leaf("right_bracket: ]"), _leaf("equal: ="), self.child(node.expression)]
+
+    def expand_IfStatement(self, node: IfStatement):
+        children = [_leaf("if: IF"), self.condition(node.condition),
+                    ParseTreeNode("then_statement", None,
+                                  [_leaf("then: THEN"), self.statements("statements", node.then_branch)])]
+        if node.else_branch:
+            children.append(ParseTreeNode("else_statement", None,
+                                          [_leaf("else: ELSE"), self.statements("statements", node.else_branch)]))
+        children.append(_leaf("endif: ENDIF"))
+        return children
+
+    def expand_WhileStatement(self, node: WhileStatement):
+        return [_leaf("while: WHILE"), self.condition(node.condition), _leaf("do: DO"),
+                self.statements("statements", node.body), _leaf("endwhile: ENDWHILE")]
+
+    def expand_ForStatement(self, node: ForStatement):
+        children = [_leaf("parallel: PARALLEL")] if node.parallel else []
+        children += [_leaf("for: FOR"), _leaf(f"id: {node.variable}")]
+        if node.inclusive:
+            children += [_leaf("equal: ="), self.child(node.start), _leaf("to: TO"), self.child(node.end)]
+            if node.step is not None:
+                children += [_leaf("step: STEP"), self.child(node.step)]
+        else:
+            children += [_leaf("in: IN"), _leaf("range: RANGE"), _leaf("left_paren: ("),
+                         self.child(node.start), _leaf("comma: ,"), self.child(node.end)]
+            if node.step is not None:
+                children += [_leaf("comma: ,"), self.child(node.step)]
+            children.append(_leaf("right_paren: )"))
+        children += [_leaf("do: DO"), self.statements("statements", node.body), _leaf("endfor: ENDFOR")]
+        return children
+
+    def expand_FunctionDefinition(self, node: FunctionDefinition):
+        params = []
+        for i, param in enumerate(node.parameters):
+            if i:
+                params.append(_leaf("comma: ,"))
+            params.append(_leaf(f"id: {param}"))
+        return [_leaf("func: FUNC"), _leaf(f"id: {node.name}"), _leaf("left_paren: ("),
+                ParseTreeNode("params", None, params), _leaf("right_paren: )"), _leaf("begin: BEGIN"),
+                self.statements("statements", node.body), _leaf("end: END")]
+
+    def expand_ReturnStatement(self, node: ReturnStatement):
+        children = [_leaf("return: RETURN")]
+        if node.expression is not None:
+            children.append(self.child(node.expression))
+        return children
+
+    def expand_CallStatement(self, node: CallStatement):
+        args = []
+        for i, arg in enumerate(node.arguments):
+            if i:
+                args.append(_leaf("comma: ,"))
+            args.append(self.child(arg))
+        return [_leaf("call: CALL"), _leaf(f"id: {node.function_name}"), _leaf("left_paren: ("),
+                ParseTreeNode("args", None, args), _leaf("right_paren: )")]
+
+    def expand_BinaryOperation(self, node: BinaryOperation):
+        return [self.child(node.left), _leaf(f"operation: {node.operator}"), self.child(node.right)]
+
+    def expand_ListLiteral(self, node: ListLiteral):
+        children = [_leaf("left_bracket: [")]
+        for i, element in enumerate(node.elements):
+            if i:
+                children.append(_leaf("comma: ,"))
+            children.append(self.child(element))
+        children.append(_leaf("right_bracket: ]"))
+        return children
+
+    def expand_IndexExpression(self, node: IndexExpression):
+        return [self.child(node.target), _leaf("left_bracket: ["), self.child(node.index),
+                _leaf("right_bracket: ]")]
+
+
+class _StatementsNode(ParseTreeNode):
+    """A block; its statements' subtrees are created when the block is read"""
+    __slots__ = ('statements', 'context')
+
+    def __init__(self, label: str, statements: List[Node], context: _Context):
+        super().__init__(label)
+        self.statements = statements
+        self.context = context
+
+    def expand(self) -> List[ParseTreeNode]:
+        return [ASTParseTreeNode(stmt, self.context) for stmt in self.statements]
+
+
+def concrete_tree(program: Program, positions: Optional[List[Position]] = None) -> ParseTreeNode:
+    """The parse tree of program, unexpanded; positions is the Lexer.token_positions it was parsed from"""
+    return ASTParseTreeNode(program, _Context(positions))
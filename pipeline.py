@@ -0,0 +1,396 @@
+"""Compile a script one top-level statement at a time, in bounded memory.
+
+The source is read in chunks and lexed lazily, and the parser hands over each
+top-level statement as soon as its last token is consumed. The statement is
+then checked, constant-folded and emitted before the next one is parsed, and
+nothing keeps a reference to it afterwards, so peak memory follows the
+largest statement rather than the size of the file.
+
+Emitters:
+
+    tree      the parse tree, as Compiler_Project_phase2 prints it
+    ast       the binary format of serialization.py
+    bytecode  the disassembly listing of the compiled program
+
+The checks are those of analysis.check_program. What they need from the rest
+of the file is kept per name: the globals assigned and the parameter counts
+of the FUNCs defined so far. A variable read before any assignment, or a CALL
+to a FUNC defined further down, waits as (name, line) until the end of the
+file and is only reported if the name never gets defined. Purity, which
+decides whether a PARALLEL FOR may call a FUNC, only knows the FUNCs defined
+above the statement being compiled.
+
+    python pipeline.py big.lang --emit ast -o big.ast --stats
+"""
+import argparse
+import shutil
+import sys
+import tempfile
+from contextlib import nullcontext
+from itertools import islice
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Set, TextIO, Tuple
+
+import Compiler_Project_phase1 as lexer
+from Compiler_Project_phase2 import Parser
+from analysis import Diagnostic, SymbolCollector, _ScopedPass, pure_functions
+from ast_nodes import Node, Program, Identifier, CallStatement, FunctionDefinition, statement_entry
+from bytecode import LOAD_CONST, RETURN, MAIN, CodeGenerator, CodeObject, disassemble_instruction, relocate
+from instrumentation import CompileStats, count_nodes
+from interpreter import DEFAULT_BUILTINS
+from optimize import ConstantFolder
+from serialization import ASTWriter
+from visitor import WalkContext, run_passes, walk
+
+DEFAULT_CHUNK_SIZE = 1 << 16  # characters of source read at a time
+
+
+class ChunkedLexer(lexer.Lexer):
+    """Lexer over a text stream that holds one chunk of the source at a time.
+    position is still the offset into the whole source."""
+
+    def __init__(self, stream: TextIO, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.chunk = ''
+        self.chunk_start = 0  # source offset of chunk[0]
+        super().__init__('')
+
+    def char_at(self, position: int) -> Optional[str]:
+        index = position - self.chunk_start
+        if index >= len(self.chunk):
+            # Read on, keeping the current character onwards
+            keep = min(self.position - self.chunk_start, len(self.chunk))
+            self.chunk = self.chunk[keep:] + self.stream.read(self.chunk_size)
+            self.chunk_start += keep
+            index = position - self.chunk_start
+            if index >= len(self.chunk):
+                return None
+        return self.chunk[index]
+
+    def advance(self):
+        self.position += 1
+        index = self.position - self.chunk_start
+        self.current_char = self.chunk[index] if index < len(self.chunk) else self.char_at(self.position)
+        if self.current_char == '\n':
+            self.current_line += 1
+            self.current_column = 0
+        elif self.current_char is not None:
+            self.current_column += 1
+
+    def peek(self):
+        return self.char_at(self.position + 1)
+
+
+class TokenWindow:
+    """The tokens of a stream, indexed by their position in the whole stream.
+    Tokens are pulled from the lexer as the parser reaches them and dropped
+    once released."""
+
+    def __init__(self, pairs: Iterator[Tuple[tuple, tuple]]):
+        self.pairs = pairs  # (token, (offset, line, column)), e.g. Lexer.stream_tokens()
+        self.start = 0  # stream index of buffer[0]
+        self.buffer: List[Tuple[tuple, tuple]] = []
+
+    def available(self, index: int) -> bool:
+        while index - self.start >= len(self.buffer):
+            pair = next(self.pairs, None)
+            if pair is None:
+                return False
+            self.buffer.append(pair)
+        return True
+
+    def __getitem__(self, index: int) -> tuple:
+        if index < self.start or not self.available(index):
+            raise IndexError(f"token {index} is not in the window")
+        return self.buffer[index - self.start][0]
+
+    def line(self, index: int) -> int:
+        return self.buffer[index - self.start][1][1]
+
+    def release(self, index: int):
+        """Forget the tokens before index"""
+        del self.buffer[:index - self.start]
+        self.start = index
+
+
+class StreamingParser(Parser):
+    """Parser over a TokenWindow; the tokens of each top-level statement are
+    released once it is parsed"""
+
+    def __init__(self, tokens: TokenWindow, factory=None):
+        super().__init__(tokens, None, factory)
+
+    def has_token(self, index: int) -> bool:
+        return self.tokens.available(index)
+
+    def line_at(self, index: int) -> int:
+        return self.tokens.line(index) if self.tokens.available(index) else 0
+
+    def iter_program(self) -> Iterator[Node]:
+        for stmt in super().iter_program():
+            self.tokens.release(self.current - 1)  # the parser never looks back further than previous()
+            yield stmt
+            del stmt  # not kept alive while the next statement is parsed
+
+
+class _StatementCheck(_ScopedPass):
+    name = 'check'
+    requires = ('symbols',)
+
+    def __init__(self, checker: 'StreamingChecker'):
+        super().__init__()
+        self.checker = checker
+
+    def begin(self, root):
+        super().begin(root)
+        self.diagnostics: List[Diagnostic] = []
+
+    def enter_Identifier(self, node: Identifier, ctx: WalkContext):
+        locals_ = self.results['symbols'].locals.get(self.function, ()) if self.function is not None else ()
+        if node.name not in locals_ and node.name not in self.checker.globals:
+            self.checker.unresolved_names.setdefault(node.name, []).append(ctx.line)
+
+    def enter_CallStatement(self, node: CallStatement, ctx: WalkContext):
+        name, count = node.function_name, len(node.arguments)
+        expected = self.checker.functions.get(name)
+        if expected is not None:
+            if expected != count:
+                self.diagnostics.append(_arity_diagnostic(name, expected, count, ctx.line))
+        elif name not in self.checker.builtins:
+            self.checker.unresolved_calls.append((name, count, ctx.line))
+
+    def result(self) -> List[Diagnostic]:
+        return self.diagnostics
+
+
+def _arity_diagnostic(name: str, expected: int, count: int, line: int) -> Diagnostic:
+    return Diagnostic(line, f"Function '{name}' expects {expected} arguments, got {count}")
+
+
+class StreamingChecker:
+    """analysis.check_program, one top-level statement at a time.
+
+    check() returns the diagnostics a statement already settles; finish()
+    returns those about names used before their definition that were never
+    defined, and the arity of CALLs to FUNCs defined after them."""
+
+    def __init__(self, builtins=DEFAULT_BUILTINS):
+        self.builtins = builtins
+        self.globals: Set[str] = set()
+        self.functions: Dict[str, int] = {}  # FUNC -> parameter count
+        self.unresolved_names: Dict[str, List[int]] = {}  # name -> lines read before any assignment
+        self.unresolved_calls: List[Tuple[str, int, int]] = []  # (FUNC, argument count, line)
+
+    def check(self, stmt: Node) -> List[Diagnostic]:
+        collector = SymbolCollector()
+        symbols = run_passes(stmt, collector)['symbols']
+        diagnostics = collector.diagnostics
+        for name, function in symbols.functions.items():
+            if name in self.functions:
+                diagnostics.append(Diagnostic(function.line, f"Function '{name}' is already defined"))
+            self.functions[name] = len(function.parameters)
+        self.globals |= symbols.globals
+        for name in symbols.globals:
+            self.unresolved_names.pop(name, None)
+
+        check = _StatementCheck(self)
+        check.results = {'symbols': symbols}
+        walk(stmt, [check])
+        return sorted(diagnostics + check.result(), key=lambda d: d.line)
+
+    def finish(self) -> List[Diagnostic]:
+        diagnostics = [Diagnostic(line, f"Undeclared identifier '{name}'")
+                       for name, lines in self.unresolved_names.items() for line in lines]
+        for name, count, line in self.unresolved_calls:
+            expected = self.functions.get(name)
+            if expected is None:
+                diagnostics.append(Diagnostic(line, f"Undefined function '{name}'"))
+            elif expected != count:
+                diagnostics.append(_arity_diagnostic(name, expected, count, line))
+        return sorted(diagnostics, key=lambda d: d.line)
+
+
+class TreeEmitter:
+    """Writes the parse tree as str(Program) would"""
+
+    def __init__(self, out: TextIO):
+        self.out = out
+        out.write("Program\n|-- statements_block\n")
+
+    def emit(self, stmt: Node):
+        self.out.write(statement_entry(stmt))
+
+    def close(self):
+        self.out.write("|-- End\n")
+
+
+class ASTEmitter:
+    """Writes the serialization.py AST format. Identical subexpressions are not
+    shared: remembering them would keep every statement's nodes alive. The
+    string table and one offset per statement stay in memory until close(),
+    where they are written."""
+
+    def __init__(self, stream: BinaryIO):
+        self.writer = ASTWriter(stream, share=False)
+
+    def emit(self, stmt: Node):
+        self.writer.add_statement(stmt)
+
+    def close(self):
+        self.writer.close()
+
+
+class BytecodeEmitter:
+    """Writes the listing CompiledProgram.disassemble() would. Top-level code
+    is written as it is compiled, relocated to its place in <main>; FUNCs wait
+    in a temporary file until the end."""
+
+    def __init__(self, out: TextIO):
+        self.out = out
+        self.generator = CodeGenerator()
+        self.compiled = 0  # FUNCs written so far; their entries stay in generator.functions as None
+        self.pc = 0
+        self.statements = 0
+        self.functions = tempfile.TemporaryFile('w+')
+        out.write(f"{MAIN}()\n")
+
+    def emit(self, stmt: Node):
+        generator = self.generator
+        if isinstance(stmt, FunctionDefinition):
+            generator.pure |= pure_functions(Program([stmt]), generator.pure)
+        code = CodeObject(MAIN, [])
+        generator.compile_statement(code, stmt)
+        for pc, ((op, arg), line) in enumerate(zip(code.instructions, code.lines), self.pc):
+            self.out.write(disassemble_instruction(pc, op, relocate(op, arg, self.pc, self.statements), line))
+        self.pc += len(code.instructions)
+        self.statements += len(code.statements)
+
+        added = len(generator.functions) - self.compiled
+        for name in reversed(list(islice(reversed(generator.functions), added))):
+            self.functions.write("\n" + generator.functions[name].disassemble())
+            generator.functions[name] = None  # keeps the name for the duplicate check
+        self.compiled += added
+
+    def close(self):
+        self.out.write(disassemble_instruction(self.pc, LOAD_CONST, None, 0))
+        self.out.write(disassemble_instruction(self.pc + 1, RETURN, None, 0))
+        self.functions.seek(0)
+        shutil.copyfileobj(self.functions, self.out)
+        self.functions.close()
+
+
+class StreamingCompiler:
+    """Moves each top-level statement through check, constant folding and
+    emission as soon as it is parsed.
+
+    emitter is one of the emitters above. Diagnostics are passed to
+    on_diagnostic as soon as they are certain, or collected in diagnostics.
+    With stats (a CompileStats) the phases are timed, lexing as part of parse,
+    which pulls the tokens, and largest records the (nodes, line) of the
+    biggest statement.
+    """
+
+    def __init__(self, emitter, check: bool = True, fold: bool = True, builtins=DEFAULT_BUILTINS,
+                 on_diagnostic: Optional[Callable[[Diagnostic], None]] = None,
+                 stats: Optional[CompileStats] = None):
+        self.emitter = emitter
+        self.checker = StreamingChecker(builtins) if check else None
+        self.fold = fold
+        self.diagnostics: List[Diagnostic] = []
+        self.on_diagnostic = on_diagnostic or self.diagnostics.append
+        self.stats = stats
+        self.statements = 0
+        self.largest = (0, 0)
+
+    def phase(self, name: str):
+        return self.stats.phase(name) if self.stats else nullcontext()
+
+    def compile(self, source: TextIO, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        lex = ChunkedLexer(source, chunk_size)
+        parser = StreamingParser(TokenWindow(lex.stream_tokens()))
+        statements = parser.iter_program()
+        nodes = 0
+        while True:
+            with self.phase('parse'):
+                stmt = next(statements, None)
+            if stmt is None:
+                break
+            self.statements += 1
+            if self.stats:
+                size = count_nodes(stmt)
+                nodes += size
+                self.largest = max(self.largest, (size, stmt.line))
+            if self.checker:
+                with self.phase('validate'):
+                    diagnostics = self.checker.check(stmt)
+                for diagnostic in diagnostics:
+                    self.on_diagnostic(diagnostic)
+            if self.fold:
+                with self.phase('optimize'):
+                    stmt = ConstantFolder().transform(stmt)
+            with self.phase('emit'):
+                self.emitter.emit(stmt)
+            stmt = None  # drop the statement before parsing the next one
+
+        if self.checker:
+            with self.phase('validate'):
+                diagnostics = self.checker.finish()
+            for diagnostic in diagnostics:
+                self.on_diagnostic(diagnostic)
+        with self.phase('emit'):
+            self.emitter.close()
+        if self.stats:
+            self.stats.counters.update(tokens=parser.current, lines=lex.current_line, nodes=nodes,
+                                       symbols=len(lex.symbol_table))
+
+
+EMITTERS = {'tree': TreeEmitter, 'ast': ASTEmitter, 'bytecode': BytecodeEmitter}
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Compile a script one top-level statement at a time, in memory bounded by its largest statement")
+    arg_parser.add_argument('source', help="script file to compile")
+    arg_parser.add_argument('--emit', choices=sorted(EMITTERS), default='tree',
+                            help="what to write: the parse tree, the binary AST or a bytecode listing "
+                                 "(default: tree)")
+    arg_parser.add_argument('-o', '--output', metavar='FILE',
+                            help="write to FILE instead of standard output (required for --emit ast)")
+    arg_parser.add_argument('--no-check', action='store_true',
+                            help="skip undeclared identifier and call arity checks")
+    arg_parser.add_argument('--no-fold', action='store_true', help="skip constant folding")
+    arg_parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, metavar='N',
+                            help=f"characters of source to read at a time (default: {DEFAULT_CHUNK_SIZE})")
+    arg_parser.add_argument('--stats', action='store_true',
+                            help="report per-phase timings, peak memory and the largest statement")
+    args = arg_parser.parse_args(argv)
+    if args.emit == 'ast' and not args.output:
+        arg_parser.error("--emit ast writes binary data and needs --output")
+    if args.chunk_size < 1:
+        arg_parser.error("--chunk-size must be positive")
+
+    def warn(diagnostic: Diagnostic):
+        print(f"Warning: {diagnostic}", file=sys.stderr)
+
+    stats = CompileStats() if args.stats else None
+    with stats or nullcontext():
+        try:
+            with open(args.source) as source, \
+                    (open(args.output, 'wb' if args.emit == 'ast' else 'w') if args.output
+                     else nullcontext(sys.stdout)) as out:
+                compiler = StreamingCompiler(EMITTERS[args.emit](out), check=not args.no_check,
+                                             fold=not args.no_fold, on_diagnostic=warn, stats=stats)
+                compiler.compile(source, args.chunk_size)
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return
+
+    if stats:
+        print(file=sys.stderr)
+        print(stats.report(), file=sys.stderr)
+        nodes, line = compiler.largest
+        print(f"Statements: {compiler.statements}, largest: {nodes} nodes (line {line})", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
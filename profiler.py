@@ -0,0 +1,166 @@
+import time
+from typing import Callable, Dict, List, Tuple
+
+from bytecode import MAIN
+
+
+class StatementStats:
+    __slots__ = ('function', 'line', 'kind', 'hits', 'self_time', 'total_time')
+
+    def __init__(self, function: str, line: int, kind: str):
+        self.function = function
+        self.line = line
+        self.kind = kind
+        self.hits = 0
+        self.self_time = 0.0
+        self.total_time = 0.0
+
+
+class FunctionStats:
+    __slots__ = ('name', 'line', 'calls', 'total_time')
+
+    def __init__(self, name: str, line: int):
+        self.name = name
+        self.line = line
+        self.calls = 0
+        self.total_time = 0.0
+
+
+class _ActiveFrame:
+    __slots__ = ('function', 'statements', 'start')
+
+    def __init__(self, function: FunctionStats, start: float):
+        self.function = function
+        self.statements: List[Tuple[StatementStats, float]] = []  # open statements and their start, outermost first
+        self.start = start
+
+
+class ExecutionProfiler:
+    """Counting profiler driven by the interpreter.
+
+    Every executed statement is counted and timed, keyed by function and
+    source line. Self time is the time spent in the statement itself, total
+    time also includes the statements nested in it and the functions it
+    calls. Time is also attributed to the full stack of functions and
+    statements, for flame graphs.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        self.statements: Dict[Tuple[str, int, str], StatementStats] = {}
+        self.functions: Dict[str, FunctionStats] = {}
+        self.stacks: Dict[Tuple[str, ...], float] = {}
+        self._frames: List[_ActiveFrame] = []
+        self._labels: List[str] = []
+        self._active: Dict[object, int] = {}
+        self._last = 0.0
+
+    def _tick(self) -> float:
+        """Attribute the time since the last event to the running statement"""
+        now = self.clock()
+        elapsed = now - self._last
+        self._last = now
+        frame = self._frames[-1] if self._frames else None
+        if frame is not None and frame.statements:
+            frame.statements[-1][0].self_time += elapsed
+        if self._labels:
+            key = tuple(self._labels)
+            self.stacks[key] = self.stacks.get(key, 0.0) + elapsed
+        return now
+
+    def _open(self, item):
+        self._active[item] = self._active.get(item, 0) + 1
+
+    def _close(self, item) -> bool:
+        """Return True when the outermost activation of item ends"""
+        self._active[item] -= 1
+        return self._active[item] == 0
+
+    def _function(self, name: str, line: int) -> FunctionStats:
+        stats = self.functions.get(name)
+        if stats is None:
+            stats = self.functions[name] = FunctionStats(name, line)
+        return stats
+
+    def _end_statements(self, frame: _ActiveFrame, depth: int, now: float):
+        """Close the frame's statements nested depth or more levels deep"""
+        while len(frame.statements) > depth:
+            stats, start = frame.statements.pop()
+            if self._close(stats):
+                stats.total_time += now - start
+            self._labels.pop()
+
+    def _enter(self, name: str, line: int, now: float):
+        function = self._function(name, line)
+        function.calls += 1
+        self._open(function)
+        self._frames.append(_ActiveFrame(function, now))
+        self._labels.append(name)
+
+    def _leave(self, now: float):
+        frame = self._frames.pop()
+        self._end_statements(frame, 0, now)
+        if self._close(frame.function):
+            frame.function.total_time += now - frame.start
+        self._labels.pop()
+
+    # Interpreter events
+    def start(self):
+        self._last = self.clock()
+        self._enter(MAIN, 0, self._last)
+
+    def stop(self):
+        now = self._tick()
+        while self._frames:
+            self._leave(now)
+
+    def statement(self, code, index: int):
+        now = self._tick()
+        frame = self._frames[-1]
+        line, kind, depth = code.statements[index]
+        self._end_statements(frame, depth, now)  # the statements still open enclose this one
+        key = (code.name, line, kind)
+        stats = self.statements.get(key)
+        if stats is None:
+            stats = self.statements[key] = StatementStats(code.name, line, kind)
+        stats.hits += 1
+        self._open(stats)
+        frame.statements.append((stats, now))
+        self._labels.append(f"L{line} {kind}")
+
+    def enter_function(self, code):
+        self._enter(code.name, code.line, self._tick())
+
+    def leave_function(self):
+        self._leave(self._tick())
+
+    # Reports
+    def report(self, limit: int = None) -> str:
+        """Statements and functions sorted by total time, hottest first"""
+        rows = sorted(self.statements.values(), key=lambda s: (-s.total_time, -s.hits, s.line))
+        if limit is not None:
+            rows = rows[:limit]
+
+        lines = ["Statement Profile:"]
+        lines.append(f"{'Line':>6} {'Statement':<8} {'Function':<16} {'Hits':>10} "
+                     f"{'Total (ms)':>12} {'Self (ms)':>12} {'Per hit (us)':>13}")
+        for s in rows:
+            per_hit = s.total_time / s.hits * 1e6 if s.hits else 0.0
+            lines.append(f"{s.line:>6} {s.kind:<8} {s.function:<16} {s.hits:>10} "
+                         f"{s.total_time * 1000:>12.3f} {s.self_time * 1000:>12.3f} {per_hit:>13.2f}")
+
+        lines.append("")
+        lines.append("Function Profile:")
+        lines.append(f"{'Line':>6} {'Function':<16} {'Calls':>10} {'Total (ms)':>12}")
+        for f in sorted(self.functions.values(), key=lambda f: (-f.total_time, f.line)):
+            lines.append(f"{f.line:>6} {f.name:<16} {f.calls:>10} {f.total_time * 1000:>12.3f}")
+        return "\n".join(lines)
+
+    def collapsed(self) -> str:
+        """Collapsed stacks ("frame;frame;... microseconds") for flamegraph.pl and speedscope"""
+        lines = []
+        for stack, seconds in sorted(self.stacks.items()):
+            micros = int(round(seconds * 1e6))
+            if micros > 0:
+                lines.append(f"{';'.join(stack)} {micros}")
+        return "\n".join(lines) + ("\n" if lines else "")
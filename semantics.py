@@ -0,0 +1,280 @@
+"""Phase 3: semantic analysis.
+
+Types are inferred with union-find unification: every variable, parameter,
+function result and expression gets a type variable, constraints merge
+variables, and a merge of two different concrete types is a type error.
+With path compression and union by rank the whole pass is linear in the
+size of the program (up to the inverse Ackermann factor), so it is cheap
+enough to run on every compile.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from ast_nodes import (
+    Node, Program, LetStatement, BinaryOperation,
+    Number, Identifier, IfStatement, CallStatement,
+    WhileStatement, FunctionDefinition, ReturnStatement, ForStatement,
+    ListLiteral, IndexExpression, IndexAssignment
+)
+from analysis import (
+    Diagnostic, SymbolCollector, UndeclaredIdentifierCheck, ArityCheck, _ScopedPass
+)
+from interpreter import DEFAULT_BUILTINS
+from visitor import PassManager, WalkContext
+
+NUMBER = 'number'
+STRING = 'string'
+LIST = 'list'
+FUNCTION = 'function'
+NONE = 'none'
+UNKNOWN = 'unknown'
+
+ARITHMETIC = {'-', '*', '/'}
+COMPARISON = {'<', '>'}
+EQUALITY = {'=', '!='}
+
+
+class TypeVar:
+    __slots__ = ('parent', 'rank', 'type', 'origin')
+
+    def __init__(self, type_: Optional[str] = None, origin: str = ''):
+        self.parent = self
+        self.rank = 0
+        self.type = type_
+        self.origin = origin  # what the variable stands for, for messages
+
+
+def find(var: TypeVar) -> TypeVar:
+    root = var
+    while root.parent is not root:
+        root = root.parent
+    while var.parent is not root:
+        var.parent, var = root, var.parent
+    return root
+
+
+def unify(a: TypeVar, b: TypeVar) -> Optional[Tuple[str, str]]:
+    """Merge a and b; return the two clashing types if both were concrete and differ"""
+    a, b = find(a), find(b)
+    if a is b:
+        return None
+    if a.type is not None and b.type is not None and a.type != b.type:
+        return a.type, b.type
+    if a.rank < b.rank:
+        a, b = b, a
+    b.parent = a
+    if a.rank == b.rank:
+        a.rank += 1
+    if a.type is None:
+        a.type = b.type
+    if not a.origin:
+        a.origin = b.origin
+    return None
+
+
+def resolve(var: TypeVar) -> str:
+    return find(var).type or UNKNOWN
+
+
+class TypeInference(_ScopedPass):
+    """Infer number/string/list/function types for every variable and FUNC"""
+
+    name = 'types'
+    requires = ('symbols',)
+
+    def __init__(self, builtins=DEFAULT_BUILTINS):
+        super().__init__()
+        self.builtins = builtins
+
+    def begin(self, root):
+        super().begin(root)
+        self.diagnostics: List[Diagnostic] = []
+        self.variables: Dict[Tuple[Optional[str], str], TypeVar] = {}
+        self.signatures: Dict[str, Tuple[List[TypeVar], TypeVar]] = {}  # function -> (parameters, result)
+        self.line = 0
+        for name, func in self.results['symbols'].functions.items():
+            params = [self.variable(name, param) for param in func.parameters]
+            self.signatures[name] = (params, TypeVar(origin=f"result of {name}"))
+
+    def variable(self, function: Optional[str], name: str) -> TypeVar:
+        """Type variable of name as seen from inside function (None for the top level)"""
+        if function is not None and name not in self.results['symbols'].locals.get(function, ()):
+            function = None  # a global read from inside a function
+        key = (function, name)
+        var = self.variables.get(key)
+        if var is None:
+            var = self.variables[key] = TypeVar(origin=f"'{name}'")
+        return var
+
+    def constrain(self, a: TypeVar, b: TypeVar):
+        clash = unify(a, b)
+        if clash is not None:
+            left = a.origin or find(a).origin or 'expression'
+            right = b.origin or find(b).origin
+            if right:
+                message = f"Type mismatch: {left} is {clash[0]} but {right} is {clash[1]}"
+            else:
+                message = f"Type mismatch: {left} is {clash[0]} but is used as {clash[1]}"
+            self.diagnostics.append(Diagnostic(self.line, message))
+
+    def concrete(self, type_: str, origin: str = '') -> TypeVar:
+        return TypeVar(type_, origin)
+
+    def type_of(self, expr: Node) -> TypeVar:
+        """Type variable of an expression, computed bottom-up without recursion"""
+        results: List[TypeVar] = []
+        stack = [(expr, False)]
+        while stack:
+            node, ready = stack.pop()
+            if isinstance(node, Number):
+                results.append(self.concrete(NUMBER))
+            elif isinstance(node, Identifier):
+                results.append(self.variable(self.function, node.name))
+            elif isinstance(node, BinaryOperation):
+                if not ready:
+                    stack.append((node, True))
+                    stack.append((node.right, False))
+                    stack.append((node.left, False))
+                    continue
+                right = results.pop()
+                left = results.pop()
+                results.append(self.binary(node.operator, left, right))
+            elif isinstance(node, CallStatement):
+                if not ready:
+                    stack.append((node, True))
+                    stack.extend((arg, False) for arg in reversed(node.arguments))
+                    continue
+                args = results[len(results) - len(node.arguments):]
+                del results[len(results) - len(node.arguments):]
+                results.append(self.call(node, args))
+            elif isinstance(node, ListLiteral):
+                if not ready:
+                    stack.append((node, True))
+                    stack.extend((element, False) for element in reversed(node.elements))
+                    continue
+                del results[len(results) - len(node.elements):]  # elements may have any type
+                results.append(self.concrete(LIST))
+            elif isinstance(node, IndexExpression):
+                if not ready:
+                    stack.append((node, True))
+                    stack.append((node.index, False))
+                    stack.append((node.target, False))
+                    continue
+                index = results.pop()
+                target = results.pop()
+                self.constrain(target, self.concrete(LIST))
+                self.constrain(index, self.concrete(NUMBER))
+                results.append(TypeVar())  # element types are not tracked
+            else:
+                results.append(TypeVar())
+        return results[-1]
+
+    def binary(self, operator: str, left: TypeVar, right: TypeVar) -> TypeVar:
+        if operator == '+':
+            # Numbers add, strings and lists concatenate: both sides and the result agree
+            self.constrain(left, right)
+            return left
+        if operator in ARITHMETIC:
+            self.constrain(left, self.concrete(NUMBER))
+            self.constrain(right, self.concrete(NUMBER))
+            return self.concrete(NUMBER)
+        if operator in COMPARISON or operator in EQUALITY:
+            self.constrain(left, right)
+            return self.concrete(NUMBER)
+        return self.concrete(NUMBER)  # and / or
+
+    def call(self, node: CallStatement, args: List[TypeVar]) -> TypeVar:
+        signature = self.signatures.get(node.function_name)
+        if signature is None:
+            return TypeVar()  # builtin or undefined (reported by UndeclaredIdentifierCheck)
+        params, result = signature
+        for param, arg in zip(params, args):  # arity is reported by ArityCheck
+            self.constrain(param, arg)
+        return result
+
+    def enter_LetStatement(self, node: LetStatement, ctx: WalkContext):
+        self.line = node.line
+        self.constrain(self.variable(self.function, node.identifier), self.type_of(node.expression))
+
+    def enter_IfStatement(self, node: IfStatement, ctx: WalkContext):
+        self.line = node.line
+        self.type_of(node.condition)
+
+    def enter_WhileStatement(self, node: WhileStatement, ctx: WalkContext):
+        self.line = node.line
+        self.type_of(node.condition)
+
+    def enter_ForStatement(self, node: ForStatement, ctx: WalkContext):
+        self.line = node.line
+        self.constrain(self.variable(self.function, node.variable), self.concrete(NUMBER))
+        for bound in (node.start, node.end, node.step):
+            if bound is not None:
+                self.constrain(self.type_of(bound), self.concrete(NUMBER))
+
+    def enter_IndexAssignment(self, node: IndexAssignment, ctx: WalkContext):
+        self.line = node.line
+        self.constrain(self.type_of(node.target), self.concrete(LIST))
+        self.constrain(self.type_of(node.index), self.concrete(NUMBER))
+        self.type_of(node.expression)
+
+    def enter_CallStatement(self, node: CallStatement, ctx: WalkContext):
+        parent = ctx.parent
+        if isinstance(parent, (Program, FunctionDefinition, IfStatement, WhileStatement, ForStatement)) \
+                and all(node is not getattr(parent, name, None) for name in ('condition', 'start', 'end', 'step')):
+            self.line = node.line
+            self.type_of(node)
+
+    def enter_ReturnStatement(self, node: ReturnStatement, ctx: WalkContext):
+        self.line = node.line
+        if self.function is None:
+            return
+        value = self.concrete(NONE) if node.expression is None else self.type_of(node.expression)
+        self.constrain(self.signatures[self.function][1], value)
+
+    def result(self) -> 'SemanticResult':
+        types = {}
+        for (function, name), var in self.variables.items():
+            types[(function, name)] = resolve(var)
+        signatures = {
+            name: ([resolve(p) for p in params], resolve(result))
+            for name, (params, result) in self.signatures.items()
+        }
+        parameters = {
+            name: list(func.parameters) for name, func in self.results['symbols'].functions.items()
+        }
+        return SemanticResult(types, signatures, parameters, self.diagnostics)
+
+
+@dataclass
+class SemanticResult:
+    types: Dict[Tuple[Optional[str], str], str]  # (function or None, variable) -> type
+    signatures: Dict[str, Tuple[List[str], str]]  # function -> (parameter types, result type)
+    parameters: Dict[str, List[str]]  # function -> parameter names
+    diagnostics: List[Diagnostic] = field(default_factory=list)
+
+    def apply_to_symbol_table(self, symbol_table: Dict[str, dict]):
+        """Replace the lexer's placeholder types with the inferred ones"""
+        for (function, name), type_ in self.types.items():
+            entry = symbol_table.get(name)
+            if entry is None or entry.get('type') == FUNCTION:
+                continue
+            if function is None or entry.get('type') in ('unknown', 'integer'):
+                entry['type'] = type_
+        for name, (param_types, result) in self.signatures.items():
+            entry = symbol_table.setdefault(name, {'name': name})
+            entry['type'] = FUNCTION
+            entry['parameters'] = self.parameters[name]
+            entry['parameter_types'] = param_types
+            entry['returns'] = result
+
+
+def analyze(program: Program, builtins=DEFAULT_BUILTINS) -> SemanticResult:
+    """Undeclared identifiers, call arity and type inference in two walks"""
+    collector = SymbolCollector()
+    passes = [collector, UndeclaredIdentifierCheck(builtins), ArityCheck(), TypeInference(builtins)]
+    results = PassManager(passes).run(program)
+    semantic = results['types']
+    semantic.diagnostics = sorted(
+        collector.diagnostics + results['undeclared'] + results['arity'] + semantic.diagnostics,
+        key=lambda d: d.line)
+    return semantic
@@ -0,0 +1,567 @@
+"""Compact binary format for token streams and ASTs.
+
+Layout of a file:
+
+    header   MAGIC, format version, payload kind (b'T' tokens / b'A' AST), flags
+    records  varint-encoded tokens, or AST nodes in post-order
+    strings  interned string table: count, then (length, utf-8 bytes) each
+    trailer  two little-endian u64: string table offset, root offset / token count
+
+AST node records start with their kind. Child nodes are always written
+before their parent, which refers to them by the varint distance back to the
+child's record, so writing streams and readers can jump straight to any
+subtree. Nodes shared by a HashConsFactory are written once.
+"""
+import io
+import mmap
+import struct
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from ast_nodes import (
+    Program, LetStatement, BinaryOperation,
+    Number, Identifier, IfStatement, CallStatement,
+    WhileStatement, FunctionDefinition, ReturnStatement, ForStatement,
+    ListLiteral, IndexExpression, IndexAssignment, literal_value
+)
+
+MAGIC = b'MCSB'
+VERSION = 2
+TOKENS = b'T'
+AST = b'A'
+FLAG_POSITIONS = 1
+
+HEADER = struct.Struct('<4sBcB')
+TRAILER = struct.Struct('<QQ')
+
+# Field types: 'str' string ref, 'int' varint, 'bool' varint 0 / 1, 'index' varint of value + 1
+# (so -1, e.g. a statement's unknown first token, fits), 'node' child ref,
+# 'nodes' count + child refs, 'opt_node' / 'opt_nodes' allow None, 'strs' count + string refs,
+# 'number' string ref to the repr of an int or float
+SCHEMA = [
+    (Program, [('statements', 'nodes')]),
+    (LetStatement, [('identifier', 'str'), ('expression', 'node'), ('line', 'int'), ('token', 'index')]),
+    (BinaryOperation, [('left', 'node'), ('operator', 'str'), ('right', 'node')]),
+    (Number, [('value', 'number')]),
+    (Identifier, [('name', 'str')]),
+    (IfStatement, [('condition', 'node'), ('then_branch', 'nodes'),
+                   ('else_branch', 'opt_nodes'), ('line', 'int'), ('token', 'index')]),
+    (CallStatement, [('function_name', 'str'), ('arguments', 'nodes'), ('line', 'int'), ('token', 'index')]),
+    (WhileStatement, [('condition', 'node'), ('body', 'nodes'), ('line', 'int'), ('token', 'index')]),
+    (FunctionDefinition, [('name', 'str'), ('parameters', 'strs'), ('body', 'nodes'),
+                          ('line', 'int'), ('token', 'index')]),
+    (ReturnStatement, [('expression', 'opt_node'), ('line', 'int'), ('token', 'index')]),
+    (ForStatement, [('variable', 'str'), ('start', 'node'), ('end', 'node'), ('step', 'opt_node'),
+                    ('body', 'nodes'), ('inclusive', 'bool'), ('parallel', 'bool'),
+                    ('line', 'int'), ('token', 'index')]),
+    (ListLiteral, [('elements', 'nodes')]),
+    (IndexExpression, [('target', 'node'), ('index', 'node')]),
+    (IndexAssignment, [('target', 'node'), ('index', 'node'), ('expression', 'node'),
+                       ('line', 'int'), ('token', 'index')]),
+]
+KIND_OF = {cls: kind for kind, (cls, _) in enumerate(SCHEMA)}
+SHAREABLE = (BinaryOperation, Number, Identifier, IndexExpression)
+
+
+class FormatError(Exception):
+    pass
+
+
+def write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(buf, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+class _Writer:
+    """Shared machinery: buffered output, position tracking and the string table"""
+
+    FLUSH_SIZE = 1 << 16
+
+    def __init__(self, stream: BinaryIO, payload: bytes, flags: int = 0):
+        self.stream = stream
+        self.buffer = bytearray(HEADER.pack(MAGIC, VERSION, payload, flags))
+        self.flushed = 0
+        self.strings: Dict[str, int] = {}
+        self.closed = False
+
+    @property
+    def position(self) -> int:
+        return self.flushed + len(self.buffer)
+
+    def string_ref(self, text: str):
+        index = self.strings.get(text)
+        if index is None:
+            index = self.strings[text] = len(self.strings)
+        write_varint(self.buffer, index)
+
+    def maybe_flush(self):
+        if len(self.buffer) >= self.FLUSH_SIZE:
+            self.stream.write(self.buffer)
+            self.flushed += len(self.buffer)
+            self.buffer = bytearray()
+
+    def finish(self, root: int):
+        table_offset = self.position
+        write_varint(self.buffer, len(self.strings))
+        for text in self.strings:
+            data = text.encode('utf-8')
+            write_varint(self.buffer, len(data))
+            self.buffer += data
+        self.buffer += TRAILER.pack(table_offset, root)
+        self.stream.write(self.buffer)
+        self.flushed += len(self.buffer)
+        self.buffer = bytearray()
+        self.closed = True
+
+
+class TokenWriter(_Writer):
+    """Stream (kind, lexeme) tokens, optionally with Lexer.token_positions"""
+
+    def __init__(self, stream: BinaryIO, positions: bool = False):
+        super().__init__(stream, TOKENS, FLAG_POSITIONS if positions else 0)
+        self.positions = positions
+        self.count = 0
+        self.last_offset = 0
+        self.last_line = 0
+
+    def write(self, token: tuple, position: Optional[tuple] = None):
+        kind, lexeme = token
+        self.string_ref(kind)
+        self.string_ref(lexeme)
+        if self.positions:
+            offset, line, column = position
+            write_varint(self.buffer, offset - self.last_offset)
+            write_varint(self.buffer, line - self.last_line)
+            write_varint(self.buffer, column)
+            self.last_offset, self.last_line = offset, line
+        self.count += 1
+        self.maybe_flush()
+
+    def write_all(self, tokens: List[tuple], positions: Optional[List[tuple]] = None):
+        for index, token in enumerate(tokens):
+            self.write(token, positions[index] if positions is not None else None)
+
+    def close(self):
+        self.finish(self.count)
+
+
+class ASTWriter(_Writer):
+    """Stream an AST, either whole with write_program() or one top-level
+    statement at a time with add_statement() followed by close()"""
+
+    def __init__(self, stream: BinaryIO, share: bool = True):
+        super().__init__(stream, AST)
+        self.share = share
+        self.shared: Dict[int, Tuple[object, int]] = {}  # id -> (node, offset); keeps node alive
+        self.statements: List[int] = []
+
+    def write_node(self, root) -> int:
+        """Write root and every node below it, returning root's offset"""
+        offsets: Dict[int, int] = {}
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if id(node) in offsets:
+                continue
+            if self.share and isinstance(node, SHAREABLE) and id(node) in self.shared:
+                offsets[id(node)] = self.shared[id(node)][1]
+                continue
+            if not expanded:
+                stack.append((node, True))
+                for child in reversed(_children(node)):
+                    if id(child) not in offsets:
+                        stack.append((child, False))
+                continue
+            offset = self._write_record(node, offsets)
+            offsets[id(node)] = offset
+            if self.share and isinstance(node, SHAREABLE):
+                self.shared[id(node)] = (node, offset)
+        self.maybe_flush()
+        return offsets[id(root)]
+
+    def _write_record(self, node, offsets: Dict[int, int]) -> int:
+        offset = self.position
+        cls = type(node)
+        out = self.buffer
+        write_varint(out, KIND_OF[cls])
+        for name, ftype in SCHEMA[KIND_OF[cls]][1]:
+            value = getattr(node, name)
+            if ftype == 'str':
+                self.string_ref(value)
+            elif ftype == 'number':
+                self.string_ref(repr(value))
+            elif ftype == 'int':
+                write_varint(out, value)
+            elif ftype == 'bool':
+                out.append(1 if value else 0)
+            elif ftype == 'index':
+                write_varint(out, value + 1)
+            elif ftype == 'node':
+                write_varint(out, offset - offsets[id(value)])
+            elif ftype == 'opt_node':
+                write_varint(out, 0 if value is None else offset - offsets[id(value)])
+            elif ftype == 'nodes' or ftype == 'opt_nodes':
+                if ftype == 'opt_nodes':
+                    write_varint(out, 0 if value is None else len(value) + 1)
+                    if value is None:
+                        continue
+                else:
+                    write_varint(out, len(value))
+                for child in value:
+                    write_varint(out, offset - offsets[id(child)])
+            elif ftype == 'strs':
+                write_varint(out, len(value))
+                for text in value:
+                    self.string_ref(text)
+        return offset
+
+    def add_statement(self, stmt):
+        self.statements.append(self.write_node(stmt))
+
+    def write_program(self, program: Program):
+        for stmt in program.statements:
+            self.add_statement(stmt)
+        self.close()
+
+    def close(self):
+        offset = self.position
+        write_varint(self.buffer, KIND_OF[Program])
+        write_varint(self.buffer, len(self.statements))
+        for child in self.statements:
+            write_varint(self.buffer, offset - child)
+        self.finish(offset)
+
+
+def _children(node) -> list:
+    children = []
+    for name, ftype in SCHEMA[KIND_OF[type(node)]][1]:
+        value = getattr(node, name)
+        if ftype in ('node', 'opt_node'):
+            if value is not None:
+                children.append(value)
+        elif ftype in ('nodes', 'opt_nodes'):
+            if value is not None:
+                children.extend(value)
+    return children
+
+
+class _Reader:
+    def __init__(self, buf, payload: bytes):
+        self.buf = buf
+        if len(buf) < HEADER.size + TRAILER.size:
+            raise FormatError("File too short")
+        magic, version, kind, flags = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise FormatError("Not a serialized compiler file")
+        if version != VERSION:
+            raise FormatError(f"Unsupported format version {version}")
+        if kind != payload:
+            raise FormatError(f"Expected payload {payload!r}, found {kind!r}")
+        self.flags = flags
+        table_offset, self.root_value = TRAILER.unpack_from(buf, len(buf) - TRAILER.size)
+        self.strings = self._read_strings(table_offset)
+        self._file = None
+        self._map = None
+
+    def _read_strings(self, pos: int) -> List[str]:
+        count, pos = read_varint(self.buf, pos)
+        strings = []
+        for _ in range(count):
+            length, pos = read_varint(self.buf, pos)
+            strings.append(bytes(self.buf[pos:pos + length]).decode('utf-8'))
+            pos += length
+        return strings
+
+    @classmethod
+    def open(cls, path: str):
+        """Memory-map path and read it in place"""
+        f = open(path, 'rb')
+        mapped = None
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            reader = cls(mapped)
+        except Exception:
+            if mapped is not None:
+                mapped.close()
+            f.close()
+            raise
+        reader._file, reader._map = f, mapped
+        return reader
+
+    def close(self):
+        if self._map is not None:
+            self.buf = None
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class TokenReader(_Reader):
+    def __init__(self, buf):
+        super().__init__(buf, TOKENS)
+        self.count = self.root_value
+        self.has_positions = bool(self.flags & FLAG_POSITIONS)
+
+    def __iter__(self) -> Iterator[Tuple[tuple, Optional[tuple]]]:
+        """Yield (token, position) pairs; position is None when not stored"""
+        buf, strings = self.buf, self.strings
+        pos = HEADER.size
+        offset = line = 0
+        for _ in range(self.count):
+            kind, pos = read_varint(buf, pos)
+            lexeme, pos = read_varint(buf, pos)
+            position = None
+            if self.has_positions:
+                delta, pos = read_varint(buf, pos)
+                offset += delta
+                delta, pos = read_varint(buf, pos)
+                line += delta
+                column, pos = read_varint(buf, pos)
+                position = (offset, line, column)
+            yield (strings[kind], strings[lexeme]), position
+
+    def tokens(self) -> List[tuple]:
+        return [token for token, _ in self]
+
+    def positions(self) -> List[tuple]:
+        return [position for _, position in self]
+
+
+class LazyNode:
+    """A node record that is decoded only when its fields are accessed.
+    Child fields are LazyNodes themselves, so only the walked part of the
+    tree is ever decoded."""
+
+    __slots__ = ('reader', 'offset', '_fields')
+
+    def __init__(self, reader: 'ASTReader', offset: int):
+        self.reader = reader
+        self.offset = offset
+        self._fields = None
+
+    @property
+    def node_class(self):
+        kind, _ = read_varint(self.reader.buf, self.offset)
+        return SCHEMA[kind][0]
+
+    @property
+    def fields(self) -> dict:
+        if self._fields is None:
+            cls, values = self.reader.read_record(self.offset)
+            wrap = lambda off: LazyNode(self.reader, off)
+            self._fields = {}
+            for (name, ftype), value in zip(SCHEMA[KIND_OF[cls]][1], values):
+                if ftype in ('node', 'opt_node'):
+                    value = None if value is None else wrap(value)
+                elif ftype in ('nodes', 'opt_nodes'):
+                    value = None if value is None else [wrap(off) for off in value]
+                self._fields[name] = value
+        return self._fields
+
+    def __getattr__(self, name):
+        try:
+            return self.fields[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def materialize(self):
+        return self.reader.decode(self.offset)
+
+    def __repr__(self):
+        return f"LazyNode({self.node_class.__name__} @ {self.offset})"
+
+
+class ASTReader(_Reader):
+    def __init__(self, buf):
+        super().__init__(buf, AST)
+        self.root_offset = self.root_value
+
+    @property
+    def root(self) -> LazyNode:
+        return LazyNode(self, self.root_offset)
+
+    def statements(self) -> Iterator[LazyNode]:
+        """Top-level statements, undecoded"""
+        return iter(self.root.statements)
+
+    def read_record(self, offset: int):
+        """Return (class, field values) for the record at offset; child
+        references are resolved to absolute offsets"""
+        buf, strings = self.buf, self.strings
+        kind, pos = read_varint(buf, offset)
+        cls, schema = SCHEMA[kind]
+        values = []
+        for _, ftype in schema:
+            if ftype == 'str':
+                index, pos = read_varint(buf, pos)
+                values.append(strings[index])
+            elif ftype == 'number':
+                index, pos = read_varint(buf, pos)
+                values.append(literal_value(strings[index]))
+            elif ftype == 'int':
+                value, pos = read_varint(buf, pos)
+                values.append(value)
+            elif ftype == 'bool':
+                values.append(bool(buf[pos]))
+                pos += 1
+            elif ftype == 'index':
+                value, pos = read_varint(buf, pos)
+                values.append(value - 1)
+            elif ftype == 'node' or ftype == 'opt_node':
+                distance, pos = read_varint(buf, pos)
+                values.append(offset - distance if distance else None)
+            elif ftype == 'nodes' or ftype == 'opt_nodes':
+                count, pos = read_varint(buf, pos)
+                if ftype == 'opt_nodes':
+                    if count == 0:
+                        values.append(None)
+                        continue
+                    count -= 1
+                children = []
+                for _ in range(count):
+                    distance, pos = read_varint(buf, pos)
+                    children.append(offset - distance)
+                values.append(children)
+            elif ftype == 'strs':
+                count, pos = read_varint(buf, pos)
+                texts = []
+                for _ in range(count):
+                    index, pos = read_varint(buf, pos)
+                    texts.append(strings[index])
+                values.append(texts)
+        return cls, values
+
+    def decode(self, offset: Optional[int] = None):
+        """Materialize the subtree at offset (default: the whole program).
+        Records shared in the file are shared in the result."""
+        if offset is None:
+            offset = self.root_offset
+        built = {}
+        records = {}
+        stack = [offset]
+        while stack:
+            current = stack[-1]
+            if current in built:
+                stack.pop()
+                continue
+            if current not in records:
+                records[current] = self.read_record(current)
+            cls, values = records[current]
+            pending = [child for child in _child_offsets(cls, values) if child not in built]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            args = []
+            for (_, ftype), value in zip(SCHEMA[KIND_OF[cls]][1], values):
+                if ftype in ('node', 'opt_node'):
+                    value = None if value is None else built[value]
+                elif ftype in ('nodes', 'opt_nodes'):
+                    value = None if value is None else [built[child] for child in value]
+                args.append(value)
+            built[current] = cls(*args)
+            del records[current]
+        return built[offset]
+
+
+def _child_offsets(cls, values) -> List[int]:
+    offsets = []
+    for (_, ftype), value in zip(SCHEMA[KIND_OF[cls]][1], values):
+        if ftype in ('node', 'opt_node'):
+            if value is not None:
+                offsets.append(value)
+        elif ftype in ('nodes', 'opt_nodes'):
+            if value is not None:
+                offsets.extend(value)
+    return offsets
+
+
+def dump_tokens(tokens, positions=None) -> bytes:
+    stream = io.BytesIO()
+    writer = TokenWriter(stream, positions is not None)
+    writer.write_all(tokens, positions)
+    writer.close()
+    return stream.getvalue()
+
+
+def load_tokens(data) -> TokenReader:
+    return TokenReader(data)
+
+
+def dump_ast(program: Program, share: bool = True) -> bytes:
+    stream = io.BytesIO()
+    ASTWriter(stream, share).write_program(program)
+    return stream.getvalue()
+
+
+def load_ast(data) -> Program:
+    return ASTReader(data).decode()
+
+
+def benchmark(statements: int = 20000, repeat: int = 3):
+    """Compare size and speed with pickle on a generated program"""
+    import pickle
+    import time
+    import Compiler_Project_phase1 as lexer
+    from Compiler_Project_phase2 import Parser
+    from hashcons import HashConsFactory
+
+    body = []
+    for i in range(statements):
+        body.append(f"LET v{i % 100} = (a + b) * {i % 7} - c / 2")
+        if i % 50 == 0:
+            body.append(f"CALL f(v{i % 100}, a + b, 3)")
+    source = "BEGIN\n" + "\n".join(body) + "\nEND\n"
+
+    lex = lexer.Lexer(source)
+    tokens = lex.tokenize()
+    programs = {
+        'tree': Parser(tokens, lex.token_positions).parse(),
+        'hash-consed': Parser(tokens, lex.token_positions, HashConsFactory()).parse(),
+    }
+
+    def best(fn):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        return min(times) * 1000
+
+    print(f"{'Payload':<24} {'Bytes':>12} {'Write (ms)':>12} {'Read (ms)':>12}")
+
+    def row(name, dump, load):
+        data = dump()
+        print(f"{name:<24} {len(data):>12,} {best(dump):>12.1f} {best(lambda: load(data)):>12.1f}")
+
+    row("tokens pickle", lambda: pickle.dumps(tokens, pickle.HIGHEST_PROTOCOL), pickle.loads)
+    row("tokens binary", lambda: dump_tokens(tokens), lambda d: load_tokens(d).tokens())
+    for name, program in programs.items():
+        row(f"AST {name} pickle", lambda: pickle.dumps(program, pickle.HIGHEST_PROTOCOL), pickle.loads)
+        row(f"AST {name} binary", lambda: dump_ast(program), load_ast)
+    data = dump_ast(programs['hash-consed'])
+    row("AST lazy 1 statement", lambda: data, lambda d: ASTReader(d).root.statements[0].materialize())
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,75 @@
+"""Run from the repository root: python -m unittest discover tests"""
+import time
+import unittest
+
+import vectorize
+from interpreter import BudgetExceeded, ExecutionBudget, Interpreter, compile_for_execution
+from units import parse_source
+
+SLOW_PARALLEL_FOR = """
+BEGIN
+LET s = 0
+PARALLEL FOR i = 1 TO 4 DO
+  LET n = 0
+  WHILE n < 3000000 DO
+    LET n = n + 1
+  ENDWHILE
+  LET s = s + n
+ENDFOR
+END
+"""
+
+ARRAY_LOOPS = """
+BEGIN
+LET a = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20]
+FOR i = 0 TO 19 DO
+  LET a[i] = a[i] * 2 + i
+ENDFOR
+PARALLEL FOR j = 0 TO 19 DO
+  LET a[j] = a[j] + 1
+ENDFOR
+END
+"""
+
+
+def interpreter(source, budget=None, workers=1):
+    return Interpreter(compile_for_execution(parse_source(source)), workers=workers, budget=budget)
+
+
+class ParallelBudgetTest(unittest.TestCase):
+    def test_instruction_budget_stops_parallel_chunks(self):
+        for workers in (1, 2):
+            run = interpreter(SLOW_PARALLEL_FOR, ExecutionBudget(instructions=1000), workers)
+            with self.subTest(workers=workers), self.assertRaises(BudgetExceeded) as raised:
+                run.run()
+            self.assertEqual(raised.exception.line, 6)
+            self.assertIn("instruction budget of 1,000 exceeded", str(raised.exception))
+            self.assertGreater(run.executed, 1000)
+            self.assertLess(run.executed, 1000 * workers + 10000)
+
+    def test_time_budget_stops_parallel_chunks(self):
+        for workers in (1, 2):
+            run = interpreter(SLOW_PARALLEL_FOR, ExecutionBudget(seconds=0.2), workers)
+            started = time.perf_counter()
+            with self.subTest(workers=workers), self.assertRaises(BudgetExceeded) as raised:
+                run.run()
+            self.assertLess(time.perf_counter() - started, 3)
+            self.assertIn("time budget of 0.2s exceeded", str(raised.exception))
+            self.assertEqual(run.executed, raised.exception.executed)
+
+    def test_array_loops_are_charged_like_serial_loops(self):
+        run = interpreter(ARRAY_LOOPS.replace("PARALLEL FOR", "FOR"))
+        saved, vectorize.np = vectorize.np, None
+        try:
+            run.run()
+        finally:
+            vectorize.np = saved
+        for workers in (1, 2):
+            parallel = interpreter(ARRAY_LOOPS, workers=workers)
+            parallel.run()
+            self.assertEqual(list(parallel.globals['a']), list(run.globals['a']))
+            self.assertEqual(parallel.executed, run.executed + 1)  # and the PARALLEL_FOR instruction
+
+
+if __name__ == '__main__':
+    unittest.main()
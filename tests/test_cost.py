@@ -0,0 +1,158 @@
+"""Run from the repository root: python -m unittest discover tests"""
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from cost import admission_error, estimate_cost
+from interpreter import BudgetExceeded, ExecutionBudget, Interpreter, compile_for_execution
+from units import parse_source
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STRAIGHT_LINE = """
+BEGIN
+FUNC area(w, h) BEGIN
+  LET a = w * h
+  RETURN a
+END
+LET x = 3
+LET y = x * (x + 2) - 7 / 2
+LET xs = [x, y, 4]
+LET xs[1] = xs[0] + CALL area(x, 2)
+CALL area(y, xs[2])
+END
+"""
+
+LOOPS = """
+BEGIN
+FUNC scale(v, k) BEGIN
+  RETURN v * k
+END
+FUNC twice(m) BEGIN
+  RETURN CALL scale(m, 2)
+END
+LET n = 12
+LET total = 0
+FOR i = 1 TO n DO
+  FOR j IN RANGE(0, 6, 2) DO
+    LET total = total + CALL scale(i, j)
+  ENDFOR
+ENDFOR
+FOR k = 10 TO 1 STEP 0 - 3 DO
+  LET total = total - k
+ENDFOR
+FOR f = 0.5 TO 3 STEP 0.5 DO
+  LET total = total + f
+ENDFOR
+LET c = CALL twice(5)
+END
+"""
+
+WHILE_LOOP = """
+BEGIN
+LET n = 0
+WHILE n < 100000000 DO
+  LET n = n + 1
+ENDWHILE
+END
+"""
+
+
+def executed(source):
+    interpreter = Interpreter(compile_for_execution(parse_source(source)), cache_size=0, workers=1)
+    interpreter.run()
+    return interpreter.executed
+
+
+class EstimateTest(unittest.TestCase):
+    def test_exact_for_straight_line_code(self):
+        estimate = estimate_cost(parse_source(STRAIGHT_LINE))
+        self.assertEqual(estimate.instructions, executed(STRAIGHT_LINE))
+        self.assertEqual((estimate.loop_depth, estimate.functions), (0, 1))
+
+    def test_exact_for_constant_for_loops_and_calls(self):
+        estimate = estimate_cost(parse_source(LOOPS))
+        self.assertEqual(estimate.instructions, executed(LOOPS))
+        self.assertEqual((estimate.loop_depth, estimate.functions), (2, 2))
+
+    def test_upper_bound_with_branches(self):
+        source = LOOPS.replace("LET total = total - k", "IF k > 4 THEN\n    LET total = total - k * 2 + 1\n  ENDIF")
+        source = source.replace("RETURN CALL scale(m, 2)", "IF m < 1 THEN\n    RETURN 0\n  ENDIF\n  RETURN CALL scale(m, 2)")
+        self.assertGreater(estimate_cost(parse_source(source)).instructions, executed(source))
+
+    def test_unbounded_loops_name_their_lines(self):
+        estimate = estimate_cost(parse_source(WHILE_LOOP))
+        self.assertFalse(estimate.bounded)
+        self.assertEqual([d.line for d in estimate.unbounded], [4])
+        source = LOOPS.replace("LET n = 12", "LET n = 12\nLET n = n + 1")
+        self.assertEqual([d.line for d in estimate_cost(parse_source(source)).unbounded], [12])
+
+
+class AdmissionTest(unittest.TestCase):
+    def test_rejects_estimates_over_the_limit(self):
+        estimate = estimate_cost(parse_source(LOOPS))
+        self.assertIsNone(admission_error(estimate, estimate.instructions))
+        self.assertEqual(admission_error(estimate, 100),
+                         f"estimated {estimate.instructions:,} instructions, the limit is 100")
+        self.assertEqual(admission_error(estimate, max_loop_depth=1), "loops nest 2 deep, the limit is 1")
+
+    def test_admits_unbounded_scripts(self):
+        self.assertIsNone(admission_error(estimate_cost(parse_source(WHILE_LOOP)), 100))
+
+
+class BudgetTest(unittest.TestCase):
+    def run_with(self, budget):
+        interpreter = Interpreter(compile_for_execution(parse_source(WHILE_LOOP)), budget=budget)
+        with self.assertRaises(BudgetExceeded) as raised:
+            interpreter.run()
+        return interpreter, raised.exception
+
+    def test_instruction_budget(self):
+        interpreter, error = self.run_with(ExecutionBudget(instructions=1000))
+        self.assertEqual(str(error), "Execution error at line 4: instruction budget of 1,000 exceeded")
+        self.assertEqual(error.executed, interpreter.executed)
+        self.assertGreater(error.executed, 1000)
+        self.assertLess(error.executed, 1020)  # stops within one pass of the loop
+
+    def test_time_budget(self):
+        _, error = self.run_with(ExecutionBudget(seconds=0.1, check_interval=1000))
+        self.assertIn("time budget of 0.1s exceeded after", error.message)
+        self.assertGreaterEqual(error.elapsed, 0.1)
+        self.assertLess(error.elapsed, 2)
+
+    def test_budget_is_not_charged_across_runs(self):
+        interpreter = Interpreter(compile_for_execution(parse_source(LOOPS)),
+                                  budget=ExecutionBudget(instructions=executed(LOOPS)))
+        interpreter.run()
+        interpreter.run()
+
+
+class CommandLineTest(unittest.TestCase):
+    def run_cli(self, source, *flags):
+        fd, path = tempfile.mkstemp(suffix='.lang')
+        with os.fdopen(fd, 'w') as f:
+            f.write(source)
+        self.addCleanup(os.remove, path)
+        result = subprocess.run([sys.executable, os.path.join(ROOT, 'Compiler_Project_phase2.py'), path, *flags],
+                                capture_output=True, text=True, timeout=60, cwd=ROOT)
+        return result.stdout
+
+    def test_max_cost_rejects_before_running(self):
+        output = self.run_cli(LOOPS, '--max-cost', '100', '--run')
+        self.assertIn("Rejected: estimated", output)
+        self.assertNotIn("total =", output)
+        self.assertIn("total =", self.run_cli(LOOPS, '--max-cost', '100000', '--run'))
+
+    def test_timeout_stops_the_run(self):
+        output = self.run_cli(WHILE_LOOP, '--run', '--timeout', '0.2')
+        self.assertIn("Execution error at line 4: time budget of 0.2s exceeded", output)
+
+    def test_max_instructions_stops_the_run(self):
+        output = self.run_cli(WHILE_LOOP, '--run', '--max-instructions', '500')
+        self.assertIn("Execution error at line 4: instruction budget of 500 exceeded", output)
+
+
+if __name__ == '__main__':
+    unittest.main()
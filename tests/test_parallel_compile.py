@@ -0,0 +1,64 @@
+"""Run from the repository root: python -m unittest discover tests"""
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from parallel_compile import parallel_compile, plan_chunks, sequential_compile
+from parse_tree import concrete_tree
+from visitor import children
+
+
+def source(statements: int) -> str:
+    body = []
+    for i in range(statements):
+        body.append(f"LET v{i % 7} = (a + {i}) * 2  {{ statement {i} }}")
+        if i % 10 == 0:
+            body.append(f"FUNC f{i}(x, y) BEGIN\n  WHILE x < y DO\n    LET x = x + 1\n  ENDWHILE\n"
+                        f"  RETURN x\nEND\nIF v1 > {i} THEN\n  CALL f{i}(v1, 3.5)\nENDIF")
+    return "BEGIN\n" + "\n".join(body) + "\nEND\n"
+
+
+def statement_tokens(program):
+    result = []
+    stack = list(reversed(program.statements))
+    while stack:
+        node = stack.pop()
+        if hasattr(node, 'token'):
+            result.append((node.line, node.token))
+        stack.extend(reversed(children(node)))
+    return result
+
+
+class ParallelCompileTest(unittest.TestCase):
+    SOURCE = source(200)
+
+    def compile(self):
+        with ThreadPoolExecutor(4) as executor:
+            return parallel_compile(self.SOURCE, workers=4, executor=executor, min_chunk_size=256)
+
+    def test_source_is_split(self):
+        self.assertEqual(len(plan_chunks(self.SOURCE, 4, 256)), 4)
+
+    def test_matches_sequential_compile(self):
+        expected, result = sequential_compile(self.SOURCE), self.compile()
+        self.assertEqual(result.tokens, expected.tokens)
+        self.assertEqual(result.positions, expected.positions)
+        self.assertEqual(result.symbol_table, expected.symbol_table)
+        self.assertEqual(result.program, expected.program)
+
+    def test_falls_back_to_sequential_on_errors(self):
+        broken = self.SOURCE.replace("ENDWHILE", "ENDFOR", 1)
+        with self.assertRaises(Exception) as expected:
+            sequential_compile(broken)
+        with ThreadPoolExecutor(4) as executor, self.assertRaises(Exception) as raised:
+            parallel_compile(broken, workers=4, executor=executor, min_chunk_size=256)
+        self.assertEqual(str(raised.exception), str(expected.exception))
+
+    def test_statement_tokens_index_the_whole_stream(self):
+        expected, result = sequential_compile(self.SOURCE), self.compile()
+        self.assertEqual(statement_tokens(result.program), statement_tokens(expected.program))
+        self.assertEqual(concrete_tree(result.program, result.positions).render(2),
+                         concrete_tree(expected.program, expected.positions).render(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
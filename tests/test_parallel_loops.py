@@ -0,0 +1,85 @@
+"""Run from the repository root: python -m unittest discover tests"""
+import unittest
+
+from interpreter import ExecutionError, run_program
+from units import parse_source
+
+FLOAT_SUM = """
+BEGIN
+LET s = 0
+PARALLEL FOR i = 1 TO 5000 DO
+  LET s = s + 1 / (i * 3)
+ENDFOR
+END
+"""
+
+REDUCTIONS = """
+BEGIN
+FUNC square(x) BEGIN
+  RETURN x * x
+END
+LET total = 10
+LET product = 1
+LET squares = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
+PARALLEL FOR i = 0 TO 11 DO
+  LET t = CALL square(i)
+  LET squares[i] = t
+  LET total = total + t
+  LET product = product * 2
+ENDFOR
+END
+"""
+
+
+def run(source, **options):
+    return run_program(parse_source(source), **options)
+
+
+def serial(source):
+    return run(source.replace("PARALLEL FOR", "FOR"))
+
+
+class ParallelForTest(unittest.TestCase):
+    def test_reductions_lists_and_temporaries_match_a_serial_loop(self):
+        expected = serial(REDUCTIONS)
+        for workers in (1, 2):
+            result = run(REDUCTIONS, workers=workers)
+            for name in ('total', 'product', 't', 'i'):
+                self.assertEqual(result[name], expected[name], name)
+            self.assertEqual(list(result['squares']), list(expected['squares']))
+        self.assertEqual(expected['total'], 10 + sum(i * i for i in range(12)))
+
+    def test_float_reduction_does_not_depend_on_the_worker_count(self):
+        results = {workers: run(FLOAT_SUM, workers=workers)['s'] for workers in (1, 2, 3)}
+        self.assertEqual(len(set(results.values())), 1, results)
+        self.assertAlmostEqual(results[1], serial(FLOAT_SUM)['s'], places=12)
+
+    def test_falls_back_to_a_serial_loop(self):
+        # float bounds cannot be chunked; an out-of-range write must be reported as usual
+        floats = FLOAT_SUM.replace("TO 5000", "TO 50.5")
+        self.assertEqual(run(floats, workers=1)['s'], serial(floats)['s'])
+        out_of_range = REDUCTIONS.replace("TO 11", "TO 12")
+        with self.assertRaises(ExecutionError) as raised:
+            run(out_of_range, workers=1)
+        self.assertEqual(raised.exception.line, 11)
+
+    def test_rejects_bodies_whose_iterations_depend_on_each_other(self):
+        bodies = {
+            "reads the reduction variable 's'": "LET s = s + i\n  LET u = s",
+            "reads a[...] at an index other than i": "LET a[i] = a[i - 1]",
+            "calls 'f', which is not a pure FUNC": "LET a[i] = CALL f(i)",
+            "may read 't' before assigning it": "LET a[i] = t\n  LET t = i",
+            "assigns the loop variable 'i'": "LET i = i + 1",
+        }
+        for reason, body in bodies.items():
+            source = (f"BEGIN\nLET g = 0\nFUNC f(x) BEGIN\n  RETURN x + g\nEND\n"
+                      f"LET a = [1, 2, 3]\nLET s = 0\nLET t = 0\n"
+                      f"PARALLEL FOR i = 1 TO 2 DO\n  {body}\nENDFOR\nEND\n")
+            with self.subTest(reason):
+                with self.assertRaises(Exception) as raised:
+                    run(source, workers=1)
+                self.assertIn(reason, str(raised.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
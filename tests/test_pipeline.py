@@ -0,0 +1,76 @@
+"""Run from the repository root: python -m unittest discover tests"""
+import io
+import unittest
+
+from analysis import pure_functions
+from bytecode import compile_program
+from optimize import ConstantFolder
+from pipeline import BytecodeEmitter, StreamingCompiler, TreeEmitter
+from units import parse_source
+
+SOURCE = """BEGIN
+{ a comment long enough to cross a chunk boundary }
+FUNC square(x) BEGIN
+  RETURN x * x
+END
+FUNC count(n) BEGIN
+  LET total = 0
+  WHILE total < n DO
+    LET total = total + 1
+  ENDWHILE
+  RETURN total
+END
+LET a = 2 * 3 + 1
+LET xs = [1, 2, 3, 4]
+FOR i = 0 TO 3 DO
+  LET xs[i] = CALL square(xs[i])
+ENDFOR
+LET ys = [0, 0, 0, 0]
+FOR k IN RANGE(0, 4) DO
+  LET ys[k] = xs[k] * 2 + a
+ENDFOR
+IF a > 5 THEN
+  LET b = CALL count(a)
+ELSE
+  LET b = 0
+ENDIF
+PARALLEL FOR j IN RANGE(0, 4) DO
+  LET xs[j] = CALL square(j) + 1
+ENDFOR
+END
+"""
+
+
+def streamed(emitter_class, chunk_size: int) -> str:
+    out = io.StringIO()
+    compiler = StreamingCompiler(emitter_class(out))
+    compiler.compile(io.StringIO(SOURCE), chunk_size)
+    return out.getvalue()
+
+
+def whole_program():
+    return ConstantFolder().transform(parse_source(SOURCE))
+
+
+class StreamingCompilerTest(unittest.TestCase):
+    def test_tree_matches_whole_program(self):
+        expected = str(whole_program())
+        for chunk_size in (1, 7, 1 << 16):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(streamed(TreeEmitter, chunk_size), expected)
+
+    def test_bytecode_matches_whole_program(self):
+        program = whole_program()
+        expected = compile_program(program, pure_functions(program)).disassemble()
+        for chunk_size in (1, 7, 1 << 16):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(streamed(BytecodeEmitter, chunk_size), expected)
+
+    def test_no_diagnostics_for_a_clean_script(self):
+        compiler = StreamingCompiler(TreeEmitter(io.StringIO()))
+        compiler.compile(io.StringIO(SOURCE), 7)
+        self.assertEqual(compiler.diagnostics, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""Run from the repository root: python -m unittest discover tests"""
+import unittest
+
+from interpreter import BudgetExceeded, ExecutionBudget, ExecutionError, run_program
+from prepared import PreparedProgram
+from units import parse_source
+
+SOURCE = """BEGIN
+FUNC score(x, y) BEGIN
+  LET s = 0
+  LET k = 0
+  WHILE k < y DO
+    LET s = s + x * k
+    LET k = k + 1
+  ENDWHILE
+  RETURN s
+END
+LET total = CALL score(x, y) + CALL score(y, x)
+LET ratio = total / (x + y + 1)
+LET squares = [0, 0, 0, 0, 0, 0]
+FOR i = 0 TO 5 DO
+  LET squares[i] = i * x
+ENDFOR
+IF x > 5 THEN
+  LET big = x
+ENDIF
+END
+"""
+
+RECORDS = [{'x': i % 9, 'y': i % 4} for i in range(40)]
+
+
+def plain(outputs):
+    """outputs with lists as plain lists, so NumericList and list compare alike"""
+    return {name: value.tolist() if hasattr(value, 'tolist') else value for name, value in outputs.items()}
+
+
+class PreparedProgramTest(unittest.TestCase):
+    def setUp(self):
+        self.program = parse_source(SOURCE)
+
+    def expected(self, records):
+        return [plain(run_program(self.program, variables=dict(record))) for record in records]
+
+    def test_run_all_matches_run_program_per_record(self):
+        expected = self.expected(RECORDS)
+        for batch_size in (1, 7, 1000):
+            with self.subTest(batch_size=batch_size):
+                results = PreparedProgram(self.program).run_all(RECORDS, batch_size)
+                self.assertEqual([plain(outputs) for outputs in results], expected)
+
+    def test_variables_do_not_leak_between_records(self):
+        results = list(PreparedProgram(self.program, outputs=['big']).run_all([{'x': 8, 'y': 1}, {'x': 1, 'y': 1}]))
+        self.assertEqual(results, [{'big': 8}, {'big': None}])
+
+    def test_run_batches_groups_records(self):
+        batches = list(PreparedProgram(self.program, outputs=['total']).run_batches(iter(RECORDS), 16))
+        self.assertEqual([len(batch) for batch in batches], [16, 16, 8])
+        with self.assertRaises(Exception):
+            next(PreparedProgram(self.program).run_batches(RECORDS, 0))
+
+    def test_failed_record_does_not_affect_the_next(self):
+        prepared = PreparedProgram(self.program, outputs=['total', 'ratio'])
+        with self.assertRaises(ExecutionError):
+            prepared.run({'x': 1})  # y is undefined
+        self.assertEqual(prepared.run(RECORDS[5]), {name: self.expected([RECORDS[5]])[0][name]
+                                                     for name in ('total', 'ratio')})
+
+    def test_budget_applies_to_each_record(self):
+        prepared = PreparedProgram(self.program, outputs=['total'], budget=ExecutionBudget(instructions=2000))
+        expected = self.expected([{'x': 2, 'y': 3}])[0]['total']
+        for _ in range(20):  # far more than 2000 instructions in all
+            self.assertEqual(prepared.run({'x': 2, 'y': 3})['total'], expected)
+        with self.assertRaises(BudgetExceeded):
+            prepared.run({'x': 2, 'y': 1000})
+
+if __name__ == '__main__':
+    unittest.main()
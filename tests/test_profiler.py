@@ -0,0 +1,45 @@
+"""Run from the repository root: python -m unittest discover tests"""
+import itertools
+import unittest
+
+from interpreter import run_program
+from profiler import ExecutionProfiler
+from units import parse_source
+
+LOOP = """
+BEGIN
+LET i = 0
+WHILE i < 3 DO
+  LET i = i + 1
+  IF i > 1 THEN
+    LET j = i
+  ENDIF
+ENDWHILE
+END
+"""
+
+
+class ExecutionProfilerTest(unittest.TestCase):
+    def profile(self, source):
+        profiler = ExecutionProfiler(clock=itertools.count().__next__)  # one time unit per event
+        run_program(parse_source(source), profiler=profiler)
+        return {(s.line, s.kind): s for s in profiler.statements.values()}, profiler
+
+    def test_compound_statement_total_includes_its_body(self):
+        stats, _ = self.profile(LOOP)
+        loop, body, branch, inner = stats[(4, 'WHILE')], stats[(5, 'LET')], stats[(6, 'IF')], stats[(7, 'LET')]
+        self.assertEqual(loop.hits, 4)
+        self.assertEqual(branch.total_time, branch.self_time + inner.total_time)
+        self.assertEqual(loop.total_time, loop.self_time + body.total_time + branch.total_time)
+        self.assertGreater(loop.total_time, loop.self_time)
+
+    def test_collapsed_stacks_nest_the_body_under_the_loop(self):
+        _, profiler = self.profile(LOOP)
+        stacks = [line.rsplit(' ', 1)[0] for line in profiler.collapsed().splitlines()]
+        self.assertIn('<main>;L4 WHILE;L5 LET', stacks)
+        self.assertIn('<main>;L4 WHILE;L6 IF;L7 LET', stacks)
+        self.assertNotIn('<main>;L5 LET', stacks)
+
+
+if __name__ == '__main__':
+    unittest.main()
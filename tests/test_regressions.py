@@ -0,0 +1,64 @@
+"""Programs that once ran differently with an optimization on and off.
+
+Run from the repository root: python -m unittest discover tests
+"""
+import unittest
+
+import Compiler_Project_phase1 as lexer
+from Compiler_Project_phase2 import Parser
+from interpreter import run_program
+from optimize import inline_functions
+
+READS_GLOBAL_BEFORE_LET = """
+BEGIN
+LET x = 5
+FUNC f(y) BEGIN
+  LET z = x + y
+  LET x = 100
+  RETURN z
+END
+LET r1 = CALL f(1)
+LET x = 50
+LET r2 = CALL f(1)
+END
+"""
+
+INT_AND_FLOAT_ARGUMENTS = """
+BEGIN
+FUNC ident(x) BEGIN
+  RETURN x + 0
+END
+LET a = CALL ident(1)
+LET b = CALL ident(1.0)
+END
+"""
+
+
+def parse(source):
+    lex = lexer.Lexer(source)
+    tokens = lex.tokenize()
+    return Parser(tokens, lex.token_positions).parse()
+
+
+class PureFunctionCacheTest(unittest.TestCase):
+    def test_read_before_local_let_is_not_cached(self):
+        for cache_size in (256, 0):
+            variables = run_program(parse(READS_GLOBAL_BEFORE_LET), cache_size=cache_size)
+            self.assertEqual((variables['r1'], variables['r2']), (6, 51))
+
+    def test_equal_arguments_of_different_types_are_cached_apart(self):
+        for cache_size in (256, 0):
+            variables = run_program(parse(INT_AND_FLOAT_ARGUMENTS), cache_size=cache_size)
+            self.assertIs(type(variables['a']), int)
+            self.assertIs(type(variables['b']), float)
+
+
+class InlineTest(unittest.TestCase):
+    def test_read_before_local_let_still_reads_the_global(self):
+        inlined, _ = inline_functions(parse(READS_GLOBAL_BEFORE_LET))
+        variables = run_program(inlined)
+        self.assertEqual((variables['r1'], variables['r2']), (6, 51))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""Run from the repository root: python -m unittest discover tests"""
+import gc
+import os
+import tempfile
+import unittest
+import warnings
+
+import Compiler_Project_phase1 as lexer
+from Compiler_Project_phase2 import Parser
+from hashcons import HashConsFactory
+from serialization import ASTReader, FormatError, TokenReader, dump_ast, dump_tokens, load_ast, load_tokens
+
+SOURCE = """
+BEGIN
+FUNC area(w, h) BEGIN
+  RETURN w * h
+END
+LET xs = [1, 2.5, 3]
+LET total = 0
+FOR i IN RANGE(0, 3) DO
+  LET total = total + xs[i]
+ENDFOR
+PARALLEL FOR j = 1 TO 4 STEP 1 DO
+  LET xs[0] = CALL area(j, 2)
+ENDFOR
+WHILE total > 10 DO
+  LET total = total - 1
+ENDWHILE
+IF total = 0 THEN
+  LET total = 1
+ELSE
+  CALL area(total, 1)
+ENDIF
+END
+"""
+
+
+class SerializationTest(unittest.TestCase):
+    def setUp(self):
+        lex = lexer.Lexer(SOURCE)
+        self.tokens = lex.tokenize()
+        self.positions = lex.token_positions
+
+    def parse(self, factory=None):
+        return Parser(self.tokens, self.positions, factory).parse()
+
+    def test_tokens_round_trip(self):
+        reader = load_tokens(dump_tokens(self.tokens))
+        self.assertFalse(reader.has_positions)
+        self.assertEqual(reader.tokens(), self.tokens)
+
+    def test_tokens_round_trip_with_positions(self):
+        reader = load_tokens(dump_tokens(self.tokens, self.positions))
+        self.assertEqual(reader.tokens(), self.tokens)
+        self.assertEqual(reader.positions(), self.positions)
+
+    def test_ast_round_trip(self):
+        program = self.parse()
+        for share in (True, False):
+            self.assertEqual(load_ast(dump_ast(program, share)), program)
+        self.assertEqual(load_ast(dump_ast(self.parse(HashConsFactory()))), program)
+
+    def test_statements_keep_their_first_token(self):
+        program = self.parse()
+        program.statements[1].token = -1  # as for statements the optimizer creates
+        loaded = load_ast(dump_ast(program))
+        tokens = lambda p: [(stmt.line, stmt.token) for stmt in p.statements]
+        self.assertEqual(tokens(loaded), tokens(program))
+        self.assertEqual(loaded.statements[0].token, 1)
+        self.assertEqual(loaded.statements[0].body[0].token, program.statements[0].body[0].token)
+        self.assertEqual(ASTReader(dump_ast(program)).root.statements[1].token, -1)
+
+    def test_for_flags_come_back_as_bools(self):
+        loops = [stmt for stmt in load_ast(dump_ast(self.parse())).statements if type(stmt).__name__ == 'ForStatement']
+        self.assertEqual([(loop.inclusive, loop.parallel) for loop in loops], [(False, False), (True, True)])
+        for loop in loops:
+            self.assertIs(type(loop.inclusive), bool)
+            self.assertIs(type(loop.parallel), bool)
+
+    def test_lazy_statement_matches_decoded(self):
+        program = self.parse()
+        reader = ASTReader(dump_ast(program))
+        self.assertEqual([stmt.materialize() for stmt in reader.statements()], program.statements)
+
+    def write(self, data: bytes) -> str:
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_open_reads_a_mapped_file(self):
+        path = self.write(dump_tokens(self.tokens, self.positions))
+        with TokenReader.open(path) as reader:
+            self.assertEqual(reader.tokens(), self.tokens)
+
+    def test_open_closes_the_file_when_reading_fails(self):
+        for data, error in ((b'', ValueError), (b'not a compiler file at all', FormatError),
+                            (dump_ast(self.parse()), FormatError)):
+            path = self.write(data)
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always', ResourceWarning)
+                with self.assertRaises(error):
+                    TokenReader.open(path)
+                gc.collect()
+            self.assertEqual([w for w in caught if issubclass(w.category, ResourceWarning)], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
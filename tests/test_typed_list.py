@@ -0,0 +1,94 @@
+"""Run from the repository root: python -m unittest discover tests"""
+import unittest
+
+from interpreter import run_program
+from typed_list import NumericList, make_list
+from units import parse_source
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class MakeListTest(unittest.TestCase):
+    def test_ints_and_floats_are_unboxed(self):
+        for items, typecode in (([1, 2, 3], 'q'), ([1.5, -2.0], 'd')):
+            with self.subTest(items=items):
+                result = make_list(items)
+                self.assertIsInstance(result, NumericList)
+                self.assertEqual(result.typecode, typecode)
+                self.assertEqual(result.tolist(), items)
+                self.assertEqual(result, items)
+
+    def test_mixed_values_stay_plain_lists(self):
+        for items in ([1, 2.0], [1, True], [True, False], [[1], [2]], ["a"], [2 ** 70, 1], []):
+            with self.subTest(items=items):
+                result = make_list(items)
+                self.assertIs(type(result), list)
+                self.assertEqual(result, items)
+
+
+class NumericListTest(unittest.TestCase):
+    def test_same_type_write_stays_unboxed(self):
+        items = make_list([1, 2, 3])
+        items[1] = 20
+        self.assertEqual(items.typecode, 'q')
+        self.assertEqual(items, [1, 20, 3])
+
+    def test_write_of_another_type_makes_a_plain_list(self):
+        for value in (2.5, True, [4], "x", 2 ** 70):
+            with self.subTest(value=value):
+                items = make_list([1, 2, 3])
+                items[1] = value
+                self.assertIsNone(items.typecode)
+                self.assertEqual(items.tolist(), [1, value, 3])
+                self.assertIs(type(items[1]), type(value))
+
+    def test_bad_index_leaves_the_list_unboxed(self):
+        items = make_list([1.0, 2.0])
+        with self.assertRaises(IndexError):
+            items[5] = "x"
+        self.assertEqual(items.typecode, 'd')
+
+    def test_slices_share_the_buffer(self):
+        items = make_list([1, 2, 3, 4])
+        view = items[1:3]
+        view[0] = 20
+        self.assertEqual(items, [1, 20, 3, 4])
+
+    @unittest.skipIf(np is None, "NumPy is not installed")
+    def test_numpy_shares_the_buffer(self):
+        items = make_list([1.0, 2.0, 3.0])
+        array = np.asarray(items)
+        array[0] = 10.0
+        self.assertEqual(items[0], 10.0)
+        shared = NumericList.from_buffer(array)
+        shared[2] = 30.0
+        self.assertEqual(array[2], 30.0)
+
+
+class ScriptListTest(unittest.TestCase):
+    def run_source(self, source):
+        return run_program(parse_source(source))
+
+    def test_literals_are_unboxed_until_mixed(self):
+        variables = self.run_source("""BEGIN
+LET ints = [1, 2, 3]
+LET floats = [0.5, 1.5]
+LET mixed = [1, 2.5]
+LET changed = [1, 2, 3]
+LET changed[0] = 0.5
+LET total = ints[0] + ints[2] + floats[1]
+END
+""")
+        self.assertEqual(variables['ints'].typecode, 'q')
+        self.assertEqual(variables['floats'].typecode, 'd')
+        self.assertIs(type(variables['mixed']), list)
+        self.assertEqual(variables['changed'].tolist(), [0.5, 2, 3])
+        self.assertIsNone(variables['changed'].typecode)
+        self.assertEqual(variables['total'], 5.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
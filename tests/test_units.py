@@ -0,0 +1,97 @@
+"""Run from the repository root: python -m unittest discover tests"""
+import os
+import tempfile
+import unittest
+
+from interpreter import Interpreter
+from units import UnitBuilder, link
+
+SHAPES = """BEGIN
+FUNC area(w, h) BEGIN
+  RETURN w * h
+END
+END
+"""
+
+MAIN = """BEGIN
+LET result = CALL area(3, 4)
+END
+"""
+
+
+class UnitBuilderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache_dir = os.path.join(self.directory.name, 'cache')
+        self.write('shapes.lang', SHAPES)
+        self.write('main.lang', MAIN)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory.name, name)
+
+    def write(self, name: str, source: str):
+        with open(self.path(name), 'w') as f:
+            f.write(source)
+
+    def build(self, *names):
+        """{file name: log entry} and the built units"""
+        builder = UnitBuilder(self.cache_dir)
+        units = builder.build([self.path(name) for name in names])
+        log = {}
+        for line in builder.log:
+            path, status = line.split(': ', 1)
+            log[os.path.basename(path)] = status
+        return log, units
+
+    @staticmethod
+    def execute(units):
+        return Interpreter(link(units)).run()
+
+    def test_first_build_compiles_everything(self):
+        log, units = self.build('shapes.lang', 'main.lang')
+        self.assertEqual(log, {'shapes.lang': 'compiled (new)', 'main.lang': 'compiled (new)'})
+        self.assertEqual(self.execute(units)['result'], 12)
+
+    def test_unchanged_sources_are_reused(self):
+        self.build('shapes.lang', 'main.lang')
+        log, units = self.build('shapes.lang', 'main.lang')
+        self.assertEqual(log, {'shapes.lang': 'up to date', 'main.lang': 'up to date'})
+        self.assertEqual(self.execute(units)['result'], 12)
+
+    def test_same_interface_does_not_rebuild_callers(self):
+        self.build('shapes.lang', 'main.lang')
+        self.write('shapes.lang', SHAPES.replace("RETURN w * h", "LET a = w * h\n  RETURN a + 1"))
+        log, units = self.build('shapes.lang', 'main.lang')
+        self.assertEqual(log, {'shapes.lang': 'compiled (source changed)', 'main.lang': 'up to date'})
+        self.assertEqual(self.execute(units)['result'], 13)
+
+    def test_changed_interface_rebuilds_callers(self):
+        self.build('shapes.lang', 'main.lang')
+        self.write('shapes.lang', SHAPES.replace("area(w, h)", "area(w, h, d)").replace("w * h", "w * h * d"))
+        log, units = self.build('shapes.lang', 'main.lang')
+        self.assertEqual(log, {'shapes.lang': 'compiled (source changed)',
+                               'main.lang': "compiled (interface of 'area' changed)"})
+        self.assertIn("expects 3 arguments", str(units[1].diagnostics))
+
+    def test_purity_change_rebuilds_callers(self):
+        _, units = self.build('shapes.lang', 'main.lang')
+        self.assertTrue(units[0].interface['area'].pure)
+        self.write('shapes.lang', "BEGIN\nLET scale = 1\n" + SHAPES[len("BEGIN\n"):].replace(
+            "RETURN w * h", "LET scale = scale + 1\n  RETURN w * h"))
+        log, units = self.build('shapes.lang', 'main.lang')
+        self.assertFalse(units[0].interface['area'].pure)
+        self.assertEqual(log['main.lang'], "compiled (interface of 'area' changed)")
+
+    def test_moved_function_rebuilds_callers(self):
+        self.build('shapes.lang', 'main.lang')
+        self.write('shapes.lang', "BEGIN\nLET unit = 1\nEND\n")
+        self.write('geometry.lang', SHAPES)
+        log, units = self.build('shapes.lang', 'geometry.lang', 'main.lang')
+        moved_to = os.path.relpath(self.path('geometry.lang'))
+        self.assertEqual(log['main.lang'], f"compiled ('area' is now defined in {moved_to})")
+        self.assertEqual(self.execute(units)['result'], 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""Run from the repository root: python -m unittest discover tests"""
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import Compiler_Project_phase1 as lexer
+from xref import CrossReferenceIndex, source_digest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SHAPES = """
+BEGIN
+FUNC area(w, h) BEGIN
+  RETURN w * h
+END
+END
+"""
+
+MAIN = """
+BEGIN
+LET a = CALL area(2, 3)
+END
+"""
+
+
+def lex(source):
+    lex = lexer.Lexer(source)
+    return lex.tokenize(), lex.token_positions
+
+
+class CrossReferenceIndexTest(unittest.TestCase):
+    def test_update_skips_unchanged_sources(self):
+        index = CrossReferenceIndex()
+        self.assertTrue(index.update('main.lang', *lex(MAIN), source_digest(MAIN)))
+        self.assertFalse(index.update('main.lang', *lex(MAIN), source_digest(MAIN)))
+        changed = MAIN.replace("2, 3", "4, 5")
+        self.assertTrue(index.update('main.lang', *lex(changed), source_digest(changed)))
+        self.assertEqual([str(site) for site in index.call_sites('area')], ["main.lang:3:14 (top level)"])
+
+    def test_saved_index_remembers_digests(self):
+        index = CrossReferenceIndex()
+        index.update('shapes.lang', *lex(SHAPES), source_digest(SHAPES))
+        index.update('main.lang', *lex(MAIN), source_digest(MAIN))
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        index.save(path)
+
+        loaded = CrossReferenceIndex.load(path)
+        self.assertFalse(loaded.update('shapes.lang', *lex(SHAPES), source_digest(SHAPES)))
+        self.assertEqual(loaded.function_definitions('area'), index.function_definitions('area'))
+        self.assertEqual(loaded.callers('area'), {'<main>'})
+
+    def test_command_line_keeps_the_index_between_runs(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for name, source in (('shapes.lang', SHAPES), ('main.lang', MAIN)):
+            with open(os.path.join(directory.name, name), 'w') as f:
+                f.write(source)
+        index_file = os.path.join(directory.name, 'index.json')
+
+        def xref(name):
+            command = [sys.executable, os.path.join(ROOT, 'Compiler_Project_phase2.py'), name,
+                       '--xref', 'area', '--xref-index', index_file]
+            return subprocess.run(command, capture_output=True, text=True, timeout=60,
+                                  cwd=directory.name).stdout
+
+        xref('shapes.lang')
+        output = xref('main.lang')
+        self.assertIn("function defined at shapes.lang:3:6", output)
+        self.assertIn("called at main.lang:3:14", output)
+        saved = os.stat(index_file).st_mtime_ns
+        xref('main.lang')
+        self.assertEqual(os.stat(index_file).st_mtime_ns, saved)
+
+
+if __name__ == '__main__':
+    unittest.main()
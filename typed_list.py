@@ -0,0 +1,192 @@
+"""Runtime lists that store numbers unboxed.
+
+A list literal whose elements are all ints or all floats becomes a
+NumericList backed by an array.array ('q' or 'd'): 8 bytes per element
+instead of a pointer plus a boxed number. Writing an element of another type
+(a float into an int list, a bool, a list, an int that does not fit in 64
+bits) turns the list into an ordinary Python list in place, so scripts see
+exactly the semantics of a Python list either way.
+
+Slices are views on the same buffer, and numpy.asarray(lst) or
+memoryview(lst) share it without copying; NumericList.from_buffer wraps an
+existing int64/float64 buffer, such as a NumPy array, the same way.
+"""
+from array import array
+from typing import List, Union
+
+TYPECODES = {int: 'q', float: 'd'}
+KINDS = {'q': int, 'd': float}
+
+
+class NumericList:
+    """store is a 1-D memoryview of format 'q' or 'd' holding elements of type
+    kind, or a plain list (kind None) once a write made the list mixed. The
+    interpreter indexes store directly when kind matches."""
+
+    __slots__ = ('store', 'kind')
+
+    def __init__(self, data: memoryview):
+        self.store = data
+        self.kind = KINDS[data.format]
+
+    @classmethod
+    def from_buffer(cls, buffer) -> 'NumericList':
+        """Share a writable 1-D int64 or float64 buffer, e.g. a NumPy array"""
+        data = memoryview(buffer)
+        if data.ndim != 1 or data.itemsize != 8 or data.format not in ('q', 'l', 'd'):
+            raise TypeError(f"expected a 1-D int64 or float64 buffer, got format '{data.format}'")
+        if data.readonly:
+            raise TypeError("buffer is read-only")
+        if data.format == 'l':
+            data = data.cast('B').cast('q')  # same layout; requires a contiguous buffer
+        return cls(data)
+
+    @property
+    def typecode(self):
+        """'q' or 'd' while the elements are stored unboxed, None once generic"""
+        return None if self.kind is None else self.store.format
+
+    def tolist(self) -> list:
+        return self.store.tolist() if self.kind is not None else list(self.store)
+
+    def _generalize(self):
+        """Switch to a plain Python list; views taken earlier keep the old buffer"""
+        self.store = self.store.tolist()
+        self.kind = None
+
+    # Sequence protocol
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, index):
+        if self.kind is None:
+            return self.store[index]
+        try:
+            if isinstance(index, slice):
+                return NumericList(self.store[index])
+            return self.store[index]
+        except IndexError:
+            raise IndexError("list index out of range") from None
+        except TypeError:
+            raise _index_error(index) from None
+
+    def __setitem__(self, index, value):
+        if self.kind is not None:
+            data = self.store
+            if isinstance(index, slice):
+                values = value.tolist() if isinstance(value, NumericList) else list(value)
+                if len(values) == len(range(*index.indices(len(data)))) and _homogeneous(values, self.kind):
+                    try:
+                        data[index] = array(data.format, values)
+                        return
+                    except OverflowError:
+                        pass
+                value = values
+            else:
+                try:
+                    if type(value) is self.kind:
+                        data[index] = value
+                        return
+                    data[index]  # a bad index raises before the list is converted
+                except ValueError:  # an int that does not fit in 64 bits
+                    pass
+                except IndexError:
+                    raise IndexError("list assignment index out of range") from None
+                except TypeError:
+                    raise _index_error(index) from None
+            self._generalize()
+        self.store[index] = value
+
+    def __iter__(self):
+        return iter(self.store.tolist() if self.kind is not None else self.store)
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+    # Comparison and operators behave as on Python lists: + concatenates, * repeats
+    def __eq__(self, other):
+        if isinstance(other, (NumericList, list)):
+            return self.tolist() == list(other)
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, (NumericList, list)):
+            return self.tolist() < list(other)
+        return NotImplemented
+
+    def __gt__(self, other):
+        if isinstance(other, (NumericList, list)):
+            return self.tolist() > list(other)
+        return NotImplemented
+
+    __hash__ = None  # mutable, like list
+
+    def __add__(self, other):
+        if isinstance(other, NumericList):
+            if self.kind is not None and self.kind is other.kind:
+                joined = array(self.store.format)
+                joined.frombytes(self.store.tobytes())
+                joined.frombytes(other.store.tobytes())
+                return NumericList(memoryview(joined))
+            return make_list(self.tolist() + other.tolist())
+        if isinstance(other, list):
+            return make_list(self.tolist() + other)
+        return NotImplemented
+
+    def __radd__(self, other):
+        if isinstance(other, list):
+            return make_list(other + self.tolist())
+        return NotImplemented
+
+    def __mul__(self, count):
+        if isinstance(count, int):
+            return make_list(self.tolist() * count)
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __reduce__(self):
+        if self.kind is None:
+            return list, (self.store,)
+        return _restore, (self.store.format, self.store.tobytes())
+
+    # Buffer sharing
+    def __buffer__(self, flags):
+        if self.kind is None:
+            raise TypeError("list holds mixed values and has no numeric buffer")
+        return self.store
+
+    def __array__(self, dtype=None, copy=None):
+        import numpy as np
+        if self.kind is None:
+            return np.array(self.store, dtype=dtype)
+        result = np.asarray(self.store)  # strided views are shared too
+        return result if dtype is None else result.astype(dtype, copy=bool(copy))
+
+
+def _restore(typecode: str, data: bytes) -> NumericList:
+    items = array(typecode)
+    items.frombytes(data)
+    return NumericList(memoryview(items))
+
+
+def _index_error(index) -> TypeError:
+    return TypeError(f"list indices must be integers or slices, not {type(index).__name__}")
+
+
+def _homogeneous(values: list, kind: type) -> bool:
+    return all(type(value) is kind for value in values)
+
+
+def make_list(items: List[object]) -> Union[list, NumericList]:
+    """A NumericList when items are all ints or all floats, else items itself"""
+    if not items:
+        return items
+    kind = type(items[0])
+    typecode = TYPECODES.get(kind)
+    if typecode is None or not _homogeneous(items, kind):
+        return items
+    try:
+        return NumericList(memoryview(array(typecode, items)))
+    except OverflowError:  # ints wider than 64 bits stay boxed
+        return items
@@ -0,0 +1,294 @@
+"""Separate compilation: each source file is a unit, rebuilt only when needed.
+
+A unit compiles to an interface, the FUNCs it defines with their parameter
+lists (taken from the symbol table) and whether each is pure, plus its
+compiled code. CALLs to FUNCs defined in another file are resolved against
+that unit's interface: they are checked for arity, keep the caller pure when
+the callee is, and are bound when the units are linked.
+
+A unit is recompiled when its own source changed, or when a FUNC it calls
+changed interface (e.g. gained a parameter or stopped being pure) or moved to
+another file. A change that leaves a unit's interface as it was stops there:
+the units calling it are not rebuilt.
+
+    python units.py shapes.lang stats.lang main.lang --run
+
+Linking concatenates the units' top-level code in the order the files are
+given. Compiled units are kept in .unitcache (see --cache-dir).
+"""
+import argparse
+import hashlib
+import os
+import pickle
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+import Compiler_Project_phase1 as lexer
+from Compiler_Project_phase2 import Parser
+from analysis import (
+    ArityCheck, CallGraphBuilder, Diagnostic, PurityAnalysis, SymbolCollector, UndeclaredIdentifierCheck
+)
+from ast_nodes import Program
+from bytecode import LOAD_CONST, RETURN, MAIN, CodeObject, CompiledProgram, compile_program, relocate
+from interpreter import DEFAULT_BUILTINS, Interpreter
+from visitor import PassManager
+
+DEFAULT_CACHE_DIR = '.unitcache'
+CACHE_FILE = 'units.pickle'
+CACHE_VERSION = 2  # bump when the compiled code format changes
+
+
+@dataclass(frozen=True)
+class FunctionInterface:
+    """What other units may rely on about a FUNC"""
+    parameters: Tuple[str, ...]
+    pure: bool
+
+
+@dataclass
+class CompiledUnit:
+    path: str
+    digest: str  # sha256 of the source
+    definitions: Dict[str, Tuple[str, ...]]  # FUNC -> parameters, known from parsing alone
+    externals: List[str]  # names CALLed but not defined here
+    imports: Dict[str, Optional[Tuple[str, FunctionInterface]]]  # external -> (unit, interface) compiled against
+    interface: Dict[str, FunctionInterface]
+    code: CompiledProgram
+    diagnostics: List[Diagnostic]
+
+
+def parse_source(source: str) -> Program:
+    lex = lexer.Lexer(source)
+    tokens = lex.tokenize()
+    return Parser(tokens, lex.token_positions).parse()
+
+
+def scan(program: Program) -> Tuple[Dict[str, Tuple[str, ...]], List[str]]:
+    """The FUNCs program defines and the names it CALLs without defining them"""
+    results = PassManager([SymbolCollector(), CallGraphBuilder()]).run(program)
+    definitions = {name: tuple(func.parameters) for name, func in results['symbols'].functions.items()}
+    called = set().union(*results['call_graph'].values())
+    return definitions, sorted(called - set(definitions))
+
+
+def compile_unit(path: str, digest: str, program: Program,
+                 imports: Dict[str, Optional[Tuple[str, FunctionInterface]]],
+                 builtins=DEFAULT_BUILTINS) -> CompiledUnit:
+    """Check and compile one unit against the interfaces of the FUNCs it imports"""
+    resolved = {name: entry[1] for name, entry in imports.items() if entry is not None}
+    imported_pure = {name for name, interface in resolved.items() if interface.pure}
+    collector = SymbolCollector()
+    passes = [
+        collector,
+        UndeclaredIdentifierCheck(set(builtins) | set(resolved)),
+        ArityCheck({name: list(interface.parameters) for name, interface in resolved.items()}),
+        PurityAnalysis(imported_pure),
+    ]
+    results = PassManager(passes).run(program)
+    diagnostics = sorted(collector.diagnostics + results['undeclared'] + results['arity'],
+                         key=lambda d: d.line)
+    pure = results['purity']
+    definitions = {name: tuple(func.parameters) for name, func in results['symbols'].functions.items()}
+    interface = {name: FunctionInterface(parameters, name in pure) for name, parameters in definitions.items()}
+    code = compile_program(program, pure | imported_pure)
+    return CompiledUnit(path, digest, definitions, sorted(imports), imports, interface, code, diagnostics)
+
+
+def _reachable(start: str, deps: Dict[str, Set[str]]) -> Set[str]:
+    seen = set()
+    stack = [start]
+    while stack:
+        for dep in deps[stack.pop()]:
+            if dep not in seen:
+                seen.add(dep)
+                stack.append(dep)
+    return seen
+
+
+def build_order(deps: Dict[str, Set[str]]) -> List[List[str]]:
+    """Groups of mutually dependent units, each group after the units it depends on"""
+    reach = {unit: _reachable(unit, deps) for unit in deps}
+    groups = []
+    done = set()
+    remaining = list(deps)
+    while remaining:
+        for unit in remaining:
+            group = [other for other in remaining
+                     if other == unit or (other in reach[unit] and unit in reach[other])]
+            if all(dep in done or dep in group for member in group for dep in deps[member]):
+                break
+        groups.append(group)
+        done.update(group)
+        remaining = [unit for unit in remaining if unit not in done]
+    return groups
+
+
+class UnitBuilder:
+    """Builds a set of source files, reusing the compiled units cached in cache_dir.
+    log records, per file, whether it was compiled and why."""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, builtins=DEFAULT_BUILTINS):
+        self.cache_dir = cache_dir
+        self.builtins = builtins
+        self.log: List[str] = []
+
+    def build(self, paths: List[str]) -> List[CompiledUnit]:
+        """Compile what changed and return the units in the order of paths"""
+        cache = self.load_cache()
+        keys = [os.path.abspath(path) for path in paths]
+        sources, digests, programs, definitions, externals = {}, {}, {}, {}, {}
+        for key in keys:
+            with open(key) as f:
+                sources[key] = f.read()
+            digests[key] = hashlib.sha256(sources[key].encode()).hexdigest()
+            cached = cache.get(key)
+            if cached is not None and cached.digest == digests[key]:
+                definitions[key], externals[key] = cached.definitions, cached.externals
+            else:
+                programs[key] = self.parse(key, sources[key])
+                definitions[key], externals[key] = scan(programs[key])
+
+        owners: Dict[str, str] = {}
+        for key in keys:
+            for name in definitions[key]:
+                if name in owners:
+                    raise Exception(f"Link error: function '{name}' is defined in both "
+                                    f"{os.path.relpath(owners[name])} and {os.path.relpath(key)}")
+                owners[name] = key
+        deps = {key: {owners[name] for name in externals[key] if name in owners} for key in keys}
+
+        self.log = []
+        units: Dict[str, CompiledUnit] = {}
+        try:
+            for group in build_order(deps):
+                for key in group:
+                    imports = {name: self.resolve(name, owners, group, definitions, units)
+                               for name in externals[key]}
+                    cached = cache.get(key)
+                    reason = self.stale(cached, digests[key], imports)
+                    if reason is None:
+                        units[key] = cached
+                        self.log.append(f"{os.path.relpath(key)}: up to date")
+                        continue
+                    program = programs.get(key) or self.parse(key, sources[key])
+                    try:
+                        units[key] = compile_unit(key, digests[key], program, imports, self.builtins)
+                    except Exception as e:
+                        raise Exception(f"{os.path.relpath(key)}: {e}") from e
+                    self.log.append(f"{os.path.relpath(key)}: compiled ({reason})")
+        finally:
+            self.save_cache({**cache, **units})  # keep what compiled even if a later file failed
+        return [units[key] for key in keys]
+
+    @staticmethod
+    def resolve(name: str, owners: Dict[str, str], group: List[str],
+                definitions: Dict[str, Dict[str, Tuple[str, ...]]], units: Dict[str, CompiledUnit]):
+        """(defining unit, interface) for a CALLed FUNC, None for a builtin or undefined name"""
+        owner = owners.get(name)
+        if owner is None:
+            return None
+        if owner in group:
+            # Mutually dependent files: the callee's purity is not known yet, so assume impure
+            return owner, FunctionInterface(definitions[owner][name], False)
+        return owner, units[owner].interface[name]
+
+    @staticmethod
+    def parse(key: str, source: str) -> Program:
+        try:
+            return parse_source(source)
+        except Exception as e:
+            raise Exception(f"{os.path.relpath(key)}: {e}") from e
+
+    @staticmethod
+    def stale(cached: Optional[CompiledUnit], digest: str, imports) -> Optional[str]:
+        """Why the unit must be recompiled, or None if the cached one is current"""
+        if cached is None:
+            return "new"
+        if cached.digest != digest:
+            return "source changed"
+        for name, entry in imports.items():
+            old = cached.imports.get(name)
+            if old == entry:
+                continue
+            if entry is None:
+                return f"'{name}' is no longer defined"
+            if old is None or old[0] != entry[0]:
+                return f"'{name}' is now defined in {os.path.relpath(entry[0])}"
+            return f"interface of '{name}' changed"
+        return None
+
+    def load_cache(self) -> Dict[str, CompiledUnit]:
+        try:
+            with open(os.path.join(self.cache_dir, CACHE_FILE), 'rb') as f:
+                version, units = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, ValueError):
+            return {}
+        return units if version == CACHE_VERSION else {}
+
+    def save_cache(self, units: Dict[str, CompiledUnit]):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, CACHE_FILE)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump((CACHE_VERSION, units), f)
+        os.replace(path + '.tmp', path)  # a failed build leaves the old cache intact
+
+
+def _append_main(target: CodeObject, code: CodeObject):
+    """Append code's top-level instructions to target, without the final return"""
+    offset, statements = len(target.instructions), len(target.statements)
+    for (op, arg), line in zip(code.instructions[:-2], code.lines[:-2]):  # drop LOAD_CONST None, RETURN
+        target.emit(op, relocate(op, arg, offset, statements), line)
+    target.statements.extend(code.statements)
+
+
+def link(units: List[CompiledUnit]) -> CompiledProgram:
+    """One program with the FUNCs of every unit, running their top-level code in order"""
+    main = CodeObject(MAIN, [])
+    functions = {}
+    for unit in units:
+        _append_main(main, unit.code.main)
+        functions.update(unit.code.functions)
+    main.emit(LOAD_CONST, None)
+    main.emit(RETURN)
+    return CompiledProgram(main, functions)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Compile scripts as separate units, recompiling only what changed")
+    arg_parser.add_argument('sources', nargs='+',
+                            help="script files; their top-level code runs in this order")
+    arg_parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, metavar='DIR',
+                            help=f"where compiled units are kept (default: {DEFAULT_CACHE_DIR})")
+    arg_parser.add_argument('--run', action='store_true',
+                            help="link the units, execute them and print the variables")
+    args = arg_parser.parse_args(argv)
+
+    builder = UnitBuilder(args.cache_dir)
+    try:
+        units = builder.build(args.sources)
+    except Exception as e:
+        units, error = None, e
+    for line in builder.log:
+        print(line)
+    if units is None:
+        print(f"Error: {error}")
+        return
+    for unit in units:
+        for diagnostic in unit.diagnostics:
+            print(f"Warning: {os.path.relpath(unit.path)}: {diagnostic}")
+
+    if args.run:
+        try:
+            variables = Interpreter(link(units)).run()
+        except Exception as e:
+            print(f"Error: {e}")
+            return
+        print("Variables:")
+        for name, value in variables.items():
+            if '.' not in name:
+                print(f"{name} = {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""Run FOR loops whose iterations are independent as NumPy array operations.
+
+plan_loop inspects a FOR statement at compile time. A loop qualifies when its
+body only assigns list elements at the loop variable (LET a[i] = ...) and
+scalar temporaries (LET t = ...), and every expression is + - * / over
+numbers, loop-invariant variables, the loop variable, temporaries already
+assigned in the same iteration, and list elements read at i (lists the loop
+writes) or i + c (lists it only reads). No iteration can then see another's
+results, so each statement can run once over all iterations.
+
+At run time LoopKernel.run checks everything the AST cannot show: NumPy is
+installed, the bounds and step are integers, each list is flat and all-int or
+all-float, indexes are in range, lists do not alias, no divisor is zero and no
+integer gets large enough for int64/float64 to differ from Python arithmetic.
+If a check fails it returns False before changing anything and the
+interpreter runs the loop one iteration at a time, so results are identical.
+Typed lists (typed_list.NumericList) are read and written through their
+buffers, without converting elements.
+"""
+from typing import Dict, Optional, Set
+
+from ast_nodes import (
+    Node, LetStatement, BinaryOperation, Number, Identifier,
+    ForStatement, IndexExpression, IndexAssignment
+)
+from typed_list import NumericList
+
+try:
+    import numpy as np
+except ImportError:  # optional: without NumPy every loop runs on the scalar path
+    np = None
+
+MIN_TRIPS = 32  # shorter loops do not pay for converting lists to arrays
+EXACT_LIMIT = 1 << 53  # below this, integers behave the same in Python, int64 and float64
+VECTOR_OPERATORS = {'+', '-', '*', '/'}
+
+
+class _Fallback(Exception):
+    """The loop has to run on the scalar path"""
+
+
+def _offset(index: Node, variable: str) -> Optional[int]:
+    """c when index is the loop variable, i + c or i - c; None otherwise"""
+    if isinstance(index, Identifier):
+        return 0 if index.name == variable else None
+    if not isinstance(index, BinaryOperation) or index.operator not in ('+', '-'):
+        return None
+    left, right = index.left, index.right
+    if isinstance(left, Identifier) and left.name == variable and isinstance(right, Number):
+        constant = right.value
+        if type(constant) is int:
+            return constant if index.operator == '+' else -constant
+    if index.operator == '+' and isinstance(right, Identifier) and right.name == variable \
+            and isinstance(left, Number):
+        constant = left.value
+        if type(constant) is int:
+            return constant
+    return None
+
+
+def _independent(expr: Node, variable: str, written: Set[str], temps: Set[str], assigned: Set[str]) -> bool:
+    """expr reads nothing an earlier iteration could have changed"""
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Number):
+            continue
+        if isinstance(node, Identifier):
+            if node.name in written:
+                return False  # a whole list used as a value
+            if node.name in temps and node.name not in assigned:
+                return False  # read before this iteration assigns it
+        elif isinstance(node, BinaryOperation):
+            if node.operator not in VECTOR_OPERATORS:
+                return False
+            stack.append(node.left)
+            stack.append(node.right)
+        elif isinstance(node, IndexExpression):
+            target = node.target
+            if not isinstance(target, Identifier) or target.name in temps or target.name == variable:
+                return False
+            offset = _offset(node.index, variable)
+            if offset is None or (offset != 0 and target.name in written):
+                return False
+        else:
+            return False
+    return True
+
+
+def plan_loop(loop: ForStatement) -> Optional['LoopKernel']:
+    """A LoopKernel for loop, or None if it must always run scalar"""
+    if not loop.body:
+        return None
+    written: Set[str] = set()
+    temps: Set[str] = set()
+    for stmt in loop.body:
+        if isinstance(stmt, IndexAssignment):
+            if not isinstance(stmt.target, Identifier) or _offset(stmt.index, loop.variable) != 0:
+                return None
+            written.add(stmt.target.name)
+        elif isinstance(stmt, LetStatement):
+            temps.add(stmt.identifier)
+        else:
+            return None
+    if loop.variable in temps or loop.variable in written or temps & written:
+        return None
+    assigned: Set[str] = set()
+    for stmt in loop.body:
+        if not _independent(stmt.expression, loop.variable, written, temps, assigned):
+            return None
+        if isinstance(stmt, LetStatement):
+            assigned.add(stmt.identifier)
+    return LoopKernel(loop, written, temps)
+
+
+class LoopKernel:
+    def __init__(self, loop: ForStatement, written: Set[str], temps: Set[str]):
+        self.variable = loop.variable
+        self.inclusive = loop.inclusive
+        self.statements = loop.body
+        self.written = written
+        self.temps = temps
+
+    def __repr__(self):
+        return f"LoopKernel({self.variable!r})"
+
+    def run(self, variables: dict, global_vars: dict, end, step) -> int:
+        """Execute the whole loop and return its trip count; 0 (with nothing changed) if it must run scalar"""
+        if np is None:
+            return 0
+        try:
+            with np.errstate(all='ignore'):  # float overflow gives inf, as in Python
+                return self._run(variables, global_vars, end, step)
+        except _Fallback:
+            return 0
+
+    def _run(self, variables, global_vars, end, step) -> int:
+        start = variables[self.variable]
+        if type(start) is not int or type(end) is not int or type(step) is not int or step == 0:
+            raise _Fallback
+        stop = end + (1 if step > 0 else -1) if self.inclusive else end
+        trips = len(range(start, stop, step))
+        if trips < MIN_TRIPS:
+            return 0
+        last = start + (trips - 1) * step
+        if max(abs(start), abs(last)) >= EXACT_LIMIT:
+            raise _Fallback
+        run = _Run(self, variables, global_vars, start, last, step, trips)
+        for stmt in self.statements:
+            value = run.evaluate(stmt.expression)
+            if isinstance(stmt, LetStatement):
+                run.temps[stmt.identifier] = value
+            else:
+                run.current[stmt.target.name] = value
+        run.commit()
+        variables[self.variable] = start + trips * step
+        return trips
+
+
+class _Run:
+    """State of one vectorized execution: values are (value, bound) pairs, where
+    value is a Python number or an array over all iterations and bound is the
+    largest magnitude of an integer value (None for floats)"""
+
+    def __init__(self, kernel: LoopKernel, variables, global_vars, start, last, step, trips):
+        self.kernel = kernel
+        self.variables = variables
+        self.global_vars = global_vars
+        self.start, self.last, self.step, self.trips = start, last, step, trips
+        self.low, self.high = min(start, last), max(start, last)
+        self.index = np.arange(start, start + trips * step, step, dtype=np.int64)
+        self.temps: Dict[str, tuple] = {}
+        self.current: Dict[str, tuple] = {}  # written list -> its elements at the loop indexes
+        self.lists: Dict[str, tuple] = {}  # list name -> (list, array, bound)
+        self.owners: Dict[int, str] = {}  # id of a list -> the one name it is used under
+
+    def lookup(self, name: str):
+        if name in self.variables:
+            return self.variables[name]
+        if name in self.global_vars:
+            return self.global_vars[name]
+        raise _Fallback  # undefined: the scalar loop reports it
+
+    def array(self, name: str):
+        entry = self.lists.get(name)
+        if entry is not None:
+            return entry
+        items = self.lookup(name)
+        if not _is_list(items) or not items:
+            raise _Fallback
+        if self.owners.setdefault(id(items), name) != name:
+            raise _Fallback  # two names for one list: iterations could interfere
+        if isinstance(items, NumericList) and items.kind is not None:
+            values = np.asarray(items)  # shares the buffer
+            bound = int(np.abs(values).max()) if items.kind is int else None
+            if bound is not None and bound >= EXACT_LIMIT:
+                raise _Fallback
+            entry = self.lists[name] = (items, values, bound)
+            return entry
+        kinds = set(map(type, items))
+        try:
+            if kinds == {int}:
+                values = np.array(items, dtype=np.int64)
+                bound = int(np.abs(values).max())
+                if bound >= EXACT_LIMIT:
+                    raise _Fallback
+            elif kinds == {float}:
+                values, bound = np.array(items, dtype=np.float64), None
+            else:
+                raise _Fallback
+        except OverflowError:
+            raise _Fallback
+        entry = self.lists[name] = (items, values, bound)
+        return entry
+
+    def element(self, node: IndexExpression) -> tuple:
+        name = node.target.name
+        offset = _offset(node.index, self.kernel.variable)
+        if name in self.current:
+            return self.current[name]
+        items, values, bound = self.array(name)
+        if self.low + offset < 0 or self.high + offset >= len(items):
+            raise _Fallback  # the scalar loop raises the IndexError (or wraps negatives)
+        return values[self.index + offset], bound
+
+    def evaluate(self, expr: Node) -> tuple:
+        if isinstance(expr, Number):
+            return self.scalar(expr.value)
+        if isinstance(expr, Identifier):
+            if expr.name == self.kernel.variable:
+                return self.index, max(abs(self.start), abs(self.last))
+            if expr.name in self.temps:
+                return self.temps[expr.name]
+            return self.scalar(self.lookup(expr.name))
+        if isinstance(expr, IndexExpression):
+            return self.element(expr)
+        left, left_bound = self.evaluate(expr.left)
+        right, right_bound = self.evaluate(expr.right)
+        return self.binary(expr.operator, left, left_bound, right, right_bound)
+
+    @staticmethod
+    def scalar(value) -> tuple:
+        if type(value) is float:
+            return value, None
+        if type(value) is not int or abs(value) >= EXACT_LIMIT:
+            raise _Fallback
+        return value, abs(value)
+
+    def binary(self, operator, left, left_bound, right, right_bound) -> tuple:
+        integers = left_bound is not None and right_bound is not None
+        if operator == '/':
+            if np.any(right == 0):
+                raise _Fallback  # division by zero is an error on the scalar path
+            return left / right, None
+        if operator == '*':
+            bound = left_bound * right_bound if integers else None
+            value = left * right
+        elif operator == '+':
+            bound = left_bound + right_bound if integers else None
+            value = left + right
+        else:
+            bound = left_bound + right_bound if integers else None
+            value = left - right
+        if bound is not None and bound >= EXACT_LIMIT:
+            raise _Fallback
+        return value, bound
+
+    def commit(self):
+        """Write the results back; nothing is changed before this point"""
+        for name in self.current:
+            items = self.lookup(name)
+            if not _is_list(items):
+                raise _Fallback
+            if self.owners.setdefault(id(items), name) != name:
+                raise _Fallback
+            if self.low < 0 or self.high >= len(items):
+                raise _Fallback
+        buffers = [np.asarray(items) for items, _, _ in self.lists.values()
+                   if isinstance(items, NumericList) and items.kind is not None]
+        buffers += [np.asarray(items) for items in map(self.lookup, self.current)
+                    if isinstance(items, NumericList) and items.kind is not None
+                    and all(items is not entry[0] for entry in self.lists.values())]
+        for i, first in enumerate(buffers):
+            if any(np.may_share_memory(first, second) for second in buffers[i + 1:]):
+                raise _Fallback  # views of one buffer under different names
+        for name, (value, _) in self.current.items():
+            items = self.lookup(name)
+            if self._store_buffer(items, value):
+                continue
+            values = value.tolist() if isinstance(value, np.ndarray) else [value] * self.trips
+            if self.step > 0:
+                items[self.start:self.last + 1:self.step] = values
+            else:
+                items[self.last:self.start + 1:-self.step] = values[::-1]
+        for name, (value, _) in self.temps.items():
+            self.variables[name] = value[-1].item() if isinstance(value, np.ndarray) else value
+
+    def _store_buffer(self, items, value) -> bool:
+        """Write straight into a NumericList's buffer when the element type is unchanged"""
+        if not isinstance(items, NumericList) or items.kind is None:
+            return False
+        if isinstance(value, np.ndarray):
+            if value.dtype != (np.int64 if items.kind is int else np.float64):
+                return False
+        elif type(value) is not items.kind:
+            return False
+        target = np.asarray(items)
+        if self.step > 0:
+            target[self.start:self.last + 1:self.step] = value
+        else:
+            target[self.last:self.start + 1:-self.step] = value[::-1] if isinstance(value, np.ndarray) else value
+        return True
+
+
+def _is_list(items) -> bool:
+    return type(items) is list or isinstance(items, NumericList)
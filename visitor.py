@@ -0,0 +1,224 @@
+"""Iterative AST traversal shared by every analysis and rewrite.
+
+A Pass handles the node classes it cares about with enter_<Class>(node, ctx)
+and leave_<Class>(node, ctx) methods. PassManager groups passes by their
+dependencies and runs every group in one walk over the tree, so N
+independent analyses cost one traversal instead of N. The walk uses an
+explicit stack, so deeply nested programs cannot hit the recursion limit.
+"""
+from dataclasses import fields, is_dataclass, replace
+from typing import Dict, Iterable, List, Optional
+
+from ast_nodes import Node
+
+_child_fields: Dict[type, List[str]] = {}
+
+
+def child_fields(cls) -> List[str]:
+    """Names of the fields of cls that can hold nodes or lists of nodes"""
+    names = _child_fields.get(cls)
+    if names is None:
+        names = []
+        if is_dataclass(cls):
+            for f in fields(cls):
+                if f.type not in (str, int, 'str', 'int'):
+                    names.append(f.name)
+        _child_fields[cls] = names
+    return names
+
+
+def children(node: Node) -> List[Node]:
+    """Direct child nodes of node, in source order"""
+    result = []
+    for name in child_fields(type(node)):
+        value = getattr(node, name)
+        if isinstance(value, Node):
+            result.append(value)
+        elif isinstance(value, list):
+            result.extend(item for item in value if isinstance(item, Node))
+    return result
+
+
+class WalkContext:
+    """State of a walk, passed to every handler"""
+
+    def __init__(self):
+        self.parents: List[Node] = []  # ancestors of the current node, outermost first
+        self.lines: List[int] = []
+
+    @property
+    def parent(self) -> Optional[Node]:
+        return self.parents[-2] if len(self.parents) > 1 else None
+
+    @property
+    def line(self) -> int:
+        """Line of the innermost enclosing statement"""
+        return self.lines[-1] if self.lines else 0
+
+
+class Pass:
+    """Base class for an analysis run by PassManager.
+
+    name identifies the pass; requires lists the names of passes whose
+    result() must be complete before this pass starts walking. The results
+    of those passes are available in self.results.
+    """
+
+    name = None
+    requires = ()
+
+    def __init__(self):
+        self.results = {}
+
+    def begin(self, root: Node):
+        pass
+
+    def result(self):
+        return None
+
+
+def _handlers(passes: List[Pass], cls, prefix: str):
+    return [getattr(p, prefix + cls.__name__) for p in passes if hasattr(p, prefix + cls.__name__)]
+
+
+def walk(root: Node, passes: List[Pass]) -> WalkContext:
+    """Run every pass over root in a single depth-first traversal"""
+    dispatch = {}
+    ctx = WalkContext()
+    for p in passes:
+        p.begin(root)
+
+    stack = [(root, False)]
+    while stack:
+        node, leaving = stack.pop()
+        cls = type(node)
+        handlers = dispatch.get(cls)
+        if handlers is None:
+            handlers = dispatch[cls] = (_handlers(passes, cls, 'enter_'), _handlers(passes, cls, 'leave_'))
+        if leaving:
+            for handler in handlers[1]:
+                handler(node, ctx)
+            ctx.parents.pop()
+            if hasattr(node, 'line'):
+                ctx.lines.pop()
+            continue
+
+        ctx.parents.append(node)
+        if hasattr(node, 'line'):
+            ctx.lines.append(node.line)
+        for handler in handlers[0]:
+            handler(node, ctx)
+        stack.append((node, True))
+        stack.extend((child, False) for child in reversed(children(node)))
+    return ctx
+
+
+class PassManager:
+    """Schedule passes into as few walks as their dependencies allow"""
+
+    def __init__(self, passes: Iterable[Pass]):
+        self.passes = list(passes)
+        self.stages = self._schedule()
+
+    def _schedule(self) -> List[List[Pass]]:
+        by_name = {p.name: p for p in self.passes}
+        levels = {}
+
+        def level(p, visiting=()):
+            if p.name in levels:
+                return levels[p.name]
+            if p.name in visiting:
+                raise Exception(f"Pass dependency cycle through '{p.name}'")
+            depth = 0
+            for name in p.requires:
+                if name not in by_name:
+                    raise Exception(f"Pass '{p.name}' requires unknown pass '{name}'")
+                depth = max(depth, level(by_name[name], visiting + (p.name,)) + 1)
+            levels[p.name] = depth
+            return depth
+
+        stages = []
+        for p in self.passes:
+            depth = level(p)
+            while len(stages) <= depth:
+                stages.append([])
+            stages[depth].append(p)
+        return stages
+
+    @property
+    def walks(self) -> int:
+        return len(self.stages)
+
+    def run(self, root: Node) -> dict:
+        """Run all passes and return {pass name: result}"""
+        results = {}
+        for stage in self.stages:
+            for p in stage:
+                p.results = results
+            walk(root, stage)
+            for p in stage:
+                results[p.name] = p.result()
+        return results
+
+
+def run_passes(root: Node, *passes: Pass) -> dict:
+    return PassManager(passes).run(root)
+
+
+class Transformer:
+    """Bottom-up rewrite: transform_<Class>(node) returns a replacement node,
+    the same node, or None to drop a statement from its block."""
+
+    def transform(self, root: Node) -> Optional[Node]:
+        return transform(root, self)
+
+
+def transform(root: Node, *transformers: Transformer) -> Optional[Node]:
+    """Apply transformers to every node in one post-order walk.
+
+    At each node the transformers run in order, after all of its children
+    have been rewritten. Parents are rebuilt with dataclasses.replace only
+    when a child changed, so unchanged subtrees (and shared subexpressions)
+    are kept as they are.
+    """
+    done = {}  # id(node) -> rewritten node
+    stack = [(root, False)]
+    keep = []  # original nodes stay referenced so their ids are not reused
+    while stack:
+        node, expanded = stack.pop()
+        if id(node) in done:
+            continue
+        if not expanded:
+            stack.append((node, True))
+            for child in reversed(children(node)):
+                if id(child) not in done:
+                    stack.append((child, False))
+            continue
+
+        changes = {}
+        for name in child_fields(type(node)):
+            value = getattr(node, name)
+            if isinstance(value, Node):
+                new = done[id(value)]
+                if new is not value:
+                    changes[name] = new
+            elif isinstance(value, list):
+                new_list = []
+                changed = False
+                for item in value:
+                    new = done[id(item)] if isinstance(item, Node) else item
+                    changed = changed or new is not item
+                    if new is not None:
+                        new_list.append(new)
+                if changed:
+                    changes[name] = new_list
+        result = replace(node, **changes) if changes else node
+        for transformer in transformers:
+            if result is None:
+                break
+            method = getattr(transformer, 'transform_' + type(result).__name__, None)
+            if method is not None:
+                result = method(result)
+        keep.append(node)
+        done[id(node)] = result
+    return done[id(root)]
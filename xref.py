@@ -0,0 +1,279 @@
+"""Cross-reference index: where every symbol is defined and used, and who calls whom.
+
+The index is built from the token stream, whose positions are exact, in two
+linear passes per file: the first finds FUNC scopes and the names each FUNC
+defines (parameters and LET targets), the second resolves every identifier
+to its scope. Entries are kept per file, so recompiling one file replaces
+only that file's entries; lookups are dictionary hits. Saved with save(),
+an index remembers each file's digest, so a file that has not changed
+since is not indexed again.
+"""
+import hashlib
+import json
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import Compiler_Project_phase1 as lexer
+from bytecode import MAIN
+
+DEFAULT_INDEX_FILE = '.xrefindex.json'
+
+_OPENERS = {'if', 'while', 'for', 'repeat'}
+_CLOSERS = {'endif', 'endwhile', 'endfor', 'until'}
+
+
+@dataclass(frozen=True)
+class Site:
+    path: str
+    offset: int
+    line: int
+    column: int
+    scope: Optional[str]  # enclosing FUNC, None at the top level
+
+    def __str__(self):
+        where = self.scope or 'top level'
+        return f"{self.path}:{self.line}:{self.column} ({where})"
+
+
+@dataclass
+class FileIndex:
+    """Everything one file contributes to the index"""
+    digest: str
+    definitions: Dict[Tuple[Optional[str], str], List[Site]]  # (scope, variable) -> sites
+    uses: Dict[Tuple[Optional[str], str], List[Site]]
+    functions: Dict[str, List[Site]]  # FUNC name -> definition sites
+    calls: Dict[str, List[Site]]  # callee -> CALL sites
+    edges: Dict[Tuple[str, str], int]  # (caller, callee) -> number of CALLs
+
+
+def source_digest(source: str) -> str:
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+def index_tokens(path: str, tokens: List[tuple], positions: List[tuple], digest: str = '') -> FileIndex:
+    n = len(tokens)
+    roles = [None] * n  # 'function', 'param', 'let', 'call' or 'use' for identifier tokens
+    scopes = [None] * n
+    locals_of: Dict[str, Set[str]] = {}
+
+    # Pass 1: scopes and the names each FUNC defines
+    functions = []  # stack of [name, block depth]
+    i = 0
+    while i < n:
+        kind = tokens[i][0]
+        scope = functions[-1][0] if functions else None
+        if kind == 'func' and i + 1 < n and tokens[i + 1][0] == 'identifier':
+            name = tokens[i + 1][1]
+            roles[i + 1] = 'function'
+            scopes[i + 1] = scope
+            locals_of.setdefault(name, set())
+            j = i + 2
+            if j < n and tokens[j][0] == 'left_paren':
+                j += 1
+                while j < n and tokens[j][0] != 'right_paren':
+                    if tokens[j][0] == 'identifier':
+                        roles[j] = 'param'
+                        scopes[j] = name
+                        locals_of[name].add(tokens[j][1])
+                    j += 1
+            functions.append([name, 0])
+            i = j + 1
+            continue
+        if kind in _OPENERS and functions:
+            functions[-1][1] += 1
+        elif kind in _CLOSERS and functions:
+            functions[-1][1] -= 1
+        elif kind == 'end' and functions and functions[-1][1] == 0:
+            functions.pop()
+        elif kind == 'identifier' and roles[i] is None:
+            previous = tokens[i - 1][0] if i > 0 else None
+            following = tokens[i + 1][0] if i + 1 < n else None
+            if previous == 'let' or previous == 'for' or following == 'compound_operator':
+                roles[i] = 'let'
+                if scope is not None:
+                    locals_of[scope].add(tokens[i][1])
+            elif previous == 'call':
+                roles[i] = 'call'
+            else:
+                roles[i] = 'use'
+            scopes[i] = scope
+        i += 1
+
+    # Pass 2: resolve each site to its symbol
+    index = FileIndex(digest, {}, {}, {}, {}, {})
+    for i in range(n):
+        role = roles[i]
+        if role is None:
+            continue
+        name = tokens[i][1]
+        scope = scopes[i]
+        offset, line, column = positions[i]
+        site = Site(path, offset, line, column, scope)
+        if role == 'function':
+            index.functions.setdefault(name, []).append(site)
+        elif role == 'call':
+            index.calls.setdefault(name, []).append(site)
+            edge = (scope or MAIN, name)
+            index.edges[edge] = index.edges.get(edge, 0) + 1
+        else:
+            owner = scope if scope is not None and name in locals_of.get(scope, ()) else None
+            target = index.uses if role == 'use' else index.definitions
+            target.setdefault((owner, name), []).append(site)
+    return index
+
+
+class CrossReferenceIndex:
+    def __init__(self):
+        self.files: Dict[str, FileIndex] = {}
+        self._definitions: Dict[Tuple[Optional[str], str], Dict[str, List[Site]]] = {}
+        self._uses: Dict[Tuple[Optional[str], str], Dict[str, List[Site]]] = {}
+        self._functions: Dict[str, Dict[str, List[Site]]] = {}
+        self._calls: Dict[str, Dict[str, List[Site]]] = {}
+        self._callees: Dict[str, Dict[str, Dict[str, int]]] = {}  # caller -> callee -> path -> count
+        self._callers: Dict[str, Dict[str, Dict[str, int]]] = {}  # callee -> caller -> path -> count
+        self._scopes: Dict[str, Set[Optional[str]]] = {}  # variable -> scopes it is known in
+
+    # Updates
+    def update_source(self, path: str, source: str) -> bool:
+        """Lex source and re-index path; returns False if it is unchanged"""
+        digest = source_digest(source)
+        if path in self.files and self.files[path].digest == digest:
+            return False
+        lex = lexer.Lexer(source)
+        tokens = lex.tokenize()
+        self.add(index_tokens(path, tokens, lex.token_positions, digest), path)
+        return True
+
+    def update(self, path: str, tokens: List[tuple], positions: List[tuple], digest: str = '') -> bool:
+        """Re-index path from an already lexed token stream; given the source_digest of its
+        source, returns False without re-indexing if it is unchanged"""
+        if digest and path in self.files and self.files[path].digest == digest:
+            return False
+        self.add(index_tokens(path, tokens, positions, digest), path)
+        return True
+
+    def add(self, file_index: FileIndex, path: str):
+        self.remove(path)
+        self.files[path] = file_index
+        for key, sites in file_index.definitions.items():
+            self._definitions.setdefault(key, {})[path] = sites
+            self._scopes.setdefault(key[1], set()).add(key[0])
+        for key, sites in file_index.uses.items():
+            self._uses.setdefault(key, {})[path] = sites
+            self._scopes.setdefault(key[1], set()).add(key[0])
+        for name, sites in file_index.functions.items():
+            self._functions.setdefault(name, {})[path] = sites
+        for name, sites in file_index.calls.items():
+            self._calls.setdefault(name, {})[path] = sites
+        for (caller, callee), count in file_index.edges.items():
+            self._callees.setdefault(caller, {}).setdefault(callee, {})[path] = count
+            self._callers.setdefault(callee, {}).setdefault(caller, {})[path] = count
+
+    def remove(self, path: str):
+        old = self.files.pop(path, None)
+        if old is None:
+            return
+        for table, keys in ((self._definitions, old.definitions), (self._uses, old.uses),
+                            (self._functions, old.functions), (self._calls, old.calls)):
+            for key in keys:
+                _discard(table, key, path)
+        for key in list(old.definitions) + list(old.uses):
+            if key not in self._definitions and key not in self._uses:
+                scopes = self._scopes.get(key[1])
+                if scopes is not None:
+                    scopes.discard(key[0])
+                    if not scopes:
+                        del self._scopes[key[1]]
+        for caller, callee in old.edges:
+            _discard(self._callees.get(caller, {}), callee, path)
+            if not self._callees.get(caller):
+                self._callees.pop(caller, None)
+            _discard(self._callers.get(callee, {}), caller, path)
+            if not self._callers.get(callee):
+                self._callers.pop(callee, None)
+
+    # Queries
+    def definitions(self, name: str, scope: Optional[str] = None) -> List[Site]:
+        """Sites assigning variable name in scope (a FUNC name, or None for globals)"""
+        return _flatten(self._definitions.get((scope, name)))
+
+    def uses(self, name: str, scope: Optional[str] = None) -> List[Site]:
+        return _flatten(self._uses.get((scope, name)))
+
+    def scopes(self, name: str) -> Set[Optional[str]]:
+        """Scopes in which a variable called name exists"""
+        return set(self._scopes.get(name, ()))
+
+    def function_definitions(self, name: str) -> List[Site]:
+        return _flatten(self._functions.get(name))
+
+    def call_sites(self, name: str) -> List[Site]:
+        return _flatten(self._calls.get(name))
+
+    def callers(self, name: str) -> Set[str]:
+        """Functions (or '<main>') containing a CALL to name"""
+        return set(self._callers.get(name, ()))
+
+    def callees(self, name: str) -> Set[str]:
+        """Functions called from name ('<main>' for the top level)"""
+        return set(self._callees.get(name, ()))
+
+    def call_graph(self) -> Dict[str, Set[str]]:
+        return {caller: set(callees) for caller, callees in self._callees.items()}
+
+    # Persistence
+    def save(self, path: str):
+        data = {}
+        for file_path, f in self.files.items():
+            data[file_path] = {
+                'digest': f.digest,
+                'definitions': _dump_sites(f.definitions),
+                'uses': _dump_sites(f.uses),
+                'functions': _dump_sites(f.functions),
+                'calls': _dump_sites(f.calls),
+                'edges': [[caller, callee, count] for (caller, callee), count in f.edges.items()],
+            }
+        with open(path, 'w') as out:
+            json.dump(data, out)
+
+    @classmethod
+    def load(cls, path: str) -> 'CrossReferenceIndex':
+        index = cls()
+        with open(path) as f:
+            data = json.load(f)
+        for file_path, entry in data.items():
+            index.add(FileIndex(
+                entry['digest'],
+                _load_sites(entry['definitions'], tuple),
+                _load_sites(entry['uses'], tuple),
+                _load_sites(entry['functions'], str),
+                _load_sites(entry['calls'], str),
+                {(caller, callee): count for caller, callee, count in entry['edges']},
+            ), file_path)
+        return index
+
+
+def _discard(table: dict, key, path: str):
+    entries = table.get(key)
+    if entries is not None:
+        entries.pop(path, None)
+        if not entries:
+            del table[key]
+
+
+def _flatten(by_path: Optional[Dict[str, List[Site]]]) -> List[Site]:
+    if not by_path:
+        return []
+    result = []
+    for sites in by_path.values():
+        result.extend(sites)
+    return result
+
+
+def _dump_sites(table: dict) -> list:
+    return [[list(key) if isinstance(key, tuple) else key, [asdict(site) for site in sites]]
+            for key, sites in table.items()]
+
+
+def _load_sites(rows: Iterable, key_type) -> dict:
+    return {(tuple(key) if key_type is tuple else key): [Site(**site) for site in sites] for key, sites in rows}